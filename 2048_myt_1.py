@@ -1,13 +1,48 @@
-import random
-import pygame
+import argparse
+import os
 import sys
-import copy
 import time
-import json
-import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Launch time for the startup report, taken before pygame's slow import.
+_LAUNCH_TIME = time.perf_counter()
+
+import pygame
+
+import assets
+from tile_cache import TileCache
+from fonts import get_font, render_static, CachedText, GlyphStrip
+from game_core import (
+    BLOCKER, GRID_SIZE, MIN_GRID_SIZE, MAX_GRID_SIZE, MILESTONE_ORDER, NUM_TO_TEXT, TILE_LABELS, UP, DOWN, LEFT, RIGHT,
+    remove_random_tile, shuffle_board, swap_tiles, copy_board, count_tiles, update_tile_counts,
+    init_new_game, load_game, LegalMoveCache,
+)
+from variants import DEFAULT_VARIANT, VARIANTS, get_rules
+from journal import GameJournal
+from saver import BackgroundSaver
+from savestore import open_store
+from overlays import OverlayStack, Toast, ConfirmDialog, Fade, ProfilerHud
+from profiler import FrameProfiler
+from audio import MergeAudio
+from animations import TileAnimations, SPAWN_DURATION, MERGE_DURATION, SLIDE_DURATION
+import replay
 
 pygame.init()
 
+# --- Startup pipeline ---
+#
+# The save is parsed and the top image decoded (or read from the asset
+# cache) on worker threads while the main thread sets up fonts, tiles and the
+# window. The first frame is drawn as soon as the save is in, with the image
+# area blank until the image arrives; main() then reports when each step
+# finished. The save is only preloaded when the game is launched directly
+# (not imported, e.g. by benchmark.py, which picks its own save directory).
+startup = assets.StartupTimer(_LAUNCH_TIME)
+startup.mark("pygame")
+_startup_loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup")
+_preloaded_save = _startup_loader.submit(load_game) if __name__ == "__main__" else None
+ASSET_CACHE_DIR = os.path.abspath(assets.CACHE_DIR)
+
 # -------------------------
 # Define a scaling factor
 # -------------------------
@@ -15,8 +50,9 @@ SCALE = 0.7
 
 # --- Global Constants and Layout Settings ---
 
-# Load the merge sound effect.
-merge_sound = pygame.mixer.Sound("xbbb.wav")
+# The merge sound decodes on a background thread; the main loop posts each
+# move's merges to it and flushes them as one sound per frame.
+merge_audio = MergeAudio("xbbb.wav")
 
 # Scaled constants
 GRID_GAP = max(1, int(5 * SCALE))
@@ -31,46 +67,41 @@ ORIGINAL_IMAGE_WIDTH = 584
 ORIGINAL_IMAGE_HEIGHT = 500
 IMAGE_WIDTH = int(ORIGINAL_IMAGE_WIDTH * SCALE)
 IMAGE_HEIGHT = int(ORIGINAL_IMAGE_HEIGHT * SCALE)
+_top_image_load = _startup_loader.submit(assets.load_scaled_image, os.path.abspath(IMAGE_PATH),
+                                         (IMAGE_WIDTH, IMAGE_HEIGHT), ASSET_CACHE_DIR)
+# Set once the background load is picked up by poll_top_image().
+top_image = None
 
 # Info area (for score, time, moves, etc.) will be just below the image.
 INFO_HEIGHT = int(100 * SCALE)
 
-# The game board (4x4 grid) will be drawn below the info area.
-GRID_SIZE = 4
+# The game board will be drawn below the info area.
 # Set the window width equal to the scaled image width.
 WIDTH = IMAGE_WIDTH
-# Compute cell size from WIDTH and GRID_SIZE.
-CELL_SIZE = WIDTH // GRID_SIZE
-BOARD_HEIGHT = CELL_SIZE * GRID_SIZE
+# The board area is WIDTH x WIDTH whatever the board size, so the window
+# never changes; cells shrink as the board grows. BOARD_SIZE, CELL_SIZE,
+# BOARD_HEIGHT and RULES (the game's variants.Rules) describe the current game
+# and are reset by set_board_size().
+BOARD_PIXELS = WIDTH
+BOARD_SIZE = GRID_SIZE
+RULES = get_rules(DEFAULT_VARIANT)
+CELL_SIZE = BOARD_PIXELS // BOARD_SIZE
+BOARD_HEIGHT = CELL_SIZE * BOARD_SIZE
 # The top of the board is below the image and info area.
 BOARD_TOP = IMAGE_HEIGHT + INFO_HEIGHT
 # Total window height is the sum of image, info, and board areas.
-HEIGHT = BOARD_TOP + BOARD_HEIGHT
-
-MAX_HISTORY_SIZE = 20
-SAVE_FILE = "savegame.json"
+HEIGHT = BOARD_TOP + BOARD_PIXELS
 
 FONT_SIZE = int(24 * SCALE)
-FONT = pygame.font.SysFont("Microsoft YaHei", FONT_SIZE)
+FONT = get_font(FONT_SIZE)
 
 BACKGROUND_COLOR = (187, 173, 160)
 CELL_COLOR = (204, 192, 179)
 TEXT_COLOR = (119, 110, 101)
-OVERLAY_COLOR = (50, 50, 50, 200)
-
-MILESTONE_ORDER = ["小", "鳄", "鱼", "就", "是", "喜", "欢", "麦", "芽", "糖", "呀"]
 
 MILESTONE_UNLOCKED_COLOR = (0, 0, 0)
 MILESTONE_LOCKED_COLOR = (160, 160, 160)
 
-NUM_TO_TEXT = {
-    2: "小", 4: "鳄", 8: "鱼", 16: "就", 32: "是",
-    64: "喜", 128: "欢", 256: "麦", 512: "芽",
-    1024: "糖", 2048: "呀",
-    4096: "而", 8192: "且", 16384: "会",
-    32768: "爱", 65536: "很", 131072: "久"
-}
-
 CELL_COLORS = {
     "小": (238, 228, 218),
     "鳄": (237, 224, 200),
@@ -91,6 +122,28 @@ CELL_COLORS = {
     "久": (180, 160, 80)
 }
 
+# Tiles past 久 carry numeric labels (256K, 1M, ...); their colours blend
+# from 久's gold towards violet, one step per doubling.
+_BEYOND_LABELS = [TILE_LABELS[value] for value in sorted(TILE_LABELS) if value > max(NUM_TO_TEXT)]
+for _i, _label in enumerate(_BEYOND_LABELS):
+    _t = (_i + 1) / len(_BEYOND_LABELS)
+    CELL_COLORS[_label] = (int(180 - 60 * _t), int(160 - 70 * _t), int(80 + 80 * _t))
+
+TILE_DEFAULT_COLOR = (126, 170, 196)
+TILE_RADIUS = CORNER_RADIUS + int(8 * SCALE)
+
+# Tile sprites are rendered once and reused, in one cache per board size
+# (the glyph font shrinks with the cells); the two sizes drawn every frame
+# (static tiles and sliding tiles) are pre-rendered for every label.
+_tile_caches = {}
+tile_cache = None
+
+# Info panel text: fonts and glyphs are rendered once, values only when they change.
+SCORE_TEXT = CachedText(FONT, TEXT_COLOR)
+TIME_TEXT = CachedText(FONT, TEXT_COLOR)
+MOVES_TEXT = CachedText(FONT, TEXT_COLOR)
+MILESTONE_STRIP = GlyphStrip(FONT, MILESTONE_ORDER, MILESTONE_UNLOCKED_COLOR, MILESTONE_LOCKED_COLOR, int(2 * SCALE))
+
 # Restart button constants (info area).
 RESTART_BUTTON_WIDTH = int(80 * SCALE)
 RESTART_BUTTON_HEIGHT = int(30 * SCALE)
@@ -100,148 +153,144 @@ RESTART_BTN_COLOR_NORMAL = (161, 209, 222)
 RESTART_BTN_COLOR_HOVER = (181, 229, 242)
 RESTART_BTN_COLOR_CLICK = (141, 189, 202)
 
+# Screen regions redrawn independently by the main loop. The board region
+# includes the border drawn just above and below the grid.
+IMAGE_RECT = pygame.Rect(0, 0, WIDTH, IMAGE_HEIGHT)
+BOARD_RECT = pygame.Rect(0, BOARD_TOP - int(3 * SCALE), WIDTH, HEIGHT - BOARD_TOP + int(3 * SCALE))
+INFO_RECT = pygame.Rect(0, IMAGE_HEIGHT, WIDTH, BOARD_RECT.top - IMAGE_HEIGHT)
+BOARD_BORDER_RECT = pygame.Rect(0, BOARD_TOP - int(3 * SCALE), WIDTH, BOARD_HEIGHT + int(6 * SCALE))
+
+
+def variant_colors(rules):
+    """
+    Returns: the tile palette for a variant's labels. Labels the palette does
+    not know take the colour of the classic tile with the same rank.
+    """
+    colors = dict(CELL_COLORS)
+    for code, label in rules.labels.items():
+        if label not in colors:
+            colors[label] = CELL_COLORS.get(TILE_LABELS.get(code), TILE_DEFAULT_COLOR)
+    colors.update(rules.colors)
+    return colors
+
+def set_board_size(size, rules=None):
+    """Switch the board layout and tile sprites to a size x size game, under new rules if given."""
+    global BOARD_SIZE, CELL_SIZE, BOARD_HEIGHT, BOARD_BORDER_RECT, RULES, tile_cache
+    BOARD_SIZE = size
+    if rules is not None:
+        RULES = rules
+    CELL_SIZE = BOARD_PIXELS // size
+    BOARD_HEIGHT = CELL_SIZE * size
+    BOARD_BORDER_RECT = pygame.Rect(0, BOARD_TOP - int(3 * SCALE), WIDTH, BOARD_HEIGHT + int(6 * SCALE))
+    tile_cache = _tile_caches.get((size, RULES.name))
+    if tile_cache is None:
+        font = get_font(min(FONT_SIZE, CELL_SIZE // 3))
+        tile_cache = TileCache(font, RULES.labels, variant_colors(RULES), TEXT_COLOR, TILE_DEFAULT_COLOR,
+                               min(TILE_RADIUS, CELL_SIZE // 4))
+        tile_cache.prerender((CELL_SIZE, CELL_SIZE - GRID_GAP))
+        _tile_caches[(size, RULES.name)] = tile_cache
+
+
+set_board_size(GRID_SIZE)
+startup.mark("tiles")
+
+ACTIVE_FPS = 60
+# When nothing animates, the loop sleeps until an event arrives or this many
+# milliseconds pass (enough to keep the play timer ticking).
+IDLE_WAIT_MS = 250
+# Idle wait while the top image is still loading in the background.
+STARTUP_POLL_MS = 5
+
+# AI hint / autoplay settings.
+HINT_KEY = pygame.K_h
+AUTOPLAY_KEY = pygame.K_a
+AUTOPLAY_INTERVAL = 0.1
+# The expectimax solver works on packed 4x4 bitboards only; 3x3 hints come
+# from the endgame tablebase (python tablebase.py builds it).
+AI_GRID_SIZE = 4
+TABLEBASE_GRID_SIZE = 3
+DIRECTION_KEYS = {UP: pygame.K_UP, DOWN: pygame.K_DOWN, LEFT: pygame.K_LEFT, RIGHT: pygame.K_RIGHT}
+KEY_DIRECTIONS = {key: direction for direction, key in DIRECTION_KEYS.items()}
+DIRECTION_ARROWS = {UP: "↑", DOWN: "↓", LEFT: "←", RIGHT: "→"}
+
+# F3 toggles the frame-time HUD; profiling runs while it is shown or when
+# main() was given a profile export path (--profile), and costs one no-op
+# call per phase hook otherwise.
+HUD_KEY = pygame.K_F3
+HUD_POSITION = (int(8 * SCALE), int(8 * SCALE))
+profiler = FrameProfiler()
+
 # Set up the display.
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("2048")
-
-# Load the top image and scale it.
-top_image = pygame.image.load(IMAGE_PATH).convert()
-top_image = pygame.transform.scale(top_image, (IMAGE_WIDTH, IMAGE_HEIGHT))
+startup.mark("window")
 
 # --- Helper Functions ---
 
-def confirm_action(prompt_text="呜呜宝宝，真的吗? (yes/no)"):
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill(OVERLAY_COLOR)
-    screen.blit(overlay, (0, 0))
-
-    dialog_font = pygame.font.SysFont("Microsoft YaHei", int(32 * SCALE))
-    text = dialog_font.render(prompt_text, True, (255, 182, 193))
-
-    text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2 - int(20 * SCALE)))
-    screen.blit(text, text_rect)
-
-    input_font = pygame.font.SysFont("Microsoft YaHei", int(28 * SCALE))
-    input_prompt = input_font.render("输入答案：", True, (255, 255, 255))
-    prompt_rect = input_prompt.get_rect(center=(WIDTH // 2, HEIGHT // 2 + int(20 * SCALE)))
-    screen.blit(input_prompt, prompt_rect)
-
-    pygame.display.update()
-
-    input_buffer = ""
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    return input_buffer.lower() == "yes"
-                elif event.key == pygame.K_BACKSPACE:
-                    input_buffer = input_buffer[:-1]
-                else:
-                    if len(input_buffer) < 10:
-                        input_buffer += event.unicode
-
-        screen.blit(overlay, (0, 0))
-        screen.blit(text, text_rect)
-        screen.blit(input_prompt, prompt_rect)
-
-        input_text = input_font.render(input_buffer, True, (255, 255, 255))
-        input_rect = input_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + int(60 * SCALE)))
-        screen.blit(input_text, input_rect)
-
-        pygame.draw.line(screen, (255, 255, 255), 
-                        (input_rect.left, input_rect.bottom + 2),
-                        (input_rect.right, input_rect.bottom + 2), 2)
-
-        pygame.display.update()
+CHEAT_CODE = "mytlikelbyforever"
 
-def show_temp_message(message, duration=1.5):
-    start_time = time.time()
-
-    lines = message.split('\n')
+def show_message(overlays, message, duration=1.5):
+    overlays.push(Toast(message, duration, screen.get_rect(), SCALE))
 
-    dialog_font = pygame.font.SysFont("Microsoft YaHei", int(24 * SCALE))
-    line_height = dialog_font.get_linesize()
-
-    while True:
-        elapsed = time.time() - start_time
-        if elapsed > duration:
-            break
+def ask_confirm(overlays, action, prompt_text="呜呜宝宝，真的吗? (yes/no)"):
+    # The answer comes back through overlays.pop_results() as (action, result).
+    overlays.push(ConfirmDialog(prompt_text, action, screen.get_rect(), SCALE))
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill(OVERLAY_COLOR)
-        screen.blit(overlay, (0, 0))
-
-        total_text_height = len(lines) * line_height
-        start_y = (HEIGHT - total_text_height) // 2
-
-        for i, line in enumerate(lines):
-            text_surface = dialog_font.render(line, True, (255, 255, 255))
-            text_rect = text_surface.get_rect(
-                center=(WIDTH // 2, start_y + i * line_height + line_height // 2)
-            )
-            screen.blit(text_surface, text_rect)
-
-        pygame.display.update()
-        pygame.time.delay(50)
-
-def shuffle_board(board):
-    tiles = [val for row in board for val in row if val != 0]
-
-    if len(tiles) < 2:
-        return copy_board(board)
-    
-    # Fix: If all nonzero tiles are identical, simply return a copy of the board
-    if len(set(tiles)) == 1:
-        return copy_board(board)
-    
-    while True:
-        random.shuffle(tiles)
-        new_board = []
-        idx = 0
-        for r in range(GRID_SIZE):
-            new_row = []
-            for c in range(GRID_SIZE):
-                if board[r][c] == 0:
-                    new_row.append(0)
-                else:
-                    new_row.append(tiles[idx])
-                    idx += 1
-            new_board.append(new_row)
-        if any(new_board[r][c] != board[r][c] 
-              for r in range(GRID_SIZE) 
-              for c in range(GRID_SIZE)):
-            return new_board
-
-def handle_special_input(input_buffer, board):
-    if input_buffer.endswith("mytlikelbyforever"):
-        if confirm_action():
-            remove_random_tile(board)
-            remove_random_tile(board)
-            show_temp_message("宝宝偷偷移除了 2 个格子^ ^\n小鳄鱼要伤心啦T＿T", 1.5)
+def handle_special_input(input_buffer, overlays):
+    if input_buffer.endswith(CHEAT_CODE):
+        ask_confirm(overlays, "cheat")
         return ""
     return input_buffer
 
+def remove_two_tiles(board, rng):
+    """Returns: False, removing nothing, if fewer than two tiles would be left."""
+    if sum(1 for row in board for val in row if val and val != BLOCKER) < 4:
+        return False
+    stream = rng.stream()
+    remove_random_tile(board, stream)
+    remove_random_tile(board, stream)
+    return True
+
+def poll_top_image():
+    """
+    Pick up the background-loaded top image once it is ready.
+    Returns: True when it just arrived and the screen needs a full redraw.
+    """
+    global top_image
+    if top_image is not None or not _top_image_load.done():
+        return False
+    try:
+        image, cached = _top_image_load.result()
+        top_image = image.convert()
+        startup.mark("image", "cached" if cached else "decoded")
+    except Exception as e:
+        print("Error loading image:", e)
+        top_image = pygame.Surface((IMAGE_WIDTH, IMAGE_HEIGHT))
+        top_image.fill(BACKGROUND_COLOR)
+    return True
+
 def draw_top_image():
-    # Draw the top image at (0,0)
-    screen.blit(top_image, (0, 0))
+    # Draw the top image at (0,0); the area stays blank until it has loaded.
+    if top_image is None:
+        screen.fill(BACKGROUND_COLOR, IMAGE_RECT)
+    else:
+        screen.blit(top_image, (0, 0))
 
-def draw_board(board, score, playtime, moves, new_tiles, merge_animations, movement_animations, current_time, swap_selection=None):
+def draw_board(board, score, playtime, moves, animations, current_time, swap_selection=None, unlocked_chars=None):
+    draw_grid(board, animations, current_time, swap_selection)
+    draw_info(score, playtime, moves, board, unlocked_chars)
+
+def draw_grid(board, animations, current_time, swap_selection=None):
     if swap_selection is None:
         swap_selection = []
-    # Determine destination cells that are currently animated (movement in progress)
-    animated_destinations = {tuple(anim['to']) for anim in movement_animations if current_time - anim['start_time'] < anim['duration']}
-    
+    spawn_start = animations.spawn_start
+    merge_start = animations.merge_start
+    slide_into = animations.slide_into
+
     # Draw grid cells and static tiles (skip those that are animating)
-    for row in range(GRID_SIZE):
-        for col in range(GRID_SIZE):
+    for row in range(BOARD_SIZE):
+        for col in range(BOARD_SIZE):
+            cell = row * BOARD_SIZE + col
             x = col * CELL_SIZE
             y = BOARD_TOP + row * CELL_SIZE  # board starts at BOARD_TOP (IMAGE_HEIGHT + INFO_HEIGHT)
             cell_rect = pygame.Rect(x + GRID_GAP//2, y + GRID_GAP//2, CELL_SIZE - GRID_GAP, CELL_SIZE - GRID_GAP)
@@ -252,32 +301,26 @@ def draw_board(board, score, playtime, moves, new_tiles, merge_animations, movem
                 pygame.draw.rect(screen, (255, 0, 0), cell_rect, width=3, border_radius=CORNER_RADIUS)
             
             if board[row][col]:
-                if (row, col) in animated_destinations:
+                if slide_into[cell]:
                     continue  # This tile is being animated via movement animation
-                # Check for new tile animation
-                new_tile = next((tile for tile in new_tiles if tile['pos'] == (row, col)), None)
-                if new_tile:
-                    elapsed_time = current_time - new_tile['start_time']
-                    if elapsed_time < 0.3:
-                        progress = elapsed_time / 0.3
+                scale = 1.0
+                alpha = 255
+                # New tile pop-in
+                if spawn_start[cell]:
+                    elapsed_time = current_time - spawn_start[cell]
+                    if elapsed_time < SPAWN_DURATION:
+                        progress = elapsed_time / SPAWN_DURATION
                         scale = 0.5 + 0.5 * progress
                         alpha = int(255 * progress)
-                    else:
-                        scale = 1.0
-                        alpha = 255
-                else:
-                    scale = 1.0
-                    alpha = 255
-
-                # Check merge animation (if any)
-                merge_tile = next((merge for merge in merge_animations if merge['pos'] == (row, col)), None)
-                if merge_tile:
-                    elapsed_time = current_time - merge_tile['start_time']
-                    if elapsed_time < 0.3:
-                        progress = elapsed_time / 0.3
+
+                # Merge bounce
+                if merge_start[cell]:
+                    elapsed_time = current_time - merge_start[cell]
+                    if elapsed_time < MERGE_DURATION:
+                        progress = elapsed_time / MERGE_DURATION
                         scale = 1.0 + 0.15 * (1 - (1 - progress) ** 2)
                     else:
-                        scale = 1.15 - 0.15 * (elapsed_time - 0.3) / 0.3
+                        scale = 1.15 - 0.15 * (elapsed_time - MERGE_DURATION) / MERGE_DURATION
                         if scale < 1.0:
                             scale = 1.0
 
@@ -286,53 +329,32 @@ def draw_board(board, score, playtime, moves, new_tiles, merge_animations, movem
                 offset_x = (CELL_SIZE - GRID_GAP - scaled_width) // 2 + GRID_GAP//2
                 offset_y = (CELL_SIZE - GRID_GAP - scaled_height) // 2 + GRID_GAP//2
 
-                rect = pygame.Rect(x + offset_x, y + offset_y, scaled_width, scaled_height)
-                tile_surface = pygame.Surface((scaled_width, scaled_height), pygame.SRCALPHA)
-                tile_color = CELL_COLORS.get(NUM_TO_TEXT.get(board[row][col], ""), (126, 170, 196))
-                pygame.draw.rect(tile_surface, tile_color,
-                                (0, 0, scaled_width, scaled_height), border_radius=CORNER_RADIUS + int(8 * SCALE))
-                text_str = NUM_TO_TEXT.get(board[row][col], f"{board[row][col]}")
-                text = FONT.render(text_str, True, TEXT_COLOR)
-                text_rect = text.get_rect(center=(scaled_width//2, scaled_height//2))
-                tile_surface.blit(text, text_rect)
-
-                if new_tile and (current_time - new_tile['start_time'] < 0.3):
-                    tile_surface.set_alpha(alpha)
-
-                screen.blit(tile_surface, rect)
+                tile_surface = tile_cache.get(board[row][col], scaled_width, alpha)
+                screen.blit(tile_surface, (x + offset_x, y + offset_y))
                 
     # Draw movement animations for moving tiles
-    for anim in movement_animations:
-        elapsed = current_time - anim['start_time']
-        if elapsed < anim['duration']:
-            progress = elapsed / anim['duration']
+    slides = animations.slides
+    scaled_width = CELL_SIZE - GRID_GAP
+    for i in range(animations.slide_count):
+        slide = slides[i]
+        elapsed = current_time - slide.start
+        if elapsed < SLIDE_DURATION:
+            progress = elapsed / SLIDE_DURATION
             # Linear interpolation from start to destination
-            from_row, from_col = anim['from']
-            to_row, to_col = anim['to']
-            current_row = from_row + (to_row - from_row) * progress
-            current_col = from_col + (to_col - from_col) * progress
+            current_row = slide.from_row + (slide.to_row - slide.from_row) * progress
+            current_col = slide.from_col + (slide.to_col - slide.from_col) * progress
             # Compute pixel position for the moving tile
             x = int(current_col * CELL_SIZE)
             y = int(BOARD_TOP + current_row * CELL_SIZE)
-            scaled_width = CELL_SIZE - GRID_GAP
-            scaled_height = CELL_SIZE - GRID_GAP
-            rect = pygame.Rect(x + GRID_GAP//2, y + GRID_GAP//2, scaled_width, scaled_height)
-            tile_surface = pygame.Surface((scaled_width, scaled_height), pygame.SRCALPHA)
-            tile_color = CELL_COLORS.get(NUM_TO_TEXT.get(anim['value'], ""), (126, 170, 196))
-            pygame.draw.rect(tile_surface, tile_color, (0, 0, scaled_width, scaled_height), border_radius=CORNER_RADIUS + int(8 * SCALE))
-            text_str = NUM_TO_TEXT.get(anim['value'], f"{anim['value']}")
-            text = FONT.render(text_str, True, TEXT_COLOR)
-            text_rect = text.get_rect(center=(scaled_width//2, scaled_height//2))
-            tile_surface.blit(text, text_rect)
-            screen.blit(tile_surface, rect)
+            screen.blit(tile_cache.get(slide.value, scaled_width), (x + GRID_GAP//2, y + GRID_GAP//2))
     
     # Draw border rectangle around the board area
-    border_rect = pygame.Rect(0, BOARD_TOP - int(3 * SCALE), WIDTH, BOARD_HEIGHT + int(6 * SCALE))
-    pygame.draw.rect(screen, BORDER_COLOR, border_rect, BORDER_WIDTH, border_radius=CORNER_RADIUS * 2)
+    pygame.draw.rect(screen, BORDER_COLOR, BOARD_BORDER_RECT, BORDER_WIDTH, border_radius=CORNER_RADIUS * 2)
 
-    draw_info(score, playtime, moves, board)
+def unlocked_milestones(tile_counts):
+    return frozenset(NUM_TO_TEXT[val] for val in tile_counts if val in NUM_TO_TEXT)
 
-def draw_info(score, playtime, moves, board):
+def draw_info(score, playtime, moves, board, unlocked_chars=None):
     # Convert playtime to minutes and seconds
     hours = int(playtime // 3600)  # Calculate total hours
     minutes = int((playtime % 3600) // 60)  # Calculate remaining minutes after hours
@@ -344,43 +366,37 @@ def draw_info(score, playtime, moves, board):
         time_text = f"宝宝已经玩了: {minutes}分{seconds}秒"
 
     # The info area is drawn just below the image, starting at y = IMAGE_HEIGHT.
-    score_text = FONT.render(f"麦芽糖得分: {score}", True, TEXT_COLOR)
+    # Each text line keeps its surface until its value changes.
+    score_text = SCORE_TEXT.render(f"麦芽糖得分: {score}")
     screen.blit(score_text, (int(10 * SCALE), IMAGE_HEIGHT + int(5 * SCALE)))
 
-    time_text_rendered = FONT.render(time_text, True, TEXT_COLOR)
+    time_text_rendered = TIME_TEXT.render(time_text)
     screen.blit(time_text_rendered, (int(10 * SCALE), IMAGE_HEIGHT + int(35 * SCALE)))
 
-    moves_text = FONT.render(f"动作数: {moves}", True, TEXT_COLOR)
+    moves_text = MOVES_TEXT.render(f"动作数: {moves}")
     moves_text_rect = moves_text.get_rect(topright=(WIDTH - int(10 * SCALE), IMAGE_HEIGHT + int(5 * SCALE)))
     screen.blit(moves_text, moves_text_rect)
 
-    unlocked_chars = set()
-    for r in range(GRID_SIZE):
-        for c in range(GRID_SIZE):
-            tile_val = board[r][c]
-            if tile_val in NUM_TO_TEXT:
-                unlocked_chars.add(NUM_TO_TEXT[tile_val])
+    # The main loop keeps the unlocked set up to date; other callers get a board scan.
+    if unlocked_chars is None:
+        unlocked_chars = unlocked_milestones(count_tiles(board))
 
-    milestone_str = "".join(MILESTONE_ORDER)
     base_x = int(10 * SCALE)
     base_y = IMAGE_HEIGHT + int(65 * SCALE)  # info area offset
-    cur_x = base_x
-
-    for ch in milestone_str:
-        color = MILESTONE_UNLOCKED_COLOR if ch in unlocked_chars else MILESTONE_LOCKED_COLOR
-        ch_surface = FONT.render(ch, True, color)
-        screen.blit(ch_surface, (cur_x, base_y))
-        cur_x += ch_surface.get_width() + int(2 * SCALE)
+    MILESTONE_STRIP.draw(screen, (base_x, base_y), unlocked_chars)
 
     draw_restart_button()
 
 
 
-def draw_restart_button(mouse_down=False):
-    # Restart button is drawn in the info area.
+def get_restart_button_rect():
     x = WIDTH - RESTART_BUTTON_WIDTH - int(10 * SCALE)
     y = IMAGE_HEIGHT + int(65 * SCALE)
-    button_rect = pygame.Rect(x, y, RESTART_BUTTON_WIDTH, RESTART_BUTTON_HEIGHT)
+    return pygame.Rect(x, y, RESTART_BUTTON_WIDTH, RESTART_BUTTON_HEIGHT)
+
+def draw_restart_button(mouse_down=False):
+    # Restart button is drawn in the info area.
+    button_rect = get_restart_button_rect()
 
     mx, my = pygame.mouse.get_pos()
     if button_rect.collidepoint(mx, my):
@@ -393,266 +409,91 @@ def draw_restart_button(mouse_down=False):
 
     pygame.draw.rect(screen, color, button_rect, border_radius=CORNER_RADIUS)
 
-    btn_font = pygame.font.SysFont("Microsoft YaHei", int(18 * SCALE))
-    text_surface = btn_font.render(RESTART_BUTTON_TEXT, True, (255, 255, 255))
+    text_surface = render_static(int(18 * SCALE), RESTART_BUTTON_TEXT, (255, 255, 255))
     text_rect = text_surface.get_rect(center=button_rect.center)
     screen.blit(text_surface, text_rect)
 
-def add_new_tile(board):
-    empty_cells = [
-        (r, c) for r in range(GRID_SIZE) for c in range(GRID_SIZE) if board[r][c] == 0
-    ]
-    if empty_cells:
-        r, c = random.choice(empty_cells)
-        # 90% chance of generating a 2 and 10% chance of generating a 4
-        value = 2 if random.random() < 0.9 else 4
-        board[r][c] = value
-        return (r, c, value)
-    return None
-
-def remove_random_tile(board):
-    non_zero_cells = [
-        (r, c) for r in range(GRID_SIZE) for c in range(GRID_SIZE) if board[r][c] != 0
-    ]
-    if non_zero_cells:
-        r, c = random.choice(non_zero_cells)
-        board[r][c] = 0
-
-def copy_board(board):
-    return [row[:] for row in board]
-
-def save_game(board, history, score, moves, accumulated_time):
-    data = {
-        "board": board,
-        "history": history,
-        "score": score,
-        "moves": moves,
-        "accumulated_time": accumulated_time,
-    }
-    try:
-        with open(SAVE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f)
-    except Exception as e:
-        print("Error saving game:", e)
+def board_fade(old_board, duration=1.5):
+    # Render the old board once; the fade then only changes its alpha. The
+    # next frame repaints the region anyway, so drawing it here is harmless.
+    screen.set_clip(BOARD_RECT)
+    screen.fill(BACKGROUND_COLOR, BOARD_RECT)
+    draw_grid(old_board, TileAnimations(len(old_board)), time.time())
+    screen.set_clip(None)
+    return Fade(screen.subsurface(BOARD_RECT).copy(), BOARD_RECT, duration)
 
-def load_game():
-    if not os.path.exists(SAVE_FILE):
-        return None
-    try:
-        with open(SAVE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if all(k in data for k in ("board", "history", "score", "moves", "accumulated_time")):
-            return data
-        else:
-            return None
-    except Exception as e:
-        print("Error loading game:", e)
-        return None
+_solvers = {}
 
-# --- New helper functions for movement animation ---
-
-def process_row_left(row, row_index, current_time):
+def get_solver():
     """
-    Process a row for a left move.
-    Returns: new_row, row_score, list of merge animations, list of movement animations, and a flag if changed.
-    Each merge animation is a dict: {'pos': (row, dest_index), 'value': merged_value, 'start_time': current_time}
-    Each movement animation is a dict: {'from': (row, orig_col), 'to': (row, dest_index), 'value': tile_value, 'start_time': current_time, 'duration': 0.07}
+    Returns: the hint / autoplay solver for the current board size (expectimax
+    on 4x4, the endgame tablebase on 3x3 once it has been built), or None.
     """
-    filtered = [(val, col) for col, val in enumerate(row) if val != 0]
-    new_row = []
-    row_score = 0
-    merge_anims = []
-    move_anims = []
-    dest_index = 0
-    i = 0
-    changed = False
-    while i < len(filtered):
-        if i + 1 < len(filtered) and filtered[i][0] == filtered[i+1][0]:
-            new_val = filtered[i][0] * 2
-            new_row.append(new_val)
-            row_score += new_val
-            merge_anims.append({'pos': (row_index, dest_index), 'value': new_val, 'start_time': current_time})
-            merge_sound.play()
-            if filtered[i][1] != dest_index:
-                move_anims.append({'from': (row_index, filtered[i][1]), 'to': (row_index, dest_index), 'value': filtered[i][0], 'start_time': current_time, 'duration': 0.07})
-            if filtered[i+1][1] != dest_index:
-                move_anims.append({'from': (row_index, filtered[i+1][1]), 'to': (row_index, dest_index), 'value': filtered[i+1][0], 'start_time': current_time, 'duration': 0.07})
-            if filtered[i][1] != dest_index or filtered[i+1][1] != dest_index:
-                changed = True
-            i += 2
-            dest_index += 1
+    # Both solvers know the classic rules only.
+    if RULES.name != DEFAULT_VARIANT:
+        return None
+    # The search tables are only built, and the tablebase only mapped, the first time they are used.
+    solver = _solvers.get(BOARD_SIZE)
+    if solver is None:
+        if BOARD_SIZE == AI_GRID_SIZE:
+            import ai
+            solver = ai.ExpectimaxAI()
+        elif BOARD_SIZE == TABLEBASE_GRID_SIZE:
+            import tablebase
+            solver = tablebase.Tablebase()
+            if not solver.available():
+                return None
         else:
-            new_val = filtered[i][0]
-            new_row.append(new_val)
-            if filtered[i][1] != dest_index:
-                move_anims.append({'from': (row_index, filtered[i][1]), 'to': (row_index, dest_index), 'value': filtered[i][0], 'start_time': current_time, 'duration': 0.07})
-                changed = True
-            i += 1
-            dest_index += 1
-    while len(new_row) < GRID_SIZE:
-        new_row.append(0)
-    if new_row != row:
-        changed = True
-    return new_row, row_score, merge_anims, move_anims, changed
-
-def process_row_right(row, row_index, current_time):
-    """
-    Process a row for a right move.
-    We reverse the row, process as left, then reverse the result and adjust the animation coordinates.
-    """
-    reversed_row = list(reversed(row))
-    new_temp, row_score, merge_anims_temp, move_anims_temp, changed = process_row_left(reversed_row, row_index, current_time)
-    new_row = list(reversed(new_temp))
-    merge_anims = []
-    for anim in merge_anims_temp:
-        orig_pos = anim['pos']
-        new_pos = (orig_pos[0], GRID_SIZE - 1 - orig_pos[1])
-        merge_anims.append({'pos': new_pos, 'value': anim['value'], 'start_time': anim['start_time']})
-    move_anims = []
-    for anim in move_anims_temp:
-        orig_from = anim['from']
-        orig_to = anim['to']
-        new_from = (orig_from[0], GRID_SIZE - 1 - orig_from[1])
-        new_to = (orig_to[0], GRID_SIZE - 1 - orig_to[1])
-        move_anims.append({'from': new_from, 'to': new_to, 'value': anim['value'], 'start_time': anim['start_time'], 'duration': anim['duration']})
-    return new_row, row_score, merge_anims, move_anims, changed
-
-def move_left(board):
-    moved = False
-    total_score = 0
-    merges_global = []
-    moves_global = []
-    current_time = time.time()
-    for r in range(GRID_SIZE):
-        original_row = board[r]
-        new_row, row_score, merge_anims, move_anims, row_changed = process_row_left(original_row, r, current_time)
-        total_score += row_score
-        board[r] = new_row
-        if row_changed:
-            moved = True
-        merges_global.extend(merge_anims)
-        moves_global.extend(move_anims)
-    return moved, total_score, merges_global, moves_global
-
-def move_right(board):
-    moved = False
-    total_score = 0
-    merges_global = []
-    moves_global = []
-    current_time = time.time()
-    for r in range(GRID_SIZE):
-        original_row = board[r]
-        new_row, row_score, merge_anims, move_anims, row_changed = process_row_right(original_row, r, current_time)
-        total_score += row_score
-        board[r] = new_row
-        if row_changed:
-            moved = True
-        merges_global.extend(merge_anims)
-        moves_global.extend(move_anims)
-    return moved, total_score, merges_global, moves_global
-
-def move_up(board):
-    board_t = [list(row) for row in zip(*board)]
-    moved, score, merge_anims, move_anims = move_left(board_t)
-    new_board = [list(row) for row in zip(*board_t)]
-    for r in range(GRID_SIZE):
-        board[r] = new_board[r]
-    merge_anims_adjusted = []
-    for anim in merge_anims:
-        r_t, c_t = anim['pos']
-        merge_anims_adjusted.append({'pos': (c_t, r_t), 'value': anim['value'], 'start_time': anim['start_time']})
-    move_anims_adjusted = []
-    for anim in move_anims:
-        frm = anim['from']
-        to = anim['to']
-        move_anims_adjusted.append({'from': (frm[1], frm[0]), 'to': (to[1], to[0]), 'value': anim['value'], 'start_time': anim['start_time'], 'duration': anim['duration']})
-    return moved, score, merge_anims_adjusted, move_anims_adjusted
-
-def move_down(board):
-    board_t = [list(row) for row in zip(*board)]
-    moved, score, merge_anims, move_anims = move_right(board_t)
-    new_board = [list(row) for row in zip(*board_t)]
-    for r in range(GRID_SIZE):
-        board[r] = new_board[r]
-    merge_anims_adjusted = []
-    for anim in merge_anims:
-        r_t, c_t = anim['pos']
-        merge_anims_adjusted.append({'pos': (c_t, r_t), 'value': anim['value'], 'start_time': anim['start_time']})
-    move_anims_adjusted = []
-    for anim in move_anims:
-        frm = anim['from']
-        to = anim['to']
-        move_anims_adjusted.append({'from': (frm[1], frm[0]), 'to': (to[1], to[0]), 'value': anim['value'], 'start_time': anim['start_time'], 'duration': anim['duration']})
-    return moved, score, merge_anims_adjusted, move_anims_adjusted
-
-def init_new_game():
-    board = [[0] * GRID_SIZE for _ in range(GRID_SIZE)]
-    new_tiles = []
-    tile1 = add_new_tile(board)
-    if tile1:
-        new_tiles.append({'pos': (tile1[0], tile1[1]), 'value': tile1[2], 'start_time': time.time()})
-    tile2 = add_new_tile(board)
-    if tile2:
-        new_tiles.append({'pos': (tile2[0], tile2[1]), 'value': tile2[2], 'start_time': time.time()})
-    history = [copy_board(board)]
-    score = 0
-    moves = 0
-    accumulated_time = 0.0
-    merge_animations = []
-    movement_animations = []
-    return board, history, score, moves, accumulated_time, new_tiles, merge_animations, movement_animations
-
-def fade_out_animation(old_board, new_board, duration=1.5):
-    clock = pygame.time.Clock()
-    start_time = time.time()
-    
-    old_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    old_surface.fill(BACKGROUND_COLOR)
-    
-    for row in range(GRID_SIZE):
-        for col in range(GRID_SIZE):
-            value = old_board[row][col]
-            x = col * CELL_SIZE
-            y = BOARD_TOP + row * CELL_SIZE
-            pygame.draw.rect(old_surface, CELL_COLOR, (x, y, CELL_SIZE, CELL_SIZE))
-            if value:
-                tile_surface = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-                tile_color = CELL_COLORS.get(NUM_TO_TEXT.get(value, ""), (126, 170, 196))
-                tile_surface.fill(tile_color)
-                text_str = NUM_TO_TEXT.get(value, f"{value}")
-                text = FONT.render(text_str, True, TEXT_COLOR)
-                text_rect = text.get_rect(center=(CELL_SIZE//2, CELL_SIZE//2))
-                tile_surface.blit(text, text_rect)
-                old_surface.blit(tile_surface, (x, y))
-    
-    while True:
-        elapsed = time.time() - start_time
-        if elapsed > duration:
-            break
-        
-        alpha = int(255 * (1 - elapsed/duration))
-        temp_surface = old_surface.copy()
-        temp_surface.set_alpha(alpha)
-        
-        screen.fill(BACKGROUND_COLOR)
-        draw_board(new_board, 0, 0, 0, [], [], [], time.time())
-        
-        screen.blit(temp_surface, (0, 0))
-        
-        pygame.display.update()
-        clock.tick(60)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+            return None
+        _solvers[BOARD_SIZE] = solver
+    return solver
+
+def hint_text(solver, board, direction):
+    text = f"麦芽糖提示: {DIRECTION_ARROWS[direction]}"
+    # The tablebase also knows the chance of reaching its target tile with perfect play.
+    entry = solver.lookup(board) if BOARD_SIZE == TABLEBASE_GRID_SIZE else None
+    if entry is not None:
+        text += f"\n合成 {solver.target} 的机会 {entry[0]:.0%}"
+    return text
+
+# The journal makes every action durable; the autosave into the save store
+# (a rotation of slots, see savestore.py) is a second copy written by a
+# background thread. None/None writes after every action; by default it is
+# written at most every SAVE_INTERVAL seconds, and always on quit.
+SAVE_EVERY_N_MOVES = None
+SAVE_INTERVAL = 30.0
+
+def main(new_game_size=GRID_SIZE, profile_path=None, new_game_variant=DEFAULT_VARIANT, slot=None):
+    # new_game_size and new_game_variant apply to new games and restarts; a
+    # loaded game keeps its own size and rules.
+    # With profile_path set, phase timings are recorded all session and written there on exit.
+    # With slot set, the game starts from that save slot (savestore.py) instead of the last game.
+    global _preloaded_save
+    if profile_path:
+        profiler.enable()
+    hud = None
+    if slot is not None:
+        _preloaded_save = None
+        try:
+            loaded_data = open_store().load(slot)
+        except (OSError, ValueError) as e:
+            print("Error loading game:", e)
+            loaded_data = None
+        startup.mark("save", f"slot {slot}")
+    elif _preloaded_save is not None:
+        loaded_data = _preloaded_save.result()
+        _preloaded_save = None
+        startup.mark("save", "parsed in background")
+    else:
+        loaded_data = load_game()
+        startup.mark("save")
 
-def main():
-    loaded_data = load_game()
+    # Dialogs, messages and the undo fade; all drawn and updated by this loop.
+    overlays = OverlayStack()
 
     current_time_init = time.strftime("%m月%d日，%H点%M分")
     welcome_msg = f"现在是{current_time_init}\n欢迎进入2048麦芽糖特别版~\nMade with LOVE by XiaoEYu^ ^"
-    show_temp_message(welcome_msg, duration=5)
+    show_message(overlays, welcome_msg, duration=5)
 
     if loaded_data:
         board = loaded_data["board"]
@@ -660,11 +501,41 @@ def main():
         score = loaded_data["score"]
         moves = loaded_data["moves"]
         accumulated_time = loaded_data["accumulated_time"]
-        new_tiles = []
-        merge_animations = []
-        movement_animations = []
+        rng = loaded_data["rng"]
+        rules = get_rules(loaded_data.get("variant", DEFAULT_VARIANT))
+        # Keep recording the replay only if it matches the loaded game exactly.
+        recorder = replay.resume_recorder(replay.load_replay(), board, score, moves, rng)
     else:
-        board, history, score, moves, accumulated_time, new_tiles, merge_animations, movement_animations = init_new_game()
+        rules = get_rules(new_game_variant)
+        board, history, score, moves, accumulated_time, new_tiles, rng = init_new_game(size=new_game_size,
+                                                                                      rules=rules)
+        recorder = replay.ReplayRecorder(rng.seed, new_game_size, variant=rules.name)
+    set_board_size(len(board), rules)
+
+    # Spawn, merge and slide animations live in per-cell storage reused all game.
+    animations = TileAnimations(len(board))
+    if not loaded_data:
+        for row, col, _ in new_tiles:
+            animations.add_spawn(row, col, time.time())
+
+    # Tile counts are updated from each move's merges, so the milestone row
+    # never rescans the board; other board edits recount.
+    tile_counts = count_tiles(board)
+    unlocked_chars = unlocked_milestones(tile_counts)
+
+    # Legal moves are cached until the board changes. A board with none left
+    # offers a restart once (game_over_key remembers which board was offered);
+    # the win message shows once per game.
+    legal_cache = LegalMoveCache(RULES)
+    game_over_key = None
+    won = RULES.has_won(tile_counts)
+
+    # Every action is appended to the journal; start a fresh journal from a
+    # snapshot of whatever was loaded or the new game.
+    journal = GameJournal()
+    journal.variant = RULES.name
+    journal.log_snapshot(board, history, score, moves, accumulated_time, rng)
+    saver = BackgroundSaver(every_n_moves=SAVE_EVERY_N_MOVES, interval=SAVE_INTERVAL)
 
     start_time = time.time()
     input_buffer = ""
@@ -673,35 +544,205 @@ def main():
     # Variable to hold the board cell selected for swapping.
     swap_selection = []
 
+    autoplay = False
+    last_auto_move = 0.0
+
     clock = pygame.time.Clock()
 
+    # Dirty-region bookkeeping: a region is only redrawn (and only its rect
+    # pushed to the display) when what it shows has changed.
+    full_redraw = True
+    last_board_key = None
+    last_info_key = None
+    last_overlay_key = None
+
     while True:
-        screen.fill(BACKGROUND_COLOR)
-        # Draw the top image.
-        draw_top_image()
+        profiler.end_frame()
+        if poll_top_image():
+            full_redraw = True
         current_session_time = time.time() - start_time
         playtime = accumulated_time + current_session_time
         current_time = time.time()
-        draw_board(board, score, playtime, moves, new_tiles, merge_animations, movement_animations, current_time, swap_selection)
-        pygame.display.update()
-
-        clock.tick(60)
-        
-        new_tiles = [tile for tile in new_tiles if current_time - tile['start_time'] < 0.3]
-        merge_animations = [merge for merge in merge_animations if current_time - merge['start_time'] < 0.3]
-        movement_animations = [move for move in movement_animations if current_time - move['start_time'] < move['duration']]
+        overlays.update(current_time)
+        overlay_key = overlays.key()
+        if overlay_key != last_overlay_key:
+            full_redraw = True
+            last_overlay_key = overlay_key
+        animating = animations.animating() or overlays.animating()
+        board_key = (tuple(map(tuple, board)), tuple(swap_selection), animating)
+        hovered = get_restart_button_rect().collidepoint(pygame.mouse.get_pos())
+        info_key = (score, moves, int(playtime), unlocked_chars, hovered)
+
+        hud_rect = hud.update(current_time) if hud else None
+
+        dirty_rects = []
+        if full_redraw:
+            profiler.begin("draw_board")
+            screen.fill(BACKGROUND_COLOR)
+            draw_top_image()
+            draw_board(board, score, playtime, moves, animations, current_time, swap_selection, unlocked_chars)
+            if hud:
+                hud.draw(screen)
+            overlays.draw(screen)
+            dirty_rects.append(screen.get_rect())
+            full_redraw = False
+            profiler.end()
+        else:
+            if animating or board_key != last_board_key:
+                profiler.begin("draw_board")
+                screen.set_clip(BOARD_RECT)
+                screen.fill(BACKGROUND_COLOR, BOARD_RECT)
+                draw_grid(board, animations, current_time, swap_selection)
+                dirty_rects.append(BOARD_RECT)
+                profiler.end()
+            if info_key != last_info_key:
+                profiler.begin("draw_info")
+                screen.set_clip(INFO_RECT)
+                screen.fill(BACKGROUND_COLOR, INFO_RECT)
+                draw_info(score, playtime, moves, board, unlocked_chars)
+                dirty_rects.append(INFO_RECT)
+                profiler.end()
+            if hud_rect:
+                screen.set_clip(hud_rect)
+                draw_top_image()
+                hud.draw(screen)
+                dirty_rects.append(hud_rect)
+            screen.set_clip(None)
+            # Overlays sit on top of whatever was just repainted beneath them.
+            overlays.draw(screen, dirty_rects)
+        last_board_key = board_key
+        last_info_key = info_key
+        if dirty_rects:
+            profiler.begin("display")
+            pygame.display.update(dirty_rects)
+            profiler.end()
+        if not startup.reported:
+            if not startup.has("first frame"):
+                startup.mark("first frame")
+            if top_image is not None:
+                # Only when profiling: a normal launch keeps stdout quiet.
+                if profile_path:
+                    print(startup.report(), flush=True)
+                startup.reported = True
+
+        profiler.begin("idle")
+        if animating or autoplay:
+            clock.tick(ACTIVE_FPS)
+        else:
+            # Idle: block until input arrives instead of spinning at 60 FPS
+            # (or until the HUD is due for a refresh).
+            wait_ms = overlays.wait_ms(current_time, IDLE_WAIT_MS)
+            if hud:
+                wait_ms = min(wait_ms, int(hud.seconds_left(current_time) * 1000) + 1)
+            if top_image is None:
+                wait_ms = min(wait_ms, STARTUP_POLL_MS)
+            event = pygame.event.wait(wait_ms)
+            if event.type != pygame.NOEVENT:
+                pygame.event.post(event)
+            clock.tick()
+        profiler.end()
+
+        animations.expire(current_time)
+
+        # Game over: wait for the last move's animation, then offer a restart.
+        # Answering no leaves the board as it is, so undo is still available.
+        if (not legal_cache.get(board) and legal_cache.key != game_over_key
+                and not animations.animating() and not overlays.modal_active()):
+            game_over_key = legal_cache.key
+            autoplay = False
+            ask_confirm(overlays, "restart", "没有可以走的步啦~ 宝宝要重新开始吗? (yes/no)")
+
+        # Autoplay feeds the solver's choice through the normal arrow-key path;
+        # it pauses while a dialog is waiting for an answer.
+        if (autoplay and not animations.sliding() and not overlays.modal_active()
+                and current_time - last_auto_move >= AUTOPLAY_INTERVAL):
+            profiler.begin("ai")
+            solver = get_solver()
+            # A restart may have switched to a board size without a solver.
+            direction = solver.best_move(board) if solver else None
+            profiler.end()
+            if direction is None:
+                autoplay = False
+                show_message(overlays, "没有可以走的步啦~", 1.5)
+            else:
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=DIRECTION_KEYS[direction], unicode=""))
+            last_auto_move = current_time
+
+        profiler.begin("events")
+        # Answers from confirm dialogs closed since the last frame.
+        for action, confirmed in overlays.pop_results():
+            if not confirmed:
+                continue
+            if action == "restart":
+                if recorder:
+                    recorder.archive(board, score, moves, rng)
+                rules = get_rules(new_game_variant)
+                board, history, score, moves, accumulated_time, new_tiles, rng = init_new_game(size=new_game_size,
+                                                                                              rules=rules)
+                start_time = time.time()
+                set_board_size(new_game_size, rules)
+                animations = TileAnimations(new_game_size)
+                for row, col, _ in new_tiles:
+                    animations.add_spawn(row, col, current_time)
+                recorder = replay.ReplayRecorder(rng.seed, new_game_size, variant=rules.name)
+                tile_counts = count_tiles(board)
+                unlocked_chars = unlocked_milestones(tile_counts)
+                legal_cache = LegalMoveCache(rules)
+                game_over_key = None
+                won = False
+                journal.variant = rules.name
+                journal.log_snapshot(board, history, score, moves, accumulated_time, rng)
+                saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+            elif action == "shuffle":
+                old_board = board
+                board = shuffle_board(board, rng.stream())
+                animations.clear()
+                accumulated_time += time.time() - start_time
+                start_time = time.time()
+                history.push(board, score, moves, accumulated_time)
+                journal.log_shuffle(old_board, board, accumulated_time)
+                if recorder:
+                    recorder.record(replay.SHUFFLE)
+                journal.maybe_snapshot(board, history, score, moves, accumulated_time, rng)
+                saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+                show_message(overlays, "牌牌洗香香中~", 1.2)
+            elif action == "cheat":
+                before_cheat = copy_board(board)
+                if not remove_two_tiles(board, rng):
+                    show_message(overlays, "格子太少啦~ 不能再偷偷移除了", 1.5)
+                    continue
+                removed = [(r, c) for r in range(BOARD_SIZE) for c in range(BOARD_SIZE)
+                           if board[r][c] != before_cheat[r][c]]
+                journal.log_remove(removed, BOARD_SIZE)
+                if recorder:
+                    recorder.record(replay.CHEAT)
+                saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+                tile_counts = count_tiles(board)
+                unlocked_chars = unlocked_milestones(tile_counts)
+                show_message(overlays, "宝宝偷偷移除了 2 个格子^ ^\n小鳄鱼要伤心啦T＿T", 1.5)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 accumulated_time += (time.time() - start_time)
-                save_game(board, history, score, moves, accumulated_time)
+                journal.log_snapshot(board, history, score, moves, accumulated_time, rng)
+                journal.close()
+                saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+                saver.close()
+                if recorder:
+                    recorder.save(board, score, moves, rng)
+                if profile_path:
+                    profiler.export(profile_path)
                 pygame.quit()
                 sys.exit()
 
+            # While a dialog is open it takes all input; the game waits.
+            if overlays.handle_event(event):
+                continue
+
             # If the image (top IMAGE_HEIGHT pixels) is clicked...
             if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
                 if event.pos[1] < IMAGE_HEIGHT:
-                    show_temp_message("全然わからない~姐姐我断奶~", 1.5)
+                    show_message(overlays, "全然わからない~姐姐我断奶~", 1.5)
                     continue
 
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -713,10 +754,14 @@ def main():
                     if button_rect.collidepoint(event.pos):
                         mouse_down_on_button = True
                     # Check if the board cell was clicked (for swapping)
-                    elif BOARD_TOP <= event.pos[1] < BOARD_TOP + BOARD_HEIGHT:
+                    elif (BOARD_TOP <= event.pos[1] < BOARD_TOP + BOARD_HEIGHT
+                          and event.pos[0] < CELL_SIZE * BOARD_SIZE):
                         col = event.pos[0] // CELL_SIZE
                         row = (event.pos[1] - BOARD_TOP) // CELL_SIZE
-                        if len(swap_selection) == 0:
+                        if board[row][col] == BLOCKER:
+                            # Blockers stay put: they cannot be picked for a swap.
+                            show_message(overlays, "石头搬不动哦~", 1.2)
+                        elif len(swap_selection) == 0:
                             swap_selection.append((row, col))
                         elif len(swap_selection) == 1:
                             # If the same cell is clicked again, cancel selection.
@@ -725,18 +770,18 @@ def main():
                             else:
                                 swap_selection.append((row, col))
                                 # Swap the contents of the two selected cells.
-                                r1, c1 = swap_selection[0]
-                                r2, c2 = swap_selection[1]
-                                board[r1][c1], board[r2][c2] = board[r2][c2], board[r1][c1]
+                                swap_tiles(board, swap_selection[0], swap_selection[1])
                                 moves += 1
-                                history.append(copy_board(board))
-                                if len(history) > MAX_HISTORY_SIZE:
-                                    history.pop(0)
-                                show_temp_message("交换成功~麦芽糖就是喜欢小鳄鱼呀^ ^", 1.5)
-                                swap_selection = []
                                 accumulated_time += (time.time() - start_time)
                                 start_time = time.time()
-                                save_game(board, history, score, moves, accumulated_time)
+                                history.push(board, score, moves, accumulated_time)
+                                show_message(overlays, "交换成功~麦芽糖就是喜欢小鳄鱼呀^ ^", 1.5)
+                                journal.log_swap(swap_selection[0], swap_selection[1], accumulated_time, BOARD_SIZE)
+                                if recorder:
+                                    recorder.record(replay.swap_token(swap_selection[0], swap_selection[1], BOARD_SIZE))
+                                journal.maybe_snapshot(board, history, score, moves, accumulated_time, rng)
+                                saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+                                swap_selection = []
 
             if event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:
@@ -744,72 +789,132 @@ def main():
                     y = IMAGE_HEIGHT + int(65 * SCALE)
                     button_rect = pygame.Rect(x, y, RESTART_BUTTON_WIDTH, RESTART_BUTTON_HEIGHT)
                     if button_rect.collidepoint(event.pos) and mouse_down_on_button:
-                        if confirm_action("宝宝要重新开始吗 (yes/no)"):
-                            board, history, score, moves, accumulated_time, new_new_tiles, new_merge_animations, new_move_anims = init_new_game()
-                            new_tiles = new_new_tiles
-                            merge_animations = new_merge_animations
-                            movement_animations = new_move_anims
-                            save_game(board, history, score, moves, accumulated_time)
-                        mouse_down_on_button = False
+                        ask_confirm(overlays, "restart", "宝宝要重新开始吗 (yes/no)")
+                    mouse_down_on_button = False
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE:
-                    if confirm_action("宝宝确定要洗牌吗? (yes/no)"):
-                        history.append(copy_board(board))
-                        if len(history) > MAX_HISTORY_SIZE:
-                            history.pop(0)
-                        board = shuffle_board(board)
-                        accumulated_time += time.time() - start_time
-                        save_game(board, history, score, moves, accumulated_time)
-                        start_time = time.time()
-                        show_temp_message("牌牌洗香香中~", 1.2)
+                    ask_confirm(overlays, "shuffle", "宝宝确定要洗牌吗? (yes/no)")
+                    continue
+                if event.key == HUD_KEY:
+                    if hud:
+                        hud = None
+                        if not profile_path:
+                            profiler.disable()
+                    else:
+                        profiler.enable()
+                        hud = ProfilerHud(profiler, HUD_POSITION, SCALE)
+                    full_redraw = True
                     continue
 
-                board_copy = copy_board(board)
                 move_score = 0
-                merges_info = []
-                move_anims = []
+                merges = []
+                slides = []
                 moved = False
 
-                if event.key == pygame.K_LEFT:
-                    moved, move_score, merges_info, move_anims = move_left(board)
-                elif event.key == pygame.K_RIGHT:
-                    moved, move_score, merges_info, move_anims = move_right(board)
-                elif event.key == pygame.K_UP:
-                    moved, move_score, merges_info, move_anims = move_up(board)
-                elif event.key == pygame.K_DOWN:
-                    moved, move_score, merges_info, move_anims = move_down(board)
+                if event.key in KEY_DIRECTIONS:
+                    direction = KEY_DIRECTIONS[event.key]
+                    # Directions that cannot change the board skip the move entirely.
+                    if direction in legal_cache.get(board):
+                        profiler.begin("move")
+                        moved, move_score, merges, slides = RULES.apply_move(board, direction)
+                        profiler.end()
+                elif event.key in (HINT_KEY, AUTOPLAY_KEY) and get_solver() is None:
+                    show_message(overlays, "麦芽糖只会玩4x4的棋盘哦~\n(3x3 要先运行 tablebase.py)", 1.5)
+                    continue
+                elif event.key == HINT_KEY:
+                    profiler.begin("ai")
+                    solver = get_solver()
+                    direction = solver.best_move(board)
+                    profiler.end()
+                    if direction is None:
+                        show_message(overlays, "没有可以走的步啦~", 1.5)
+                    else:
+                        show_message(overlays, hint_text(solver, board, direction), 0.8)
+                    continue
+                elif event.key == AUTOPLAY_KEY:
+                    autoplay = not autoplay
+                    show_message(overlays, "自动游戏: 开" if autoplay else "自动游戏: 关", 0.8)
+                    continue
                 elif event.key == pygame.K_z:
-                    if len(history) > 1:
-                        old_board = copy_board(board)
-                        history.pop()
-                        new_board = history[-1]
-                        fade_out_animation(old_board, new_board)
-                        board = new_board
-                        show_temp_message("麦芽糖成功撤回了上一步操作~", 1.5)
+                    # Z undoes, Shift+Z redoes (Y is taken by the cheat code).
+                    redo = event.mod & pygame.KMOD_SHIFT
+                    state = history.redo() if redo else history.undo()
+                    if state:
+                        overlays.push(board_fade(board))
+                        animations.clear()
+                        board, score, moves, accumulated_time = state
+                        start_time = time.time()
+                        if redo:
+                            journal.log_redo()
+                        else:
+                            journal.log_undo()
+                        if recorder:
+                            recorder.record(replay.REDO if redo else replay.UNDO)
+                        saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+                        tile_counts = count_tiles(board)
+                        unlocked_chars = unlocked_milestones(tile_counts)
+                        show_message(overlays, "麦芽糖又重做了一步~" if redo else "麦芽糖成功撤回了上一步操作~", 1.5)
                     continue
                 else:
                     input_buffer += event.unicode
-                    input_buffer = handle_special_input(input_buffer, board)
+                    input_buffer = handle_special_input(input_buffer, overlays)
                     continue
 
                 if moved:
+                    # The core stays silent; the front end posts the merges to the mixer.
+                    merge_audio.post_merges(merges)
                     score += move_score
                     moves += 1
-                    merge_animations.extend(merges_info)
-                    movement_animations.extend(move_anims)
-
-                    new_tile = add_new_tile(board)
-                    if new_tile:
-                        new_tiles.append({'pos': (new_tile[0], new_tile[1]), 'value': new_tile[2], 'start_time': current_time})
-
-                    history.append(copy_board(board))
-                    if len(history) > MAX_HISTORY_SIZE:
-                        history.pop(0)
+                    animations.add_move(merges, slides, current_time)
+
+                    profiler.begin("spawn")
+                    new_tiles = RULES.spawn(board, rng.stream())
+                    profiler.end()
+                    for new_tile in new_tiles:
+                        animations.add_spawn(new_tile[0], new_tile[1], current_time)
+                    if RULES.merge == "pair":
+                        update_tile_counts(tile_counts, merges)
+                        for new_tile in new_tiles:
+                            update_tile_counts(tile_counts, (), new_tile)
+                    else:
+                        # Fibonacci and triple merges do not consume two halves: recount.
+                        tile_counts = count_tiles(board)
+                    unlocked_chars = unlocked_milestones(tile_counts)
+                    if not won and RULES.has_won(tile_counts):
+                        won = True
+                        show_message(overlays, f"呀! 宝宝合成了{RULES.label(RULES.win_code)}, 赢啦~\n还可以继续玩哦^ ^", 3)
 
                     accumulated_time += (time.time() - start_time)
                     start_time = time.time()
-                    save_game(board, history, score, moves, accumulated_time)
+                    history.push(board, score, moves, accumulated_time)
+                    profiler.begin("save")
+                    journal.log_move(direction, new_tiles, accumulated_time, BOARD_SIZE)
+                    if recorder:
+                        recorder.record(replay.MOVE_TOKENS[direction])
+                    journal.maybe_snapshot(board, history, score, moves, accumulated_time, rng)
+                    saver.submit(board, history, score, moves, accumulated_time, rng, RULES.name)
+                    profiler.end()
+
+        profiler.end()
+        merge_audio.flush()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="2048 麦芽糖特别版")
+    parser.add_argument("--size", type=int, default=GRID_SIZE, choices=range(MIN_GRID_SIZE, MAX_GRID_SIZE + 1),
+                        metavar="N", help="board size for new games (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="record frame and phase timings and write them to FILE (.csv or .json) on exit")
+    parser.add_argument("--variant", default=DEFAULT_VARIANT, choices=VARIANTS,
+                        help="rule variant for new games (default: %(default)s)")
+    parser.add_argument("--slot", metavar="NAME", default=None,
+                        help="start from this save slot (python savestore.py list) instead of the last game")
+    args = parser.parse_args()
+    if args.slot is not None:
+        try:
+            found = args.slot in open_store()
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if not found:
+            parser.error(f"no save slot {args.slot!r}")
+    main(args.size, args.profile, args.variant, args.slot)
@@ -0,0 +1,380 @@
+import time
+
+import bitboard
+from bitboard import ROW_MASK, ROW_LEFT, ROW_RIGHT, transpose
+
+# --- Expectimax solver ---
+#
+# Searches the four moves (max nodes) and the add_new_tile spawns (chance
+# nodes: every empty cell, 2 with probability 0.9 and 4 with 0.1) on packed
+# bitboards. Leaves are scored with a per-row heuristic table, so evaluating
+# a board is eight table lookups. Chance nodes are memoised in a bounded
+# transposition table, branches whose probability falls below a cut-off are
+# treated as leaves, and iterative deepening stops at a per-move time budget.
+#
+# The search carries every board together with its transpose, so moves and
+# evaluations are row-table lookups with no transpose() calls, and the chance
+# nodes just above the leaves score their spawns incrementally (_leaf_spawns).
+# Even so, pure Python does not reach the depths a compiled solver does: on
+# the reference machine a depth-3 search (depths 1-3 of the deepening) takes
+# about 60 ms on a typical board and up to about 250 ms on the worst ones,
+# and depth 4 about 250 ms. Under the 50 ms budget about 40% of the moves
+# finish depth 3 and the rest fall back to depth 2.
+
+DEFAULT_TIME_BUDGET = 0.05
+DEFAULT_MAX_DEPTH = 4
+DEFAULT_TABLE_SIZE = 200000
+PROBABILITY_CUTOFF = 0.001
+# Roughly how many times longer each depth takes than the one before.
+DEEPENING_GROWTH = 4.0
+
+# Row heuristic weights.
+SCORE_LOST_PENALTY = 200000.0
+SCORE_MONOTONICITY_POWER = 4.0
+SCORE_MONOTONICITY_WEIGHT = 47.0
+SCORE_SUM_POWER = 3.5
+SCORE_SUM_WEIGHT = 11.0
+SCORE_MERGES_WEIGHT = 700.0
+SCORE_EMPTY_WEIGHT = 270.0
+
+# The spawn cells of a packed board are its zero nibbles: the shift of each
+# cell in the board and in its transpose.
+_CELL_SHIFTS = tuple((shift, 16 * (shift // 4 % 4) + 4 * (shift // 16)) for shift in range(0, 64, 4))
+
+
+def _build_heuristic_table():
+    table = [0.0] * 65536
+    for row in range(65536):
+        line = [(row >> (4 * i)) & 0xF for i in range(4)]
+        total = 0.0
+        empty = 0
+        merges = 0
+        prev = 0
+        counter = 0
+        for rank in line:
+            total += rank ** SCORE_SUM_POWER
+            if rank == 0:
+                empty += 1
+            else:
+                if prev == rank:
+                    counter += 1
+                elif counter > 0:
+                    merges += 1 + counter
+                    counter = 0
+                prev = rank
+        if counter > 0:
+            merges += 1 + counter
+
+        monotonicity_left = 0.0
+        monotonicity_right = 0.0
+        for i in range(1, 4):
+            a = line[i - 1] ** SCORE_MONOTONICITY_POWER
+            b = line[i] ** SCORE_MONOTONICITY_POWER
+            if line[i - 1] > line[i]:
+                monotonicity_left += a - b
+            else:
+                monotonicity_right += b - a
+
+        table[row] = (SCORE_LOST_PENALTY
+                      + SCORE_EMPTY_WEIGHT * empty
+                      + SCORE_MERGES_WEIGHT * merges
+                      - SCORE_MONOTONICITY_WEIGHT * min(monotonicity_left, monotonicity_right)
+                      - SCORE_SUM_WEIGHT * total)
+    return table
+
+
+HEURISTIC_TABLE = _build_heuristic_table()
+# Heuristic value of a row after moving it left / right.
+HEURISTIC_LEFT = [HEURISTIC_TABLE[ROW_LEFT[row]] for row in range(65536)]
+HEURISTIC_RIGHT = [HEURISTIC_TABLE[ROW_RIGHT[row]] for row in range(65536)]
+
+
+def _spread(row):
+    """The four nibbles of a row as one column (nibble i at bit 16 * i)."""
+    return (row & 0xF) | (row >> 4 & 0xF) << 16 | (row >> 8 & 0xF) << 32 | (row >> 12) << 48
+
+
+# A row moved left / right, spread into a column. ORing four of them (shifted
+# by 0, 4, 8 and 12 bits) gives the transpose of the moved board, so the
+# search gets every board and its transpose without calling transpose().
+SPREAD_LEFT = [_spread(ROW_LEFT[row]) for row in range(65536)]
+SPREAD_RIGHT = [_spread(ROW_RIGHT[row]) for row in range(65536)]
+
+
+def evaluate(b, t=None):
+    """Heuristic value of a packed board (t: its transpose): every row plus every column."""
+    h = HEURISTIC_TABLE
+    if t is None:
+        t = transpose(b)
+    return (h[b & ROW_MASK] + h[(b >> 16) & ROW_MASK] + h[(b >> 32) & ROW_MASK] + h[b >> 48]
+            + h[t & ROW_MASK] + h[(t >> 16) & ROW_MASK] + h[(t >> 32) & ROW_MASK] + h[t >> 48])
+
+
+_LINE_MOVES = ((ROW_LEFT, HEURISTIC_LEFT, SPREAD_LEFT), (ROW_RIGHT, HEURISTIC_RIGHT, SPREAD_RIGHT))
+
+
+def _line_sides(l0, l1, l2, l3):
+    """
+    Per move along these lines (the rows or the columns of a board), what a
+    spawn in line k leaves unchanged: the heuristic of the other moved lines,
+    the other moved lines spread into crossing lines, and whether any other
+    line moves.
+    """
+    sides = []
+    for table, heuristic, spread in _LINE_MOVES:
+        h0 = heuristic[l0]
+        h1 = heuristic[l1]
+        h2 = heuristic[l2]
+        h3 = heuristic[l3]
+        total = h0 + h1 + h2 + h3
+        s0 = spread[l0]
+        s1 = spread[l1] << 4
+        s2 = spread[l2] << 8
+        s3 = spread[l3] << 12
+        m0 = table[l0] != l0
+        m1 = table[l1] != l1
+        m2 = table[l2] != l2
+        m3 = table[l3] != l3
+        sides.append((table, heuristic, spread, (total - h0, total - h1, total - h2, total - h3),
+                      (s1 | s2 | s3, s0 | s2 | s3, s0 | s1 | s3, s0 | s1 | s2),
+                      (m1 or m2 or m3, m0 or m2 or m3, m0 or m1 or m3, m0 or m1 or m2)))
+    return sides
+
+
+def _leaf_spawns(b, t, empty):
+    """
+    Sum over the spawn cells in empty of 0.9 times the best leaf value after a
+    2 spawns there plus 0.1 times that after a 4: the children of a chance
+    node one level above the leaves, scored without building their boards.
+    A spawn changes one row and one column, so every move only has to look
+    up the changed line and the four crossing lines.
+    """
+    h = HEURISTIC_TABLE
+    rows = (b & ROW_MASK, (b >> 16) & ROW_MASK, (b >> 32) & ROW_MASK, b >> 48)
+    cols = (t & ROW_MASK, (t >> 16) & ROW_MASK, (t >> 32) & ROW_MASK, t >> 48)
+    row_sides = _line_sides(*rows)
+    col_sides = _line_sides(*cols)
+    total = 0.0
+    for shift, t_shift in empty:
+        i = shift >> 4
+        j = t_shift >> 4
+        row_shift = 4 * i
+        col_shift = 4 * j
+        for tile, weight in ((1, 0.9), (2, 0.1)):
+            row = rows[i] | (tile << col_shift)
+            col = cols[j] | (tile << row_shift)
+            best = 0.0
+            for table, heuristic, spread, others, crossing, moved in row_sides:
+                if moved[i] or table[row] != row:
+                    x = crossing[i] | (spread[row] << row_shift)
+                    value = (others[i] + heuristic[row] + h[x & ROW_MASK] + h[(x >> 16) & ROW_MASK]
+                             + h[(x >> 32) & ROW_MASK] + h[x >> 48])
+                    if value > best:
+                        best = value
+            for table, heuristic, spread, others, crossing, moved in col_sides:
+                if moved[j] or table[col] != col:
+                    x = crossing[j] | (spread[col] << col_shift)
+                    value = (others[j] + heuristic[col] + h[x & ROW_MASK] + h[(x >> 16) & ROW_MASK]
+                             + h[(x >> 32) & ROW_MASK] + h[x >> 48])
+                    if value > best:
+                        best = value
+            total += weight * best
+    return total
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class ExpectimaxAI:
+    """
+    Expectimax move picker with a transposition table that survives between
+    calls. When the table reaches table_size entries the oldest entries are
+    evicted first.
+    """
+
+    def __init__(self, max_depth=DEFAULT_MAX_DEPTH, time_budget=DEFAULT_TIME_BUDGET,
+                 table_size=DEFAULT_TABLE_SIZE):
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.table_size = table_size
+        self.table = {}
+        self.deadline = None
+        self.nodes = 0
+        self.last_depth = 0
+
+    def best_move(self, board, time_budget=None, max_depth=None):
+        """
+        Pick a move for a list-of-lists board or a packed bitboard.
+        Returns: a game_core direction (UP/DOWN/LEFT/RIGHT), or None if no move changes the board.
+        """
+        if not isinstance(board, int):
+            if not bitboard.fits(board):
+                return None
+            board = bitboard.pack_board(board)
+        if time_budget is None:
+            time_budget = self.time_budget
+        if max_depth is None:
+            max_depth = self.max_depth
+
+        legal = bitboard.legal_moves(board)
+        if not legal:
+            return None
+        if len(legal) == 1:
+            return legal[0]
+        candidates = []
+        for direction in legal:
+            new_b = bitboard.move(board, direction)[0]
+            candidates.append((direction, new_b, transpose(new_b)))
+
+        self.deadline = time.perf_counter() + time_budget
+        self.nodes = 0
+        best = candidates[0][0]
+        # Iterative deepening: always keep the answer of the last finished depth,
+        # and skip a depth that would not finish in the time left anyway.
+        for depth in range(1, max_depth + 1):
+            started = time.perf_counter()
+            try:
+                best = self._search_root(candidates, depth)
+            except _SearchTimeout:
+                break
+            self.last_depth = depth
+            now = time.perf_counter()
+            if now + DEEPENING_GROWTH * (now - started) > self.deadline:
+                break
+        return best
+
+    def _search_root(self, candidates, depth):
+        best_value = -1.0
+        best_direction = candidates[0][0]
+        for direction, new_b, new_t in candidates:
+            value = self._chance_node(new_b, new_t, depth, 1.0)
+            if value > best_value:
+                best_value = value
+                best_direction = direction
+        return best_direction
+
+    def _max_node(self, b, t, depth, probability):
+        # The four moves are inlined here (no scores needed) because this is
+        # the innermost loop of the search. Rows come from the board and
+        # columns from its transpose t; every move yields its board and its
+        # transpose from table lookups alone.
+        left = ROW_LEFT
+        right = ROW_RIGHT
+        spread_left = SPREAD_LEFT
+        spread_right = SPREAD_RIGHT
+        r0 = b & ROW_MASK
+        r1 = (b >> 16) & ROW_MASK
+        r2 = (b >> 32) & ROW_MASK
+        r3 = b >> 48
+        c0 = t & ROW_MASK
+        c1 = (t >> 16) & ROW_MASK
+        c2 = (t >> 32) & ROW_MASK
+        c3 = t >> 48
+        up_t = left[c0] | (left[c1] << 16) | (left[c2] << 32) | (left[c3] << 48)
+        down_t = right[c0] | (right[c1] << 16) | (right[c2] << 32) | (right[c3] << 48)
+        left_b = left[r0] | (left[r1] << 16) | (left[r2] << 32) | (left[r3] << 48)
+        right_b = right[r0] | (right[r1] << 16) | (right[r2] << 32) | (right[r3] << 48)
+        best = 0.0
+        if depth == 0 or probability < PROBABILITY_CUTOFF:
+            # The children are leaves: score them here and skip a call per
+            # move. The moved lines score from HEURISTIC_LEFT/RIGHT directly;
+            # only the crossing lines need the moved board.
+            h = HEURISTIC_TABLE
+            if up_t != t:
+                new_b = spread_left[c0] | (spread_left[c1] << 4) | (spread_left[c2] << 8) | (spread_left[c3] << 12)
+                hl = HEURISTIC_LEFT
+                best = (hl[c0] + hl[c1] + hl[c2] + hl[c3]
+                        + h[new_b & ROW_MASK] + h[(new_b >> 16) & ROW_MASK]
+                        + h[(new_b >> 32) & ROW_MASK] + h[new_b >> 48])
+            if down_t != t:
+                new_b = spread_right[c0] | (spread_right[c1] << 4) | (spread_right[c2] << 8) | (spread_right[c3] << 12)
+                hr = HEURISTIC_RIGHT
+                value = (hr[c0] + hr[c1] + hr[c2] + hr[c3]
+                         + h[new_b & ROW_MASK] + h[(new_b >> 16) & ROW_MASK]
+                         + h[(new_b >> 32) & ROW_MASK] + h[new_b >> 48])
+                if value > best:
+                    best = value
+            if left_b != b:
+                new_t = spread_left[r0] | (spread_left[r1] << 4) | (spread_left[r2] << 8) | (spread_left[r3] << 12)
+                hl = HEURISTIC_LEFT
+                value = (hl[r0] + hl[r1] + hl[r2] + hl[r3]
+                         + h[new_t & ROW_MASK] + h[(new_t >> 16) & ROW_MASK]
+                         + h[(new_t >> 32) & ROW_MASK] + h[new_t >> 48])
+                if value > best:
+                    best = value
+            if right_b != b:
+                new_t = spread_right[r0] | (spread_right[r1] << 4) | (spread_right[r2] << 8) | (spread_right[r3] << 12)
+                hr = HEURISTIC_RIGHT
+                value = (hr[r0] + hr[r1] + hr[r2] + hr[r3]
+                         + h[new_t & ROW_MASK] + h[(new_t >> 16) & ROW_MASK]
+                         + h[(new_t >> 32) & ROW_MASK] + h[new_t >> 48])
+                if value > best:
+                    best = value
+            return best
+        chance_node = self._chance_node
+        if up_t != t:
+            new_b = spread_left[c0] | (spread_left[c1] << 4) | (spread_left[c2] << 8) | (spread_left[c3] << 12)
+            best = chance_node(new_b, up_t, depth, probability)
+        if down_t != t:
+            new_b = spread_right[c0] | (spread_right[c1] << 4) | (spread_right[c2] << 8) | (spread_right[c3] << 12)
+            value = chance_node(new_b, down_t, depth, probability)
+            if value > best:
+                best = value
+        if left_b != b:
+            new_t = spread_left[r0] | (spread_left[r1] << 4) | (spread_left[r2] << 8) | (spread_left[r3] << 12)
+            value = chance_node(left_b, new_t, depth, probability)
+            if value > best:
+                best = value
+        if right_b != b:
+            new_t = spread_right[r0] | (spread_right[r1] << 4) | (spread_right[r2] << 8) | (spread_right[r3] << 12)
+            value = chance_node(right_b, new_t, depth, probability)
+            if value > best:
+                best = value
+        return best
+
+    def _chance_node(self, b, t, depth, probability):
+        if depth == 0 or probability < PROBABILITY_CUTOFF:
+            return evaluate(b, t)
+
+        table = self.table
+        entry = table.get(b)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+
+        self.nodes += 1
+        if not self.nodes & 0xF and time.perf_counter() > self.deadline:
+            raise _SearchTimeout()
+
+        empty = [cell for cell in _CELL_SHIFTS if not (b >> cell[0]) & 0xF]
+        count = len(empty)
+        if not count:
+            return evaluate(b, t)
+        p2 = probability * 0.9 / count
+        p4 = probability * 0.1 / count
+        depth -= 1
+        if depth == 0 or p2 < PROBABILITY_CUTOFF:
+            total = _leaf_spawns(b, t, empty)
+        else:
+            max_node = self._max_node
+            total = 0.0
+            for shift, t_shift in empty:
+                total += 0.9 * max_node(b | (1 << shift), t | (1 << t_shift), depth, p2)
+                total += 0.1 * max_node(b | (2 << shift), t | (2 << t_shift), depth, p4)
+        value = total / count
+
+        if len(table) >= self.table_size:
+            del table[next(iter(table))]
+        table[b] = (depth + 1, value)
+        return value
+
+
+_default_ai = None
+
+
+def best_move(board, time_budget=DEFAULT_TIME_BUDGET, max_depth=DEFAULT_MAX_DEPTH):
+    """Module-level convenience wrapper around a shared ExpectimaxAI."""
+    global _default_ai
+    if _default_ai is None:
+        _default_ai = ExpectimaxAI()
+    return _default_ai.best_move(board, time_budget=time_budget, max_depth=max_depth)
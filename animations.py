@@ -0,0 +1,100 @@
+# --- Tile animations ---
+#
+# Spawn pop-ins, merge bounces and slides for one board, kept in storage that
+# is allocated once per board size and reused for the whole game:
+#
+#   spawn_start[cell], merge_start[cell]   start time per row-major cell,
+#                                          0.0 when the cell is not animating
+#   slides[:slide_count]                   active _Slide records, taken from
+#                                          a preallocated pool
+#   slide_into[cell]                       number of active slides ending in
+#                                          the cell (its tile is drawn by them)
+#
+# Drawing reads a cell's state by index instead of searching lists, and
+# expiry clears entries in place, so a running animation allocates no
+# per-frame lists or dicts.
+
+SPAWN_DURATION = 0.3
+MERGE_DURATION = 0.3
+SLIDE_DURATION = 0.07
+
+
+class _Slide:
+    __slots__ = ("from_row", "from_col", "to_row", "to_col", "to_cell", "value", "start")
+
+
+class TileAnimations:
+    def __init__(self, size):
+        self.size = size
+        cells = size * size
+        self.spawn_start = [0.0] * cells
+        self.merge_start = [0.0] * cells
+        self.slide_into = [0] * cells
+        # One move slides at most every tile once; room for two overlapping moves.
+        self.slides = [_Slide() for _ in range(2 * cells)]
+        self.slide_count = 0
+        self.spawning = 0
+        self.merging = 0
+
+    def animating(self):
+        return bool(self.spawning or self.merging or self.slide_count)
+
+    def sliding(self):
+        return self.slide_count > 0
+
+    def clear(self):
+        for cell in range(self.size * self.size):
+            self.spawn_start[cell] = 0.0
+            self.merge_start[cell] = 0.0
+            self.slide_into[cell] = 0
+        self.slide_count = self.spawning = self.merging = 0
+
+    def add_spawn(self, row, col, now):
+        cell = row * self.size + col
+        if not self.spawn_start[cell]:
+            self.spawning += 1
+        self.spawn_start[cell] = now
+
+    def add_move(self, merges, slides, now):
+        """Start the animations for apply_move's merge and slide records."""
+        size = self.size
+        for (row, col), _ in merges:
+            cell = row * size + col
+            if not self.merge_start[cell]:
+                self.merging += 1
+            self.merge_start[cell] = now
+        for (from_row, from_col), (to_row, to_col), value in slides:
+            if self.slide_count == len(self.slides):
+                self.slides.append(_Slide())
+            slide = self.slides[self.slide_count]
+            self.slide_count += 1
+            slide.from_row, slide.from_col = from_row, from_col
+            slide.to_row, slide.to_col = to_row, to_col
+            slide.to_cell = to_row * size + to_col
+            slide.value = value
+            slide.start = now
+            self.slide_into[slide.to_cell] += 1
+
+    def expire(self, now):
+        """Drop finished animations in place."""
+        if self.spawning or self.merging:
+            for cell in range(self.size * self.size):
+                start = self.spawn_start[cell]
+                if start and now - start >= SPAWN_DURATION:
+                    self.spawn_start[cell] = 0.0
+                    self.spawning -= 1
+                start = self.merge_start[cell]
+                if start and now - start >= MERGE_DURATION:
+                    self.merge_start[cell] = 0.0
+                    self.merging -= 1
+        i = 0
+        while i < self.slide_count:
+            slide = self.slides[i]
+            if now - slide.start >= SLIDE_DURATION:
+                self.slide_into[slide.to_cell] -= 1
+                # Swap the finished record past the end of the active range.
+                last = self.slide_count - 1
+                self.slides[i], self.slides[last] = self.slides[last], slide
+                self.slide_count = last
+            else:
+                i += 1
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import time
+
+import pygame
+
+# --- Startup asset cache and timing ---
+#
+# Decoded, rescaled images are written to CACHE_DIR as raw pixels, so a later
+# launch at the same SCALE reads them back with a single frombytes() instead
+# of decoding the JPEG and resampling it. Each cache file is named by a hash
+# of everything its pixels depend on (source file size and mtime, target
+# size), so changing any of them simply misses the cache.
+#
+# Tile sprites are not cached on disk: reading back a raw atlas of them
+# (megabytes of RGBA) measured 1.7-5x slower than rendering them again.
+#
+# A cache file is one JSON header line followed by the pixel bytes. A
+# missing, unreadable or unwritable cache (a read-only kiosk image) only
+# costs the normal load.
+
+CACHE_DIR = "asset_cache"
+CACHE_VERSION = 1
+
+
+def _cache_path(cache_dir, kind, parts):
+    digest = hashlib.sha1(repr((CACHE_VERSION, pygame.version.ver) + tuple(parts)).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{kind}-{digest[:16]}.raw")
+
+
+def _read_cache(path):
+    """Returns: (header dict, pixel bytes), or None on a cache miss."""
+    try:
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            return header, f.read()
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(path, header, pixels):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(pixels)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def load_scaled_image(path, size, cache_dir=CACHE_DIR):
+    """
+    Load an image scaled to size, from the cache when possible. Safe to call
+    from a worker thread (with absolute paths, as the working directory may
+    change meanwhile): the result is not converted to the display format.
+    Returns: the surface and whether it came from the cache.
+    """
+    cache_path = _cache_path(cache_dir, "image", (_source_key(path), tuple(size)))
+    cached = _read_cache(cache_path)
+    if cached is not None:
+        header, pixels = cached
+        if tuple(header["size"]) == tuple(size) and len(pixels) == size[0] * size[1] * 3:
+            return pygame.image.frombytes(pixels, size, "RGB"), True
+    image = pygame.transform.scale(pygame.image.load(path), size)
+    _write_cache(cache_path, {"size": list(size)}, pygame.image.tobytes(image, "RGB"))
+    return image, False
+
+
+class StartupTimer:
+    """Milliseconds since launch at which each startup step finished."""
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.marks = []
+        self.reported = False
+
+    def mark(self, step, note=None):
+        self.marks.append((step, (time.perf_counter() - self.start) * 1000, note))
+
+    def has(self, step):
+        return any(name == step for name, _, _ in self.marks)
+
+    def report(self):
+        parts = [f"{name} {ms:.0f}" + (f" ({note})" if note else "") for name, ms, note in self.marks]
+        return "startup, ms since launch: " + ", ".join(parts)
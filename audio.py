@@ -0,0 +1,75 @@
+import math
+import threading
+
+import pygame
+
+# --- Merge sound mixer ---
+#
+# The game logic never touches pygame.mixer: apply_move returns its merges
+# and the front end posts them here. Everything posted during a frame is
+# coalesced into a single play in flush(), so a move with eight merges is one
+# sound rather than eight overlapping copies, louder the more and the bigger
+# the merges were. At most max_channels copies of the sound play at once;
+# merges beyond that are dropped rather than queued.
+#
+# The sound file is decoded on a background thread so startup does not wait
+# for it; merges before it is ready (or without a working audio device) are
+# silently skipped.
+
+SOUND_PATH = "xbbb.wav"
+MAX_CHANNELS = 2
+
+BASE_VOLUME = 0.5
+# Added per merge beyond the first, and per doubling of the largest merged tile.
+VOLUME_PER_MERGE = 0.08
+VOLUME_PER_DOUBLING = 0.02
+
+
+def merge_volume(count, largest):
+    """Returns: the play volume (0..1) for count merges whose largest new tile is largest."""
+    volume = BASE_VOLUME + VOLUME_PER_MERGE * (count - 1) + VOLUME_PER_DOUBLING * math.log2(max(largest, 1))
+    return min(1.0, volume)
+
+
+class MergeAudio:
+    def __init__(self, path=SOUND_PATH, max_channels=MAX_CHANNELS):
+        self.path = path
+        self.max_channels = max_channels
+        self.sound = None
+        self.pending_count = 0
+        self.pending_largest = 0
+        self.enabled = pygame.mixer.get_init() is not None
+        self.loader = None
+        if self.enabled:
+            self.loader = threading.Thread(target=self._load, name="audio-load", daemon=True)
+            self.loader.start()
+
+    def _load(self):
+        try:
+            sound = pygame.mixer.Sound(self.path)
+        except (pygame.error, OSError) as e:
+            print("Error loading sound:", e)
+            self.enabled = False
+            return
+        # Published by a single assignment; flush() only ever reads it.
+        self.sound = sound
+
+    def post_merges(self, merges):
+        """Queue apply_move's ((row, col), value) merge records for this frame's sound."""
+        for _, value in merges:
+            self.pending_count += 1
+            if value > self.pending_largest:
+                self.pending_largest = value
+
+    def flush(self):
+        """Play this frame's merges as one sound. Called once per frame by the main loop."""
+        if not self.pending_count:
+            return
+        count, largest = self.pending_count, self.pending_largest
+        self.pending_count = self.pending_largest = 0
+        sound = self.sound
+        if sound is None or sound.get_num_channels() >= self.max_channels:
+            return
+        channel = sound.play()
+        if channel is not None:
+            channel.set_volume(merge_volume(count, largest))
@@ -0,0 +1,212 @@
+import numpy as np
+
+from game_core import GRID_SIZE, UP, DOWN, LEFT, RIGHT
+
+# --- NumPy batch simulator ---
+#
+# Holds N boards as an (N, size, size) integer array of tile values (same
+# values as the list-of-lists boards in game_core, any board size) and steps
+# all of them in one call. Every board is first gathered into "left move" orientation with
+# a per-direction cell permutation, so a single vectorised slide/merge handles
+# any mix of directions, and the result is scattered back.
+
+CELLS = GRID_SIZE * GRID_SIZE
+
+_permutations = {}
+
+
+def direction_permutations(size=GRID_SIZE):
+    """
+    perms[d][k] is the board cell that lands at position k once a size x size
+    board is oriented so that direction d becomes a left move. Built once per size.
+    """
+    perms = _permutations.get(size)
+    if perms is None:
+        index = np.arange(size * size).reshape(size, size)
+        perms = np.empty((4, size * size), dtype=np.intp)
+        perms[LEFT] = index.ravel()
+        perms[RIGHT] = index[:, ::-1].ravel()
+        perms[UP] = index.T.ravel()
+        perms[DOWN] = index.T[:, ::-1].ravel()
+        _permutations[size] = perms
+    return perms
+
+
+PERMUTATIONS = direction_permutations(GRID_SIZE)
+
+
+def _compact_left(rows):
+    # Stable sort on "is empty" pushes the zeros right and keeps tile order.
+    order = np.argsort(rows == 0, axis=1, kind="stable")
+    return np.take_along_axis(rows, order, axis=1)
+
+
+def new_boards(n, rng=None, size=GRID_SIZE):
+    """Create n fresh boards with two spawned tiles each, like init_new_game."""
+    if rng is None:
+        rng = np.random.default_rng()
+    boards = np.zeros((n, size, size), dtype=np.int64)
+    everyone = np.ones(n, dtype=bool)
+    spawn_tiles(boards, everyone, rng)
+    spawn_tiles(boards, everyone, rng)
+    return boards
+
+
+def move_boards(boards, moves):
+    """
+    Apply one move per board in place, without spawning.
+    moves is an array of N directions (game_core.UP/DOWN/LEFT/RIGHT).
+    Returns: per-board moved flags and score deltas.
+    """
+    n, size = boards.shape[0], boards.shape[1]
+    flat = boards.reshape(n, size * size)
+    perm = direction_permutations(size)[np.asarray(moves, dtype=np.intp)]
+    oriented = np.take_along_axis(flat, perm, axis=1)
+
+    rows = _compact_left(oriented.reshape(n * size, size))
+    row_scores = np.zeros(n * size, dtype=np.int64)
+    # Merging left to right, one column pair at a time, reproduces the
+    # "each tile merges at most once" rule of the single-board engine.
+    for i in range(size - 1):
+        merge = (rows[:, i] != 0) & (rows[:, i] == rows[:, i + 1])
+        rows[merge, i] *= 2
+        rows[merge, i + 1] = 0
+        row_scores += np.where(merge, rows[:, i], 0)
+    rows = _compact_left(rows)
+
+    result = rows.reshape(n, size * size)
+    moved = np.any(result != oriented, axis=1)
+    scores = row_scores.reshape(n, size).sum(axis=1)
+    np.put_along_axis(flat, perm, result, axis=1)
+    if not np.shares_memory(flat, boards):
+        boards[...] = flat.reshape(boards.shape)
+    return moved, scores
+
+
+def legal_moves(boards):
+    """
+    The legal moves of every board without moving any of them: a line can
+    move towards index 0 if an empty cell is followed by a tile, away from
+    it if a tile is followed by an empty cell, and both ways if two
+    neighbouring tiles are equal.
+    Returns: an (N, 4) bool array, column d True where direction d is legal.
+    """
+    n = boards.shape[0]
+    legal = np.zeros((n, 4), dtype=bool)
+    # Rows give LEFT/RIGHT, columns (rows of the transposed boards) UP/DOWN.
+    for towards, away, lines in ((LEFT, RIGHT, boards), (UP, DOWN, boards.transpose(0, 2, 1))):
+        a = lines[:, :, :-1]
+        b = lines[:, :, 1:]
+        merge = (a != 0) & (a == b)
+        legal[:, towards] = np.any(merge | ((a == 0) & (b != 0)), axis=(1, 2))
+        legal[:, away] = np.any(merge | ((a != 0) & (b == 0)), axis=(1, 2))
+    return legal
+
+
+def game_over(boards):
+    """Returns: per-board flags, True where no move is legal."""
+    return ~legal_moves(boards).any(axis=1)
+
+
+def spawn_tiles(boards, mask, rng, tiles=(2, 4)):
+    """
+    add_new_tile for every board selected by mask: a uniformly chosen empty
+    cell receives a 2 (90%) or a 4 (10%). Boards without empty cells are skipped.
+    tiles are the cell values written for a 2 and a 4 ((1, 2) for log2 boards).
+    Returns: per-board spawn cell index (row * size + col), -1 where nothing spawned.
+    """
+    n, size = boards.shape[0], boards.shape[1]
+    flat = boards.reshape(n, size * size)
+    keys = rng.random((n, size * size))
+    keys[flat != 0] = -1.0
+    cells = np.argmax(keys, axis=1)
+    spawn = np.asarray(mask, dtype=bool) & (keys[np.arange(n), cells] >= 0.0)
+    values = np.where(rng.random(n) < 0.9, tiles[0], tiles[1])
+    rows = np.nonzero(spawn)[0]
+    flat[rows, cells[rows]] = values[rows]
+    if not np.shares_memory(flat, boards):
+        boards[...] = flat.reshape(boards.shape)
+    return np.where(spawn, cells, -1)
+
+
+def step(boards, moves, rng):
+    """
+    Apply one move per board, then spawn a tile on every board that moved.
+    Returns: per-board moved flags and score deltas.
+    """
+    moved, scores = move_boards(boards, moves)
+    spawn_tiles(boards, moved, rng)
+    return moved, scores
+
+
+# --- Log2 boards ---
+#
+# The same operations on boards of log2 exponents (0 = empty, 1 = 2,
+# 2 = 4, ...), the encoding reinforcement-learning observations use.
+# legal_moves() and spawn_tiles(tiles=(1, 2)) work on them unchanged.
+#
+# 4x4 boards move through the bitboard row tables: once oriented for a left
+# move, each row's four exponents are packed into its 16-bit table index,
+# so the whole batch moves with one gather into ROW_LEFT and one into
+# ROW_SCORE. Boards holding a 32768 tile (which the nibble tables cannot
+# merge) and other sizes go through move_boards on tile values instead.
+
+_NIBBLE_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+_row_tables = None
+
+
+def _numpy_row_tables():
+    global _row_tables
+    if _row_tables is None:
+        # Deferred so that importing batch_sim does not build the bitboard tables.
+        import bitboard
+
+        _row_tables = (np.array(bitboard.ROW_LEFT, dtype=np.uint16),
+                       np.array(bitboard.ROW_SCORE, dtype=np.int64),
+                       bitboard.MAX_EXPONENT)
+    return _row_tables
+
+
+def _move_log2_values(boards, moves):
+    values = np.where(boards != 0, np.left_shift(1, boards.astype(np.int64)), 0)
+    moved, scores = move_boards(values, moves)
+    boards[...] = np.log2(np.maximum(values, 1)).astype(boards.dtype)
+    return moved, scores
+
+
+def move_log2(boards, moves):
+    """
+    move_boards for an (N, size, size) array of log2 exponents, in place.
+    Returns: per-board moved flags and score deltas (in tile values).
+    """
+    n, size = boards.shape[0], boards.shape[1]
+    moves = np.asarray(moves, dtype=np.intp)
+    if size != 4:
+        return _move_log2_values(boards, moves)
+    row_left, row_score, max_exponent = _numpy_row_tables()
+    flat = boards.reshape(n, 16)
+    big = np.any(flat >= max_exponent, axis=1)
+    if big.any():
+        moved = np.zeros(n, dtype=bool)
+        scores = np.zeros(n, dtype=np.int64)
+        sub = boards[big]
+        moved[big], scores[big] = _move_log2_values(sub, moves[big])
+        boards[big] = sub
+        small = ~big
+        sub = boards[small]
+        moved[small], scores[small] = move_log2(sub, moves[small])
+        boards[small] = sub
+        return moved, scores
+
+    perm = direction_permutations(4)[moves]
+    oriented = np.take_along_axis(flat, perm, axis=1).reshape(n, 4, 4).astype(np.uint16)
+    # Nibbles do not overlap, so summing the shifted cells packs the row.
+    rows = (oriented << _NIBBLE_SHIFTS).sum(axis=2, dtype=np.uint16)
+    new_rows = row_left[rows]
+    scores = row_score[rows].sum(axis=1)
+    moved = np.any(new_rows != rows, axis=1)
+    result = ((new_rows[:, :, None] >> _NIBBLE_SHIFTS) & 0xF).astype(boards.dtype).reshape(n, 16)
+    np.put_along_axis(flat, perm, result, axis=1)
+    if not np.shares_memory(flat, boards):
+        boards[...] = flat.reshape(boards.shape)
+    return moved, scores
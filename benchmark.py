@@ -0,0 +1,385 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# The rendering cases import the pygame front end; run it without a window or sound card.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from game_core import (
+    GRID_SIZE, GameRng, add_new_tile, apply_move, copy_board, count_tiles, init_new_game, legal_moves,
+    load_game, move_down, move_left, move_right, move_up, save_game, shuffle_board,
+)
+from history import GameHistory
+from journal import GameJournal, load_journal
+
+# --- Headless benchmark suite ---
+#
+# Times a fixed set of hot paths and compares them with a stored baseline:
+#
+#   move_left/right/up/down   game_core moves over a corpus of boards taken
+#                             from seeded games (early, mid and late game)
+#   shuffle_board, add_new_tile
+#   draw_frame                a full draw_board (grid + info panel) per board
+#   save/load_*               save_game/load_game (the save store's autosave
+#                             rotation) and the journal snapshot with
+#                             20- and 10,000-entry histories
+#   session                   the real main() loop driven by a scripted input
+#                             sequence until it quits
+#
+# Every case runs --repeat times and keeps the fastest run (the least
+# disturbed by the rest of the machine), reported as microseconds per
+# operation. A case is a regression when it is more than --tolerance slower
+# than the baseline. Baselines are machine-specific: record one on the
+# machine that runs the comparison.
+#
+#   python benchmark.py                   compare with benchmark_baseline.json
+#   python benchmark.py --save-baseline   record a new baseline
+#   python benchmark.py --only move --repeat 10
+
+BASELINE_FILE = "benchmark_baseline.json"
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+# Short cases are looped until one timed run takes at least this long.
+MIN_RUN_TIME = 0.1
+
+CORPUS_SEED = 2048
+CORPUS_SIZE = 300
+HISTORY_SIZES = (20, 10000)
+
+# Scripted session: this many inputs, each followed by SESSION_IDLE_FRAMES
+# frames without input so animations run.
+SESSION_INPUTS = 240
+SESSION_IDLE_FRAMES = 2
+SESSION_UNDO_EVERY = 25
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FRONT_END = os.path.join(ROOT, "2048_myt_1.py")
+
+
+def make_corpus(count=CORPUS_SIZE, seed=CORPUS_SEED, size=GRID_SIZE):
+    """
+    Boards sampled evenly from seeded games played to the end with a
+    corner-first policy and an occasional random move.
+    Returns: a list of count list-of-lists boards.
+    """
+    rng = random.Random(seed)
+    boards = []
+    game = 0
+    while len(boards) < count * 4:
+        board, _, _, _, _, _, game_rng = init_new_game(seed * 1000 + game, size)
+        game += 1
+        while True:
+            legal = legal_moves(board)
+            if not legal:
+                break
+            boards.append(copy_board(board))
+            direction = rng.choice(legal) if rng.random() < 0.2 else legal[-1]
+            apply_move(board, direction, animate=False)
+            add_new_tile(board, game_rng.stream())
+    step = len(boards) / count
+    return [boards[int(i * step)] for i in range(count)]
+
+
+class Case:
+    def __init__(self, name, ops, run, repeat=True):
+        self.name = name
+        self.ops = ops
+        self.run = run
+        # False for cases that can only run once per process (the session quits pygame).
+        self.repeat = repeat
+
+
+def _move_case(name, move, corpus):
+    def run():
+        for board in corpus:
+            # The moves replace the outer list's rows, so a shallow copy keeps the corpus intact.
+            move(list(board))
+    return Case(name, len(corpus), run)
+
+
+def engine_cases(corpus):
+    rng = random.Random(CORPUS_SEED)
+
+    def shuffle():
+        for board in corpus:
+            shuffle_board(board, rng)
+
+    def spawn():
+        for board in corpus:
+            add_new_tile(copy_board(board), rng)
+
+    return [
+        _move_case("move_left", move_left, corpus),
+        _move_case("move_right", move_right, corpus),
+        _move_case("move_up", move_up, corpus),
+        _move_case("move_down", move_down, corpus),
+        Case("shuffle_board", len(corpus), shuffle),
+        Case("add_new_tile", len(corpus), spawn),
+    ]
+
+
+def _history(corpus, entries):
+    history = GameHistory(GRID_SIZE, entries)
+    for i in range(entries):
+        history.push(corpus[i % len(corpus)], 4 * i, i, 0.5 * i)
+    return history
+
+
+def persistence_cases(corpus, workdir):
+    cases = []
+    board = corpus[-1]
+    rng = GameRng(CORPUS_SEED)
+    for entries in HISTORY_SIZES:
+        history = _history(corpus, entries)
+        write_path = os.path.join(workdir, f"bench_{entries}_write.journal")
+        journal_path = os.path.join(workdir, f"bench_{entries}.journal")
+
+        def save(history=history):
+            save_game(board, history, 1000, len(history), 10.0, rng)
+
+        def journal_snapshot(history=history, path=write_path):
+            # A fresh file each run, like a new journal at startup.
+            if os.path.exists(path):
+                os.remove(path)
+            journal = GameJournal(path)
+            journal.log_snapshot(board, history, 1000, len(history), 10.0, rng)
+            journal.close()
+
+        journal_snapshot(path=journal_path)
+
+        cases += [
+            Case(f"save_game_{entries}", 1, save),
+            # load_game falls back to the save store because the work directory has no journal.
+            Case(f"load_game_{entries}", 1, load_game),
+            Case(f"journal_snapshot_{entries}", 1, journal_snapshot),
+            Case(f"journal_load_{entries}", 1, lambda path=journal_path: load_journal(path)),
+        ]
+    return cases
+
+
+def load_front_end():
+    """Import 2048_myt_1.py (not a valid module name) from the repository root."""
+    cwd = os.getcwd()
+    # The module loads its image and sound relative to the working directory.
+    os.chdir(ROOT)
+    try:
+        spec = importlib.util.spec_from_file_location("game_front_end", FRONT_END)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def draw_case(front_end, corpus):
+    from animations import TileAnimations
+
+    animations = TileAnimations(GRID_SIZE)
+    front_end.set_board_size(GRID_SIZE)
+    frames = [(board, front_end.unlocked_milestones(count_tiles(board))) for board in corpus]
+
+    def run():
+        now = time.time()
+        for i, (board, unlocked) in enumerate(frames):
+            front_end.draw_board(board, 4 * i, float(i), i, animations, now, [], unlocked)
+
+    return Case("draw_frame", len(frames), run)
+
+
+class ScriptedInput:
+    """
+    Stands in for pygame.event.get/wait while main() runs: hands out one
+    scripted event every idle_frames + 1 frames, then a QUIT. wait() never
+    blocks, so the loop runs as fast as the work allows.
+    """
+
+    def __init__(self, pygame, events, idle_frames):
+        self.pygame = pygame
+        self.events = events
+        self.idle_frames = idle_frames
+        self.position = 0
+        self.frames = 0
+
+    def get(self, *args, **kwargs):
+        self.frames += 1
+        if self.frames % (self.idle_frames + 1):
+            return []
+        if self.position == len(self.events):
+            return [self.pygame.event.Event(self.pygame.QUIT)]
+        self.position += 1
+        return [self.events[self.position - 1]]
+
+    def wait(self, *args, **kwargs):
+        return self.pygame.event.Event(self.pygame.NOEVENT)
+
+
+def session_case(front_end, workdir):
+    pygame = front_end.pygame
+    keys = (pygame.K_LEFT, pygame.K_UP, pygame.K_RIGHT, pygame.K_DOWN)
+    events = []
+    for i in range(SESSION_INPUTS):
+        key = pygame.K_z if i % SESSION_UNDO_EVERY == SESSION_UNDO_EVERY - 1 else keys[i % 4]
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=key, unicode="", mod=0))
+    script = ScriptedInput(pygame, events, SESSION_IDLE_FRAMES)
+    frames = (SESSION_INPUTS + 1) * (SESSION_IDLE_FRAMES + 1)
+
+    def run():
+        # Start from a journal with a fixed seed so every run plays the same game.
+        session_dir = os.path.join(workdir, "session")
+        shutil.rmtree(session_dir, ignore_errors=True)
+        os.makedirs(session_dir)
+        board, history, score, moves, accumulated_time, _, rng = init_new_game(CORPUS_SEED)
+        journal = GameJournal(os.path.join(session_dir, "savegame.journal"))
+        journal.log_snapshot(board, history, score, moves, accumulated_time, rng)
+        journal.close()
+
+        saved = pygame.event.get, pygame.event.wait, front_end.ACTIVE_FPS
+        cwd = os.getcwd()
+        os.chdir(session_dir)
+        pygame.event.get, pygame.event.wait = script.get, script.wait
+        front_end.ACTIVE_FPS = 0
+        try:
+            front_end.main()
+        except SystemExit:
+            pass
+        finally:
+            pygame.event.get, pygame.event.wait, front_end.ACTIVE_FPS = saved
+            os.chdir(cwd)
+
+    return Case("session", frames, run, repeat=False)
+
+
+def _timed(run, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        run()
+    return time.perf_counter() - start
+
+
+def time_case(case, repeat):
+    """Returns: the fastest run's microseconds per operation."""
+    if not case.repeat:
+        return _timed(case.run, 1) / case.ops * 1e6
+    # Like timeit's autorange: loop short cases until one run lasts MIN_RUN_TIME.
+    loops = max(1, int(MIN_RUN_TIME / max(_timed(case.run, 1), 1e-9)))
+    best = min(_timed(case.run, loops) for _ in range(repeat))
+    return best / (loops * case.ops) * 1e6
+
+
+def run_suite(only=None, repeat=DEFAULT_REPEAT, log=print):
+    """
+    Run every case whose name contains one of the `only` substrings (all by default).
+    Returns: {case name: microseconds per operation}.
+    """
+    def wanted(name):
+        return not only or any(part in name for part in only)
+
+    corpus = make_corpus()
+    workdir = tempfile.mkdtemp(prefix="bench2048_")
+    cwd = os.getcwd()
+    results = {}
+    try:
+        # save_game/load_game use the working directory's save store.
+        os.chdir(workdir)
+        groups = [lambda: engine_cases(corpus) + persistence_cases(corpus, workdir)]
+        if wanted("draw_frame") or wanted("session"):
+            # Imported only after the headless cases: pygame's mixer thread
+            # competes with them for the CPU. The session goes last because
+            # main() shuts pygame down when the script quits.
+            def front_end_cases():
+                front_end = load_front_end()
+                return [draw_case(front_end, corpus), session_case(front_end, workdir)]
+            groups.append(front_end_cases)
+        for make_cases in groups:
+            for case in make_cases():
+                if wanted(case.name):
+                    results[case.name] = time_case(case, repeat)
+                    log(f"  {case.name:<24}{results[case.name]:12.2f} us/op")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns: rows of (case, us/op, baseline us/op or None, ratio or None,
+    regressed) in results order.
+    """
+    rows = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        ratio = value / base if base else None
+        rows.append((name, value, base, ratio, ratio is not None and ratio > 1 + tolerance))
+    return rows
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    data = {
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "us_per_op": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless 2048 benchmark suite.")
+    parser.add_argument("--only", nargs="+", default=None, metavar="NAME",
+                        help="run only cases whose name contains one of these strings")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per case; the fastest counts")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--baseline", default=os.path.join(ROOT, BASELINE_FILE), help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="record the results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    log = (lambda message: None) if args.json else print
+    results = run_suite(args.only, args.repeat, log)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        log(f"Baseline written to {args.baseline}")
+        if args.json:
+            print(json.dumps(results, indent=2))
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    rows = compare(results, baseline["us_per_op"] if baseline else {}, args.tolerance)
+    regressions = [row for row in rows if row[4]]
+    if args.json:
+        print(json.dumps([{"case": name, "us_per_op": value, "baseline": base, "ratio": ratio,
+                           "regressed": regressed} for name, value, base, ratio, regressed in rows], indent=2))
+    else:
+        if baseline is None:
+            print(f"No baseline at {args.baseline}; record one with --save-baseline.")
+        else:
+            print(f"\nAgainst baseline from {baseline.get('recorded')} ({baseline.get('machine')}):")
+            for name, value, base, ratio, regressed in rows:
+                change = f"{(ratio - 1) * 100:+7.1f}%" if ratio is not None else "    new"
+                print(f"  {name:<24}{value:12.2f}{base or 0:12.2f}  {change}{'  REGRESSION' if regressed else ''}")
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# --- Packed 64-bit board engine ---
+#
+# A 4x4 board is stored in a single int: 16 cells x 4 bits, each cell holding
+# the log2 exponent of its tile (0 = empty, 1 = 2, 2 = 4, ... 15 = 32768).
+# Row r lives in bits [16*r, 16*r + 16), and column c of a row is nibble c, so
+# the leftmost cell is the least significant nibble.
+#
+# Every possible row (65536 of them) is precomputed once into lookup tables,
+# which turns a whole move into four table lookups and a few shifts.
+
+import itertools
+
+GRID_SIZE = 4
+ROW_MASK = 0xFFFF
+MAX_EXPONENT = 15
+# Largest tile that can still be merged without overflowing a nibble.
+MAX_SAFE_VALUE = 1 << (MAX_EXPONENT - 1)
+
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+
+
+def trace_line(line):
+    """
+    Slide and merge a single line of tile values towards index 0.
+    Returns: new_line, line_score, merges and slides.
+    Each merge is a tuple (dest_index, merged_value).
+    Each slide is a tuple (from_index, dest_index, tile_value) for every tile
+    that changes position, including both halves of a merge.
+    """
+    filtered = [(val, idx) for idx, val in enumerate(line) if val != 0]
+    new_line = []
+    line_score = 0
+    merges = []
+    slides = []
+    dest_index = 0
+    i = 0
+    while i < len(filtered):
+        val, idx = filtered[i]
+        if i + 1 < len(filtered) and filtered[i + 1][0] == val:
+            new_val = val * 2
+            new_line.append(new_val)
+            line_score += new_val
+            merges.append((dest_index, new_val))
+            if idx != dest_index:
+                slides.append((idx, dest_index, val))
+            if filtered[i + 1][1] != dest_index:
+                slides.append((filtered[i + 1][1], dest_index, val))
+            i += 2
+        else:
+            new_line.append(val)
+            if idx != dest_index:
+                slides.append((idx, dest_index, val))
+            i += 1
+        dest_index += 1
+    new_line.extend([0] * (len(line) - len(new_line)))
+    return new_line, line_score, merges, slides
+
+
+def _reverse_row(row):
+    return ((row & 0xF) << 12) | ((row & 0xF0) << 4) | ((row >> 4) & 0xF0) | (row >> 12)
+
+
+def _build_tables():
+    row_left = [0] * 65536
+    row_right = [0] * 65536
+    row_score = [0] * 65536
+    row_score_right = [0] * 65536
+    row = 0
+    # product() yields the highest nibble first, so e0 is the leftmost cell.
+    for e3, e2, e1, e0 in itertools.product(range(16), repeat=GRID_SIZE):
+        result = []
+        score = 0
+        last = 0
+        for e in (e0, e1, e2, e3):
+            if not e:
+                continue
+            # Exponent 15 tiles never merge: their sum would not fit in a nibble.
+            if e == last and e < MAX_EXPONENT:
+                result[-1] = e + 1
+                score += 2 << e
+                last = 0
+            else:
+                result.append(e)
+                last = e
+        packed = 0
+        for i, e in enumerate(result):
+            packed |= e << (4 * i)
+        row_left[row] = packed
+        row_score[row] = score
+        row += 1
+    for row in range(65536):
+        rev = _reverse_row(row)
+        row_right[row] = _reverse_row(row_left[rev])
+        row_score_right[row] = row_score[rev]
+    return row_left, row_right, row_score, row_score_right
+
+
+ROW_LEFT, ROW_RIGHT, ROW_SCORE, ROW_SCORE_RIGHT = _build_tables()
+
+# --- Legal moves ---
+#
+# ROW_CAN[row] has bit 0 set if the row can move left and bit 1 if it can move
+# right. OR-ing the entry of every row gives the left/right flags of a board,
+# and the same over the transposed board gives up/down, so finding the legal
+# moves costs one transpose and eight lookups instead of four full moves.
+# Move bits follow the direction constants: bit d is set if direction d is legal.
+
+ROW_CAN = bytes((ROW_LEFT[row] != row) | ((ROW_RIGHT[row] != row) << 1) for row in range(65536))
+
+# MASK_MOVES[mask] is the tuple of directions whose bit is set in mask.
+MASK_MOVES = tuple(tuple(d for d in (UP, DOWN, LEFT, RIGHT) if mask >> d & 1) for mask in range(16))
+
+
+def pack_board(board):
+    """Pack a list-of-lists board of tile values into a 64-bit int."""
+    b = 0
+    shift = 0
+    for row in board:
+        for val in row:
+            if val:
+                b |= (val.bit_length() - 1) << shift
+            shift += 4
+    return b
+
+
+# Tile value of every nibble.
+_NIBBLE_VALUES = tuple(1 << e if e else 0 for e in range(16))
+
+
+def unpack_board(b):
+    """Unpack a 64-bit board into a fresh list-of-lists of tile values."""
+    values = _NIBBLE_VALUES
+    board = []
+    for shift in range(0, 64, 16):
+        row = (b >> shift) & ROW_MASK
+        board.append([values[row & 0xF], values[(row >> 4) & 0xF], values[(row >> 8) & 0xF], values[row >> 12]])
+    return board
+
+
+def fits(board):
+    """True if the board is 4x4 and every tile can be moved and merged in packed form."""
+    if len(board) != GRID_SIZE:
+        return False
+    for row in board:
+        if len(row) != GRID_SIZE:
+            return False
+        for val in row:
+            if val > MAX_SAFE_VALUE:
+                return False
+    return True
+
+
+def transpose(b):
+    a1 = b & 0xF0F00F0FF0F00F0F
+    a2 = b & 0x0000F0F00000F0F0
+    a3 = b & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _move_rows(b, table, score_table):
+    r0 = b & ROW_MASK
+    r1 = (b >> 16) & ROW_MASK
+    r2 = (b >> 32) & ROW_MASK
+    r3 = b >> 48
+    new_b = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+    score = score_table[r0] + score_table[r1] + score_table[r2] + score_table[r3]
+    return new_b, score
+
+
+def move_left(b):
+    """Returns: new packed board and the score gained."""
+    return _move_rows(b, ROW_LEFT, ROW_SCORE)
+
+
+def move_right(b):
+    return _move_rows(b, ROW_RIGHT, ROW_SCORE_RIGHT)
+
+
+def move_up(b):
+    new_t, score = move_left(transpose(b))
+    return transpose(new_t), score
+
+
+def move_down(b):
+    new_t, score = move_right(transpose(b))
+    return transpose(new_t), score
+
+
+MOVE_FUNCTIONS = (move_up, move_down, move_left, move_right)
+
+
+def move(b, direction):
+    return MOVE_FUNCTIONS[direction](b)
+
+
+def legal_mask(b):
+    """Returns: the legal moves of a packed board as a bitmask (bit d = direction d)."""
+    can = ROW_CAN
+    horizontal = can[b & ROW_MASK] | can[(b >> 16) & ROW_MASK] | can[(b >> 32) & ROW_MASK] | can[b >> 48]
+    t = transpose(b)
+    vertical = can[t & ROW_MASK] | can[(t >> 16) & ROW_MASK] | can[(t >> 32) & ROW_MASK] | can[t >> 48]
+    # UP/DOWN are bits 0 and 1, LEFT/RIGHT bits 2 and 3.
+    return vertical | (horizontal << 2)
+
+
+def legal_moves(b):
+    return MASK_MOVES[legal_mask(b)]
+
+
+_line_cells = {}
+
+
+def line_cells(size, direction):
+    """
+    The cells of every line of a size x size board in the order a move in
+    direction processes them, as [[(row, col), ...], ...]. Built once per
+    (size, direction), so moves never recompute coordinate transforms.
+    """
+    key = (size, direction)
+    lines = _line_cells.get(key)
+    if lines is None:
+        lines = []
+        for i in range(size):
+            if direction == LEFT:
+                lines.append([(i, c) for c in range(size)])
+            elif direction == RIGHT:
+                lines.append([(i, c) for c in range(size - 1, -1, -1)])
+            elif direction == UP:
+                lines.append([(r, i) for r in range(size)])
+            else:
+                lines.append([(r, i) for r in range(size - 1, -1, -1)])
+        _line_cells[key] = lines
+    return lines
+
+
+# --- Animation records ---
+#
+# The row tables give the moved board but not which tile went where. The
+# merge and slide records of a line depend on nothing but the line, so each
+# distinct packed line is traced once (trace_line) and its records memoised
+# (at most 65536 lines); a move maps the records of just the lines it changes
+# onto their cells.
+
+_line_records = {}
+
+
+def _records(line):
+    records = _line_records.get(line)
+    if records is None:
+        values = [_NIBBLE_VALUES[(line >> shift) & 0xF] for shift in range(0, 16, 4)]
+        _, _, merges, slides = trace_line(values)
+        records = _line_records[line] = (merges, slides)
+    return records
+
+
+def move_records(b, direction):
+    """
+    Merge and slide records of a move on a packed board, the same as
+    slide_board() returns for the unpacked board.
+    Returns: merges as [((row, col), value)], slides as [((row, col), (row, col), value)].
+    """
+    lines = b if direction == LEFT or direction == RIGHT else transpose(b)
+    reverse = direction == RIGHT or direction == DOWN
+    merges = []
+    slides = []
+    for i, cells in enumerate(line_cells(GRID_SIZE, direction)):
+        line = (lines >> (16 * i)) & ROW_MASK
+        if reverse:
+            line = _reverse_row(line)
+        if ROW_LEFT[line] == line:
+            continue
+        line_merges, line_slides = _records(line)
+        for dest, value in line_merges:
+            merges.append((cells[dest], value))
+        for src, dest, value in line_slides:
+            slides.append((cells[src], cells[dest], value))
+    return merges, slides
+
+
+def slide_board(board, direction):
+    """
+    Reference move on a list-of-lists board of any size, without packing.
+    Used for boards the tables cannot hold (4x4 boards get their merge and
+    movement records from move_records()).
+    Returns: new_board, score, merges as [((row, col), value)],
+    slides as [((row, col), (row, col), value)].
+    """
+    size = len(board)
+    new_board = [[0] * size for _ in range(size)]
+    score = 0
+    merges = []
+    slides = []
+    for cells in line_cells(size, direction):
+        line = [board[r][c] for r, c in cells]
+        new_line, line_score, line_merges, line_slides = trace_line(line)
+        score += line_score
+        for (r, c), val in zip(cells, new_line):
+            new_board[r][c] = val
+        for dest, value in line_merges:
+            merges.append((cells[dest], value))
+        for src, dest, value in line_slides:
+            slides.append((cells[src], cells[dest], value))
+    return new_board, score, merges, slides
@@ -0,0 +1,109 @@
+import bitboard
+
+# --- Moves for any board size ---
+#
+# One entry point, move_board(), picks the cheapest engine for the board:
+#
+#   4x4 with every tile <= 16384   packed bitboard row tables
+#   any other board                per-size line tables: each distinct line
+#                                  (row or column) is traced once and its
+#                                  result reused, so a move costs one dict
+#                                  lookup per line plus the cell copies
+#
+# A full 16**n table cannot be built in Python for n = 5 or 6 (1M / 16M
+# rows) and only a small fraction of lines ever occur, so the tables fill
+# lazily. Many boards at once (of any size) are moved vectorised by
+# batch_sim.move_boards; for a single board NumPy's per-call overhead makes
+# that slower than the tables at every size up to 32x32.
+#
+# Results never include animation records; apply_move derives those from
+# bitboard.slide_board when the UI needs them.
+
+# Lines kept per board size before a table is cleared and refilled.
+LINE_TABLE_LIMIT = 1 << 16
+
+_line_tables = {}
+_can_move_tables = {}
+
+
+def _table_move(board, direction):
+    size = len(board)
+    table = _line_tables.get(size)
+    if table is None:
+        table = _line_tables[size] = {}
+    new_board = [[0] * size for _ in range(size)]
+    score = 0
+    for cells in bitboard.line_cells(size, direction):
+        line = tuple([board[r][c] for r, c in cells])
+        entry = table.get(line)
+        if entry is None:
+            if len(table) >= LINE_TABLE_LIMIT:
+                table.clear()
+            new_line, line_score, _, _ = bitboard.trace_line(line)
+            entry = table[line] = (new_line, line_score)
+        new_line, line_score = entry
+        score += line_score
+        for (r, c), val in zip(cells, new_line):
+            new_board[r][c] = val
+    return new_board, score
+
+
+def move_board(board, direction):
+    """
+    Move a list-of-lists board of any size without touching it.
+    Returns: the new board and the score gained.
+    """
+    if bitboard.fits(board):
+        new_b, score = bitboard.move(bitboard.pack_board(board), direction)
+        return bitboard.unpack_board(new_b), score
+    return _table_move(board, direction)
+
+
+# --- Legal moves for any board size ---
+#
+# The per-line counterpart of bitboard.ROW_CAN: each distinct line maps to
+# bit 0 if it can move towards index 0 and bit 1 if it can move away from it.
+# Rows give LEFT/RIGHT and columns UP/DOWN, and the scan stops as soon as
+# both directions of an axis are known to be legal.
+
+def _line_can_move(line):
+    flags = 0
+    for a, b in zip(line, line[1:]):
+        if a and a == b:
+            return 3
+        if b and not a:
+            flags |= 1
+        elif a and not b:
+            flags |= 2
+    return flags
+
+
+def _axis_flags(lines, table):
+    flags = 0
+    for line in lines:
+        line = tuple(line)
+        entry = table.get(line)
+        if entry is None:
+            if len(table) >= LINE_TABLE_LIMIT:
+                table.clear()
+            entry = table[line] = _line_can_move(line)
+        flags |= entry
+        if flags == 3:
+            break
+    return flags
+
+
+def legal_mask(board):
+    """
+    The legal moves of a list-of-lists board of any size, without moving it.
+    Returns: a bitmask with bit d set if direction d changes the board.
+    """
+    if bitboard.fits(board):
+        return bitboard.legal_mask(bitboard.pack_board(board))
+    size = len(board)
+    table = _can_move_tables.get(size)
+    if table is None:
+        table = _can_move_tables[size] = {}
+    horizontal = _axis_flags(board, table)
+    vertical = _axis_flags(zip(*board), table)
+    return vertical | (horizontal << 2)
@@ -0,0 +1,365 @@
+import multiprocessing
+import random
+
+import numpy as np
+
+import batch_sim
+from game_core import (
+    GRID_SIZE, MIN_GRID_SIZE, MAX_GRID_SIZE, UP, DOWN, LEFT, RIGHT, GameRng, add_new_tile, apply_move,
+    legal_moves, remove_random_tile, shuffle_board,
+)
+
+# --- Reinforcement-learning environments ---
+#
+# The game rules behind a Gymnasium-style reset()/step() API, without
+# pygame and without depending on gymnasium itself:
+#
+#   obs, info = env.reset(seed=0)
+#   obs, reward, terminated, truncated, info = env.step(action)
+#
+# Observations are uint8 arrays of log2 exponents (0 = empty, 1 = 2,
+# 2 = 4, ...). The reward is the merge score of the move, the same score the
+# game adds; every other action earns 0. info["action_mask"] marks the legal
+# actions. An episode terminates when no direction is legal (the game's
+# game-over check, cheats notwithstanding) and is truncated after max_steps
+# actions if given. Illegal actions leave the board unchanged but still count
+# as steps.
+#
+# Actions 0-3 are the directions (game_core UP, DOWN, LEFT, RIGHT). With
+# cheats=True the game's cheats follow, none of which spawns a tile:
+#
+#   SHUFFLE (4)          shuffle_board: legal with two different tile values
+#   REMOVE (5)           the cheat code: remove two random tiles
+#   6 + swap index       swap the two cells of SWAP_PAIRS[size][index]: legal
+#                        when their values differ
+#
+# Game2048Env is one game on list-of-lists boards, stepped exactly like the
+# front end (same GameRng streams, so a seed replays the same game).
+# VectorGame2048Env steps N games in one call with batch_sim on log2 arrays
+# and resets finished games in place; SubprocVectorEnv splits N games over
+# worker processes, each running a VectorGame2048Env.
+
+SHUFFLE, REMOVE, SWAP = 4, 5, 6
+DIRECTION_ACTIONS = (UP, DOWN, LEFT, RIGHT)
+
+_swap_pairs = {}
+
+
+def swap_pairs(size):
+    """Returns: the (cell, cell) pairs of the swap actions, cells as row * size + col, built once per size."""
+    pairs = _swap_pairs.get(size)
+    if pairs is None:
+        cells = size * size
+        pairs = _swap_pairs[size] = tuple((i, j) for i in range(cells) for j in range(i + 1, cells))
+    return pairs
+
+
+def action_count(size, cheats):
+    return SWAP + len(swap_pairs(size)) if cheats else len(DIRECTION_ACTIONS)
+
+
+def encode_board(board):
+    """Returns: the log2 observation of a list-of-lists board."""
+    return np.array([[val.bit_length() - 1 if val else 0 for val in row] for row in board], dtype=np.uint8)
+
+
+def _check_size(size):
+    if not MIN_GRID_SIZE <= size <= MAX_GRID_SIZE:
+        raise ValueError(f"board size must be between {MIN_GRID_SIZE} and {MAX_GRID_SIZE}")
+
+
+class Game2048Env:
+    def __init__(self, size=GRID_SIZE, cheats=False, max_steps=None, seed=None):
+        _check_size(size)
+        self.size = size
+        self.cheats = cheats
+        self.max_steps = max_steps
+        self.n_actions = action_count(size, cheats)
+        self.observation_shape = (size, size)
+        self._next_seed = seed
+        self.board = None
+        self.rng = None
+        self.score = 0
+        self.steps = 0
+
+    def reset(self, seed=None, options=None):
+        """Start a new game, from seed if given. Returns: (observation, info)."""
+        if seed is None:
+            seed, self._next_seed = self._next_seed, None
+        self.rng = GameRng(seed)
+        stream = self.rng.stream()
+        self.board = [[0] * self.size for _ in range(self.size)]
+        add_new_tile(self.board, stream)
+        add_new_tile(self.board, stream)
+        self.score = 0
+        self.steps = 0
+        return encode_board(self.board), self._info()
+
+    def action_mask(self):
+        mask = np.zeros(self.n_actions, dtype=bool)
+        mask[list(legal_moves(self.board))] = True
+        if self.cheats:
+            tiles = [val for row in self.board for val in row if val]
+            mask[SHUFFLE] = len(set(tiles)) > 1
+            mask[REMOVE] = bool(tiles)
+            flat = [val for row in self.board for val in row]
+            mask[SWAP:] = [flat[i] != flat[j] for i, j in swap_pairs(self.size)]
+        return mask
+
+    def _info(self):
+        return {"action_mask": self.action_mask(), "score": self.score}
+
+    def step(self, action):
+        """Returns: (observation, reward, terminated, truncated, info)."""
+        action = int(action)
+        if not 0 <= action < self.n_actions:
+            raise ValueError(f"action {action} outside 0..{self.n_actions - 1}")
+        board = self.board
+        reward = 0
+        if action < SHUFFLE:
+            moved, reward, _, _ = apply_move(board, action, animate=False)
+            if moved:
+                add_new_tile(board, self.rng.stream())
+                self.score += reward
+        elif action == SHUFFLE:
+            self.board = board = shuffle_board(board, self.rng.stream())
+        elif action == REMOVE:
+            stream = self.rng.stream()
+            remove_random_tile(board, stream)
+            remove_random_tile(board, stream)
+        else:
+            (r1, c1), (r2, c2) = (divmod(cell, self.size) for cell in swap_pairs(self.size)[action - SWAP])
+            board[r1][c1], board[r2][c2] = board[r2][c2], board[r1][c1]
+        self.steps += 1
+        info = self._info()
+        terminated = not info["action_mask"][:SHUFFLE].any()
+        truncated = not terminated and self.max_steps is not None and self.steps >= self.max_steps
+        return encode_board(board), float(reward), terminated, truncated, info
+
+
+class VectorGame2048Env:
+    """
+    num_envs games stepped together. step() takes an array of actions and
+    returns batched arrays; a game that terminates or is truncated is reset
+    in the same call, with its last observation and score in
+    info["final_observation"] / info["final_score"] (rows of games that did
+    not finish are left as they were).
+    """
+
+    def __init__(self, num_envs, size=GRID_SIZE, cheats=False, max_steps=None, seed=None):
+        _check_size(size)
+        self.num_envs = num_envs
+        self.size = size
+        self.cheats = cheats
+        self.max_steps = max_steps
+        self.n_actions = action_count(size, cheats)
+        self.observation_shape = (size, size)
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_envs, size, size), dtype=np.uint8)
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        if cheats:
+            pairs = np.array(swap_pairs(size), dtype=np.intp)
+            self._swap_a, self._swap_b = pairs[:, 0], pairs[:, 1]
+
+    def reset(self, seed=None, options=None):
+        """Returns: (observations, info)."""
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self._reset_boards(np.ones(self.num_envs, dtype=bool))
+        return self.boards.copy(), {"action_mask": self.action_masks(), "score": self.scores.copy()}
+
+    def _reset_boards(self, mask):
+        self.boards[mask] = 0
+        self.scores[mask] = 0
+        self.steps[mask] = 0
+        batch_sim.spawn_tiles(self.boards, mask, self.rng, (1, 2))
+        batch_sim.spawn_tiles(self.boards, mask, self.rng, (1, 2))
+
+    def action_masks(self, legal=None):
+        """Returns: an (N, n_actions) bool array of legal actions."""
+        if legal is None:
+            legal = batch_sim.legal_moves(self.boards)
+        if not self.cheats:
+            return legal
+        n = self.num_envs
+        flat = self.boards.reshape(n, -1)
+        masks = np.zeros((n, self.n_actions), dtype=bool)
+        masks[:, :SHUFFLE] = legal
+        tiles = np.where(flat != 0, flat, 255)
+        masks[:, SHUFFLE] = tiles.min(axis=1) < np.where(flat != 0, flat, 0).max(axis=1)
+        masks[:, REMOVE] = np.any(flat != 0, axis=1)
+        masks[:, SWAP:] = flat[:, self._swap_a] != flat[:, self._swap_b]
+        return masks
+
+    def _apply_cheats(self, actions, rows):
+        # Cheats are rare next to moves: run them one game at a time on
+        # list boards with the game's own functions.
+        for row in rows:
+            action = actions[row]
+            board = self.boards[row]
+            if action == SHUFFLE or action == REMOVE:
+                values = [[1 << int(e) if e else 0 for e in line] for line in board]
+                stream = random.Random(int(self.rng.integers(1 << 63)))
+                if action == SHUFFLE:
+                    values = shuffle_board(values, stream)
+                else:
+                    remove_random_tile(values, stream)
+                    remove_random_tile(values, stream)
+                board[...] = encode_board(values)
+            else:
+                a, b = swap_pairs(self.size)[action - SWAP]
+                flat = board.reshape(-1)
+                flat[a], flat[b] = flat[b], flat[a]
+
+    def step(self, actions):
+        """Returns: (observations, rewards, terminated, truncated, info) as arrays over the games."""
+        actions = np.asarray(actions, dtype=np.intp)
+        if actions.shape != (self.num_envs,):
+            raise ValueError(f"expected {self.num_envs} actions, got shape {actions.shape}")
+        bad = (actions < 0) | (actions >= self.n_actions)
+        if bad.any():
+            raise ValueError(f"action {actions[bad][0]} outside 0..{self.n_actions - 1}")
+        is_move = actions < SHUFFLE
+        if is_move.all():
+            moved, rewards = batch_sim.move_log2(self.boards, actions)
+        else:
+            # Non-move rows "move" left on a copy; only the real moves are kept.
+            trial = self.boards.copy()
+            moved, rewards = batch_sim.move_log2(trial, np.where(is_move, actions, LEFT))
+            moved &= is_move
+            rewards = np.where(moved, rewards, 0)
+            self.boards[moved] = trial[moved]
+            self._apply_cheats(actions, np.nonzero(~is_move)[0])
+        batch_sim.spawn_tiles(self.boards, moved, self.rng, (1, 2))
+        self.scores += rewards
+        self.steps += 1
+
+        legal = batch_sim.legal_moves(self.boards)
+        terminated = ~legal.any(axis=1)
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        if self.max_steps is not None:
+            truncated = ~terminated & (self.steps >= self.max_steps)
+        info = {}
+        done = terminated | truncated
+        if done.any():
+            info["final_observation"] = self.boards.copy()
+            info["final_score"] = self.scores.copy()
+            self._reset_boards(done)
+            legal[done] = batch_sim.legal_moves(self.boards[done])
+        info["action_mask"] = self.action_masks(legal)
+        info["score"] = self.scores.copy()
+        return self.boards.copy(), rewards.astype(np.float32), terminated, truncated, info
+
+    def close(self):
+        pass
+
+
+# --- Subprocess-parallel variant ---
+
+def _worker(connection, num_envs, size, cheats, max_steps, seed):
+    env = VectorGame2048Env(num_envs, size, cheats, max_steps, seed)
+    try:
+        while True:
+            command, data = connection.recv()
+            if command == "step":
+                connection.send(env.step(data))
+            elif command == "reset":
+                connection.send(env.reset(data))
+            elif command == "close":
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        connection.close()
+
+
+def _concat_info(infos, splits):
+    """Merge the workers' info dicts, filling the final_* entries of workers where nothing finished."""
+    info = {}
+    for key in ("action_mask", "score"):
+        info[key] = np.concatenate([worker_info[key] for worker_info in infos])
+    if any("final_observation" in worker_info for worker_info in infos):
+        for key, like in (("final_observation", "observations"), ("final_score", "score")):
+            parts = []
+            for worker_info, (observations, scores) in zip(infos, splits):
+                if key in worker_info:
+                    parts.append(worker_info[key])
+                else:
+                    parts.append(observations if like == "observations" else scores)
+            info[key] = np.concatenate(parts)
+    return info
+
+
+class SubprocVectorEnv:
+    """
+    The VectorGame2048Env API with the games split over num_workers
+    processes, for machines with cores to spare: step_async() sends the
+    actions, step_wait() collects the results, step() does both.
+    """
+
+    def __init__(self, num_envs, num_workers=None, size=GRID_SIZE, cheats=False, max_steps=None, seed=None):
+        _check_size(size)
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        num_workers = max(1, min(num_workers, num_envs))
+        self.num_envs = num_envs
+        self.size = size
+        self.n_actions = action_count(size, cheats)
+        self.observation_shape = (size, size)
+        counts = [num_envs // num_workers + (i < num_envs % num_workers) for i in range(num_workers)]
+        self.bounds = np.cumsum([0] + counts)
+        seeds = np.random.SeedSequence(seed).spawn(num_workers)
+        self.connections = []
+        self.processes = []
+        for count, worker_seed in zip(counts, seeds):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child, count, size, cheats, max_steps, worker_seed),
+                                              daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def reset(self, seed=None, options=None):
+        seeds = np.random.SeedSequence(seed).spawn(len(self.connections)) if seed is not None else [None] * len(self.connections)
+        for connection, worker_seed in zip(self.connections, seeds):
+            connection.send(("reset", worker_seed))
+        results = [connection.recv() for connection in self.connections]
+        observations = np.concatenate([obs for obs, _ in results])
+        info = {key: np.concatenate([worker_info[key] for _, worker_info in results]) for key in ("action_mask", "score")}
+        return observations, info
+
+    def step_async(self, actions):
+        actions = np.asarray(actions, dtype=np.intp)
+        if actions.shape != (self.num_envs,):
+            raise ValueError(f"expected {self.num_envs} actions, got shape {actions.shape}")
+        # Checked here: a bad action would otherwise kill a worker process.
+        bad = (actions < 0) | (actions >= self.n_actions)
+        if bad.any():
+            raise ValueError(f"action {actions[bad][0]} outside 0..{self.n_actions - 1}")
+        for i, connection in enumerate(self.connections):
+            connection.send(("step", actions[self.bounds[i]:self.bounds[i + 1]]))
+
+    def step_wait(self):
+        results = [connection.recv() for connection in self.connections]
+        observations, rewards, terminated, truncated, infos = zip(*results)
+        info = _concat_info(infos, [(obs, worker_info["score"]) for obs, worker_info in zip(observations, infos)])
+        return (np.concatenate(observations), np.concatenate(rewards), np.concatenate(terminated),
+                np.concatenate(truncated), info)
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=1)
+        self.connections = []
+        self.processes = []
@@ -0,0 +1,77 @@
+import pygame
+
+# --- Font registry and cached text ---
+#
+# pygame.font.SysFont scans the system font list on every call, so each
+# (name, size) is loaded once here and shared. Text that is drawn every frame
+# is kept as a rendered surface and only re-rendered when its string changes.
+
+DEFAULT_FONT_NAME = "Microsoft YaHei"
+
+_fonts = {}
+_static_text = {}
+
+
+def get_font(size, name=DEFAULT_FONT_NAME):
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pygame.font.SysFont(name, size)
+        _fonts[key] = font
+    return font
+
+
+def render_static(size, text, color):
+    """Render a fixed label (button text, dialog prompts) once and reuse it."""
+    key = (size, text, color)
+    surface = _static_text.get(key)
+    if surface is None:
+        surface = get_font(size).render(text, True, color)
+        _static_text[key] = surface
+    return surface
+
+
+class CachedText:
+    """A single line of text whose surface is re-rendered only when the string changes."""
+
+    def __init__(self, font, color):
+        self.font = font
+        self.color = color
+        self.text = None
+        self.surface = None
+
+    def render(self, text):
+        if text != self.text:
+            self.surface = self.font.render(text, True, self.color)
+            self.text = text
+        return self.surface
+
+
+class GlyphStrip:
+    """
+    A row of characters pre-rendered in a locked and an unlocked colour.
+    Drawing picks each glyph from the matching strip, so no text is rendered
+    per frame.
+    """
+
+    def __init__(self, font, chars, unlocked_color, locked_color, spacing):
+        self.chars = list(chars)
+        glyphs_unlocked = [font.render(ch, True, unlocked_color) for ch in self.chars]
+        glyphs_locked = [font.render(ch, True, locked_color) for ch in self.chars]
+        width = sum(g.get_width() for g in glyphs_unlocked) + spacing * max(0, len(self.chars) - 1)
+        height = max((g.get_height() for g in glyphs_unlocked), default=0)
+        self.unlocked = pygame.Surface((max(1, width), max(1, height)), pygame.SRCALPHA)
+        self.locked = pygame.Surface((max(1, width), max(1, height)), pygame.SRCALPHA)
+        self.areas = []
+        x = 0
+        for g_unlocked, g_locked in zip(glyphs_unlocked, glyphs_locked):
+            self.unlocked.blit(g_unlocked, (x, 0))
+            self.locked.blit(g_locked, (x, 0))
+            self.areas.append(pygame.Rect(x, 0, g_unlocked.get_width(), height))
+            x += g_unlocked.get_width() + spacing
+
+    def draw(self, surface, pos, unlocked_chars):
+        x, y = pos
+        for ch, area in zip(self.chars, self.areas):
+            strip = self.unlocked if ch in unlocked_chars else self.locked
+            surface.blit(strip, (x + area.x, y), area)
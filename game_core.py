@@ -0,0 +1,394 @@
+import random
+import json
+import os
+
+from history import GameHistory
+
+# --- Headless game core ---
+#
+# Board state, tile spawning, moves, shuffling and save/load without any
+# pygame, display, audio or font work, so it can be imported by batch
+# workers on headless machines. The pygame front end in 2048_myt_1.py is
+# layered on top of this module.
+
+# Default board size; each game can pick its own (init_new_game(size=...)),
+# from 3x3 up to 15x15 (the journal stores cell indices in one byte).
+GRID_SIZE = 4
+MIN_GRID_SIZE = 3
+MAX_GRID_SIZE = 15
+
+# Undo depth: GameHistory keeps this many packed states in a ring buffer.
+MAX_HISTORY_SIZE = 2000
+SAVE_FILE = "savegame.json"
+
+# Move directions, in the same order as bitboard.MOVE_FUNCTIONS.
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+
+# Reaching this tile (呀) wins the game; play may continue afterwards.
+WIN_TILE = 2048
+
+MILESTONE_ORDER = ["小", "鳄", "鱼", "就", "是", "喜", "欢", "麦", "芽", "糖", "呀"]
+
+NUM_TO_TEXT = {
+    2: "小", 4: "鳄", 8: "鱼", 16: "就", 32: "是",
+    64: "喜", 128: "欢", 256: "麦", 512: "芽",
+    1024: "糖", 2048: "呀",
+    4096: "而", 8192: "且", 16384: "会",
+    32768: "爱", 65536: "很", 131072: "久"
+}
+
+# History and saves pack 5 bits per cell, so 2**31 is the largest tile.
+MAX_TILE_EXPONENT = 31
+
+# An immovable blocker cell (the "blockers" variant in variants.py). The
+# shuffle, remove and swap helpers below leave blockers where they are.
+BLOCKER = 1 << MAX_TILE_EXPONENT
+
+
+def _short_label(value):
+    if value >= 1 << 30:
+        return f"{value >> 30}G"
+    if value >= 1 << 20:
+        return f"{value >> 20}M"
+    return f"{value >> 10}K"
+
+
+# Tile labels for every reachable value: the glyphs above, then short
+# numeric labels (256K, 1M, ...) for tiles past 久.
+TILE_LABELS = dict(NUM_TO_TEXT)
+TILE_LABELS.update({1 << e: _short_label(1 << e)
+                    for e in range(max(NUM_TO_TEXT).bit_length(), MAX_TILE_EXPONENT + 1)})
+
+
+# --- Per-game randomness ---
+#
+# Every random action (the spawn after a move, a shuffle, the cheat code's
+# tile removal, the two starting tiles) draws from its own random.Random
+# seeded from the game seed and the index of that action. The whole random
+# state of a game is therefore just (seed, counter): it is cheap to save, it
+# survives crashes and journal replay, and a game is reproduced exactly by
+# its seed plus its inputs.
+
+class GameRng:
+    def __init__(self, seed=None, counter=0):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(63)
+        self.seed = seed
+        self.counter = counter
+
+    def stream(self):
+        """Returns: a random.Random for the next random action."""
+        rng = random.Random((self.seed << 32) | self.counter)
+        self.counter += 1
+        return rng
+
+
+def copy_board(board):
+    return [row[:] for row in board]
+
+
+def count_tiles(board):
+    """Number of tiles of each value on the board."""
+    counts = {}
+    for row in board:
+        for val in row:
+            if val:
+                counts[val] = counts.get(val, 0) + 1
+    return counts
+
+
+def update_tile_counts(counts, merges, new_tile=None):
+    """
+    Update count_tiles() output in place after a move instead of rescanning.
+    merges are apply_move's ((row, col), value) records; every merge consumes
+    two tiles of half its value. new_tile is the (row, col, value) returned
+    by add_new_tile, if any.
+    """
+    for _, value in merges:
+        half = value // 2
+        counts[half] -= 2
+        if not counts[half]:
+            del counts[half]
+        counts[value] = counts.get(value, 0) + 1
+    if new_tile:
+        counts[new_tile[2]] = counts.get(new_tile[2], 0) + 1
+
+
+def add_new_tile(board, rng=random):
+    size = len(board)
+    empty_cells = [
+        (r, c) for r in range(size) for c in range(size) if board[r][c] == 0
+    ]
+    if empty_cells:
+        r, c = rng.choice(empty_cells)
+        # 90% chance of generating a 2 and 10% chance of generating a 4
+        value = 2 if rng.random() < 0.9 else 4
+        board[r][c] = value
+        return (r, c, value)
+    return None
+
+
+def remove_random_tile(board, rng=random):
+    size = len(board)
+    non_zero_cells = [
+        (r, c) for r in range(size) for c in range(size) if board[r][c] != 0 and board[r][c] != BLOCKER
+    ]
+    if non_zero_cells:
+        r, c = rng.choice(non_zero_cells)
+        board[r][c] = 0
+
+
+def swap_tiles(board, cell_a, cell_b):
+    """Swap the contents of two (row, col) cells. Returns: False (and swaps nothing) if either is a blocker."""
+    (r1, c1), (r2, c2) = cell_a, cell_b
+    if board[r1][c1] == BLOCKER or board[r2][c2] == BLOCKER:
+        return False
+    board[r1][c1], board[r2][c2] = board[r2][c2], board[r1][c1]
+    return True
+
+
+def shuffle_board(board, rng=random):
+    tiles = [val for row in board for val in row if val != 0 and val != BLOCKER]
+
+    if len(tiles) < 2:
+        return copy_board(board)
+
+    # Fix: If all nonzero tiles are identical, simply return a copy of the board
+    if len(set(tiles)) == 1:
+        return copy_board(board)
+
+    size = len(board)
+    while True:
+        rng.shuffle(tiles)
+        new_board = []
+        idx = 0
+        for r in range(size):
+            new_row = []
+            for c in range(size):
+                if board[r][c] == 0 or board[r][c] == BLOCKER:
+                    new_row.append(board[r][c])
+                else:
+                    new_row.append(tiles[idx])
+                    idx += 1
+            new_board.append(new_row)
+        if new_board != board:
+            return new_board
+
+
+# --- Moves (backed by the packed bitboard engine and engine.py) ---
+
+def apply_move(board, direction, animate=True):
+    """
+    Apply a move to a board of any size in place. 4x4 boards use the bitboard
+    row tables (and bitboard.move_records for the animation records); headless
+    moves on other boards use engine.move_board.
+    Returns: moved flag, score, merges as [((row, col), merged_value)],
+    slides as [((from_row, from_col), (to_row, to_col), tile_value)].
+    The merge and slide records (what the UI animates) are only built when the
+    move actually changed the board, and never with animate=False (headless
+    replay and verification).
+    """
+    # Deferred so that importing the core does not pay for building the row tables.
+    import bitboard
+
+    if not animate:
+        import engine
+
+        new_board, score = engine.move_board(board, direction)
+        if new_board == board:
+            return False, 0, [], []
+        board[:] = new_board
+        return True, score, [], []
+
+    if bitboard.fits(board):
+        packed = bitboard.pack_board(board)
+        new_packed, score = bitboard.move(packed, direction)
+        if new_packed == packed:
+            return False, 0, [], []
+        new_board = bitboard.unpack_board(new_packed)
+        merges, slides = bitboard.move_records(packed, direction)
+    else:
+        # Other sizes, or tiles above MAX_SAFE_VALUE that no longer fit a nibble.
+        new_board, score, merges, slides = bitboard.slide_board(board, direction)
+        if new_board == board:
+            return False, 0, [], []
+
+    board[:] = new_board
+    return True, score, merges, slides
+
+
+def move_left(board):
+    return apply_move(board, LEFT)
+
+
+def move_right(board):
+    return apply_move(board, RIGHT)
+
+
+def move_up(board):
+    return apply_move(board, UP)
+
+
+def move_down(board):
+    return apply_move(board, DOWN)
+
+
+# --- Legal moves, game over and win ---
+#
+# Legal moves come from precomputed per-row "can move" tables (bitboard.ROW_CAN
+# for 4x4 boards, engine's lazily filled line tables otherwise), never from
+# trial-moving copies of the board.
+
+def legal_moves(board):
+    """Returns: the tuple of directions that change the board, in UP/DOWN/LEFT/RIGHT order."""
+    import bitboard
+    import engine
+
+    return bitboard.MASK_MOVES[engine.legal_mask(board)]
+
+
+def is_game_over(board):
+    return not legal_moves(board)
+
+
+def has_won(tile_counts):
+    """True once a tile of WIN_TILE or more is on the board (tile_counts as from count_tiles)."""
+    return any(value >= WIN_TILE for value in tile_counts)
+
+
+class LegalMoveCache:
+    """
+    Remembers the legal moves of the last board it was asked about, so a loop
+    that checks every frame or every step only recomputes them after the
+    board has changed.
+    """
+
+    def __init__(self, rules=None):
+        # A variants.Rules to ask instead of the classic legal_moves.
+        self.rules = rules
+        self.key = None
+        self.moves = ()
+
+    def get(self, board):
+        key = tuple(map(tuple, board))
+        if key != self.key:
+            self.key = key
+            self.moves = legal_moves(board) if self.rules is None else self.rules.legal_moves(board)
+        return self.moves
+
+
+def init_new_game(seed=None, size=GRID_SIZE, rules=None):
+    """
+    Start a size x size game, under a variants.Rules if given.
+    Returns: board, history, score, moves, accumulated_time, the starting
+    tiles as (row, col, value) and the game's GameRng.
+    """
+    if not MIN_GRID_SIZE <= size <= MAX_GRID_SIZE:
+        raise ValueError(f"board size must be between {MIN_GRID_SIZE} and {MAX_GRID_SIZE}")
+    rng = GameRng(seed)
+    start_stream = rng.stream()
+    if rules is not None:
+        board, new_tiles = rules.new_board(size, start_stream)
+    else:
+        board = [[0] * size for _ in range(size)]
+        new_tiles = []
+        for _ in range(2):
+            tile = add_new_tile(board, start_stream)
+            if tile:
+                new_tiles.append(tile)
+    score = 0
+    moves = 0
+    accumulated_time = 0.0
+    history = GameHistory(size, MAX_HISTORY_SIZE)
+    history.push(board, score, moves, accumulated_time)
+    return board, history, score, moves, accumulated_time, new_tiles, rng
+
+
+# --- Save / load ---
+
+def make_save_data(board, history, score, moves, accumulated_time, rng=None, variant=None):
+    # The JSON format (savegame.json, and savestore.py's import/export) keeps
+    # the legacy list-of-boards history.
+    if isinstance(history, GameHistory):
+        history = history.boards()
+    data = {
+        "board": board,
+        "history": history,
+        "score": score,
+        "moves": moves,
+        "accumulated_time": accumulated_time,
+    }
+    if rng is not None:
+        data["seed"] = rng.seed
+        data["rng_counter"] = rng.counter
+    if variant is not None:
+        data["variant"] = variant
+    return data
+
+
+def write_save_file(data, path=SAVE_FILE):
+    """
+    Write save data to a temp file next to path and atomically replace path,
+    so an interrupted write never leaves a truncated save behind.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print("Error saving game:", e)
+
+
+def save_game(board, history, score, moves, accumulated_time, rng=None, variant=None):
+    """Autosave the game into the next slot of the save store's rotation (savestore.py)."""
+    import savestore
+
+    try:
+        savestore.open_store().autosave(board, history, score, moves, accumulated_time, rng,
+                                        variant or savestore.DEFAULT_VARIANT)
+    except (OSError, ValueError) as e:
+        print("Error saving game:", e)
+
+
+def load_game():
+    """
+    Load the saved game, preferring the move journal, then the newest intact
+    autosave in the save store, then a legacy savegame.json.
+    """
+    import journal
+    import savestore
+
+    data = journal.load_journal()
+    if data is not None:
+        return data
+    try:
+        data = savestore.open_store().load_autosave()
+    except (OSError, ValueError) as e:
+        print("Error loading game:", e)
+    if data is not None:
+        return data
+    return read_save_file(SAVE_FILE)
+
+
+def read_save_file(path=SAVE_FILE):
+    """Returns: the load_game()-style dict for a savegame.json-format file, or None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if all(k in data for k in ("board", "history", "score", "moves", "accumulated_time")):
+            boards = data["history"] or [data["board"]]
+            data["history"] = GameHistory.from_boards(boards, data["score"], data["moves"],
+                                                      data["accumulated_time"], MAX_HISTORY_SIZE)
+            # Saves from before seeded games continue with a fresh seed.
+            data["rng"] = GameRng(data.pop("seed", None), data.pop("rng_counter", 0))
+            return data
+        else:
+            return None
+    except Exception as e:
+        print("Error loading game:", e)
+        return None
@@ -0,0 +1,152 @@
+from array import array
+
+# --- Undo / redo history ---
+#
+# A fixed-capacity ring buffer of game states. Each entry stores the board
+# packed into a single int (5 bits per cell holding the log2 exponent, so any
+# board size and tiles up to 2**31 fit) plus the score, move count and play
+# time at that point, in parallel preallocated arrays. Pushing past capacity
+# overwrites the oldest entry in O(1), undo/redo just move a cursor, and
+# pushing after an undo discards the redo branch.
+
+DEFAULT_CAPACITY = 2000
+CELL_BITS = 5
+CELL_MASK = (1 << CELL_BITS) - 1
+
+
+def pack_state_board(board):
+    packed = 0
+    shift = 0
+    for row in board:
+        for val in row:
+            if val:
+                packed |= (val.bit_length() - 1) << shift
+            shift += CELL_BITS
+    return packed
+
+
+def unpack_state_board(packed, size):
+    board = []
+    for r in range(size):
+        row = []
+        for c in range(size):
+            e = (packed >> (CELL_BITS * (r * size + c))) & CELL_MASK
+            row.append(1 << e if e else 0)
+        board.append(row)
+    return board
+
+
+class GameHistory:
+    def __init__(self, size, capacity=DEFAULT_CAPACITY):
+        self.size = size
+        self.capacity = capacity
+        self._boards = [0] * capacity
+        self._scores = array("q", bytes(8 * capacity))
+        self._moves = array("q", bytes(8 * capacity))
+        self._times = array("d", bytes(8 * capacity))
+        self._start = 0
+        self._count = 0
+        # Index (from the oldest entry) of the state currently on screen.
+        self._cursor = -1
+
+    def __len__(self):
+        return self._count
+
+    def _slot(self, index):
+        return (self._start + index) % self.capacity
+
+    def push(self, board, score, moves, accumulated_time):
+        """Record the state after an action; anything that could be redone is dropped."""
+        self._count = self._cursor + 1
+        if self._count == self.capacity:
+            self._start = (self._start + 1) % self.capacity
+            self._count -= 1
+        slot = self._slot(self._count)
+        self._boards[slot] = pack_state_board(board)
+        self._scores[slot] = score
+        self._moves[slot] = moves
+        self._times[slot] = accumulated_time
+        self._count += 1
+        self._cursor = self._count - 1
+
+    def entry(self, index):
+        """Returns: (board, score, moves, accumulated_time) for the index-th oldest entry."""
+        slot = self._slot(index)
+        return (unpack_state_board(self._boards[slot], self.size),
+                self._scores[slot], self._moves[slot], self._times[slot])
+
+    def current(self):
+        return self.entry(self._cursor) if self._count else None
+
+    def can_undo(self):
+        return self._cursor > 0
+
+    def can_redo(self):
+        return self._cursor < self._count - 1
+
+    def undo(self):
+        """Step back one entry. Returns the restored state, or None at the oldest entry."""
+        if not self.can_undo():
+            return None
+        self._cursor -= 1
+        return self.entry(self._cursor)
+
+    def redo(self):
+        """Step forward again after an undo. Returns the restored state, or None."""
+        if not self.can_redo():
+            return None
+        self._cursor += 1
+        return self.entry(self._cursor)
+
+    @property
+    def cursor(self):
+        return self._cursor
+
+    def entries(self):
+        """Every stored entry, oldest first, as (packed_board, score, moves, accumulated_time)."""
+        for i in range(self._count):
+            slot = self._slot(i)
+            yield self._boards[slot], self._scores[slot], self._moves[slot], self._times[slot]
+
+    def restore(self, entries, cursor=None):
+        """Replace the contents with packed entries as produced by entries()."""
+        entries = list(entries)[-self.capacity:]
+        self._start = 0
+        self._count = len(entries)
+        for slot, (packed, score, moves, accumulated_time) in enumerate(entries):
+            self._boards[slot] = packed
+            self._scores[slot] = score
+            self._moves[slot] = moves
+            self._times[slot] = accumulated_time
+        if cursor is None or not 0 <= cursor < self._count:
+            cursor = self._count - 1
+        self._cursor = cursor
+
+    def copy(self):
+        """Returns: an independent copy (the arrays are copied in C, so this is cheap)."""
+        other = GameHistory(self.size, 0)
+        other.capacity = self.capacity
+        other._boards = self._boards[:]
+        other._scores = self._scores[:]
+        other._moves = self._moves[:]
+        other._times = self._times[:]
+        other._start = self._start
+        other._count = self._count
+        other._cursor = self._cursor
+        return other
+
+    def boards(self):
+        """The boards up to the current one as lists, oldest first (legacy JSON format)."""
+        return [unpack_state_board(self._boards[self._slot(i)], self.size)
+                for i in range(self._cursor + 1)]
+
+    @classmethod
+    def from_boards(cls, boards, score, moves, accumulated_time, capacity=DEFAULT_CAPACITY):
+        """
+        Build a history from a legacy list of boards. Old saves did not record
+        score, moves or time per entry, so every entry gets the saved values.
+        """
+        size = len(boards[-1]) if boards else 0
+        history = cls(size, capacity)
+        history.restore((pack_state_board(b), score, moves, accumulated_time) for b in boards)
+        return history
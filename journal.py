@@ -0,0 +1,406 @@
+import os
+import struct
+import threading
+
+from game_core import MAX_HISTORY_SIZE, GameRng
+from history import CELL_BITS, GameHistory
+from variants import DEFAULT_VARIANT, get_rules
+
+# --- Append-only binary move journal ---
+#
+# Instead of rewriting the whole board and history as JSON after every
+# action, each action is appended as a small binary record:
+#
+#   header   b"2048JNL1"
+#   record   type (1 byte) + payload length (4 bytes, little endian) + payload
+#
+#   MOVE      direction, spawn cell (255 = none), spawn exponent, play time (f32),
+#             then cell and exponent of every further spawn (variants that
+#             spawn several tiles per move)
+#   SWAP      cell a, cell b, play time (f32)
+#   SHUFFLE   play time (f32), then for each tile in row-major order the
+#             row-major index of the old tile it took its value from
+#   REMOVE    removed cells
+#   UNDO      (empty)
+#   REDO      (empty)
+#   STATE     full state: board size, cell exponents, score, moves, play time,
+#             history cursor, then every history entry as its packed board,
+#             score, moves and play time, then the game seed and RNG counter,
+#             then the length and name of the rule variant (see variants.py)
+#   SNAPSHOT  older full-state record with a plain list of history boards;
+#             still read, no longer written
+#
+# Cells are row-major indices (row * size + col) and tile values are stored
+# as log2 exponents. A snapshot is written at startup, on a new game and
+# every SNAPSHOT_EVERY records. It is appended like any other record, so
+# logging one costs no more than before; since it holds the whole state, a
+# background thread then compacts the file to it: it writes the snapshot and
+# whatever was logged after it to a new file, fsyncs that, and atomically
+# renames it over the journal. The file therefore never holds much more than
+# one snapshot plus SNAPSHOT_EVERY records, the loader replays just those, and
+# a crash at any point leaves either the old or the complete new file.
+# A torn record at the end of the file (crash mid-append) is ignored; a
+# journal that cannot be replayed at all is reported and skipped, and the
+# game loads the newest autosave instead.
+
+JOURNAL_FILE = "savegame.journal"
+MAGIC = b"2048JNL1"
+SNAPSHOT_EVERY = 256
+
+MOVE, SWAP, SHUFFLE, REMOVE, UNDO, SNAPSHOT, STATE, REDO = 1, 2, 3, 4, 5, 6, 7, 8
+SNAPSHOT_KINDS = (SNAPSHOT, STATE)
+
+_HEADER = struct.Struct("<BI")
+_MOVE = struct.Struct("<BBBf")
+_SWAP = struct.Struct("<BBf")
+_TIME = struct.Struct("<f")
+_SNAPSHOT_STATE = struct.Struct("<QIdI")
+_STATE = struct.Struct("<QIdII")
+_ENTRY = struct.Struct("<QIf")
+_RNG = struct.Struct("<QI")
+NO_SPAWN = 255
+
+
+def _packed_board_bytes(size):
+    return (size * size * CELL_BITS + 7) // 8
+
+
+def _exponent(value):
+    return value.bit_length() - 1 if value else 0
+
+
+def _pack_cells(board):
+    return bytes(_exponent(val) for row in board for val in row)
+
+
+def _unpack_cells(data, size):
+    values = [1 << e if e else 0 for e in data]
+    return [values[r * size:(r + 1) * size] for r in range(size)]
+
+
+def shuffle_permutation(old_board, new_board):
+    """
+    Describe a shuffle as, for every tile of new_board in row-major order, the
+    row-major index of the old tile whose value it received.
+    """
+    sources = {}
+    for idx, val in enumerate(val for row in old_board for val in row):
+        if val:
+            sources.setdefault(val, []).append(idx)
+    perm = []
+    for val in (val for row in new_board for val in row):
+        if val:
+            perm.append(sources[val].pop(0))
+    return perm
+
+
+class GameJournal:
+    def __init__(self, path=JOURNAL_FILE, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.records_since_snapshot = 0
+        # Rule variant of the game being logged, recorded in every snapshot.
+        self.variant = DEFAULT_VARIANT
+        size = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            if data.startswith(MAGIC):
+                size = _split_records(data)[1]
+        new_file = size == 0
+        # Unbuffered: every record reaches the OS as soon as it is logged.
+        self.file = open(path, "wb" if new_file else "ab", buffering=0)
+        if new_file:
+            self.file.write(MAGIC)
+            size = len(MAGIC)
+        elif size < len(data):
+            # New records must follow a complete one: drop a torn last record.
+            self.file.truncate(size)
+        # File size and offset of the newest snapshot, shared with the
+        # compaction thread; the lock also covers every write and the rename.
+        self._size = size
+        self._snapshot_at = None
+        self._lock = threading.Lock()
+        self._compact_pending = False
+        self._compactor = None
+
+    def close(self):
+        """Wait for a running compaction, then close the file."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        self.file.close()
+
+    def _write(self, record):
+        with self._lock:
+            start = self._size
+            self.file.write(record)
+            self._size += len(record)
+        return start
+
+    def _append(self, kind, payload=b""):
+        self._write(_HEADER.pack(kind, len(payload)) + payload)
+        self.records_since_snapshot += 1
+
+    def log_move(self, direction, new_tiles, accumulated_time, size):
+        """new_tiles: the tiles spawned after the move, as (row, col, value)."""
+        spawns = [(r * size + c, _exponent(value)) for r, c, value in new_tiles]
+        cell, exponent = spawns[0] if spawns else (NO_SPAWN, 0)
+        extra = bytes(byte for spawn in spawns[1:] for byte in spawn)
+        self._append(MOVE, _MOVE.pack(direction, cell, exponent, accumulated_time) + extra)
+
+    def log_swap(self, cell_a, cell_b, accumulated_time, size):
+        self._append(SWAP, _SWAP.pack(cell_a[0] * size + cell_a[1], cell_b[0] * size + cell_b[1],
+                                      accumulated_time))
+
+    def log_shuffle(self, old_board, new_board, accumulated_time):
+        perm = shuffle_permutation(old_board, new_board)
+        self._append(SHUFFLE, _TIME.pack(accumulated_time) + bytes(perm))
+
+    def log_remove(self, cells, size):
+        self._append(REMOVE, bytes(r * size + c for r, c in cells))
+
+    def log_undo(self):
+        self._append(UNDO)
+
+    def log_redo(self):
+        self._append(REDO)
+
+    def log_snapshot(self, board, history, score, moves, accumulated_time, rng):
+        """
+        Append a full snapshot. If older records precede it, the file is
+        compacted to the snapshot in the background.
+        """
+        payload = encode_state(board, history, score, moves, accumulated_time, rng, self.variant)
+        start = self._write(_HEADER.pack(STATE, len(payload)) + payload)
+        self.records_since_snapshot = 0
+        with self._lock:
+            self._snapshot_at = start
+            if start == len(MAGIC):
+                return
+            self._compact_pending = True
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._compact_loop, name="journal-compactor",
+                                                   daemon=True)
+                self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            with self._lock:
+                if not self._compact_pending:
+                    self._compactor = None
+                    return
+                self._compact_pending = False
+                start, end = self._snapshot_at, self._size
+                with open(self.path, "rb") as f:
+                    f.seek(start)
+                    data = f.read(end - start)
+            try:
+                self._compact(start, end, data)
+            except OSError as e:
+                # The journal is still intact, just longer; the next snapshot retries.
+                print("Error compacting journal:", e)
+
+    def _compact(self, start, end, data):
+        """Replace the file by data (the journal from offset start to end) and whatever followed it."""
+        tmp_path = self.path + ".tmp"
+        # The fsync keeps a crash right after the rename from leaving an
+        # empty or cut-off journal; it runs here, off the game loop.
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + data)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            if self._size > end:
+                # Records logged while the copy was being written.
+                with open(self.path, "rb") as old, open(tmp_path, "ab") as f:
+                    old.seek(end)
+                    f.write(old.read(self._size - end))
+                    f.flush()
+                    os.fsync(f.fileno())
+            # Closed for the rename, which Windows refuses on an open file.
+            self.file.close()
+            try:
+                os.replace(tmp_path, self.path)
+            finally:
+                self.file = open(self.path, "ab", buffering=0)
+            shift = start - len(MAGIC)
+            self._size -= shift
+            self._snapshot_at -= shift
+
+    def maybe_snapshot(self, board, history, score, moves, accumulated_time, rng):
+        """Write a snapshot once enough records have accumulated since the last one."""
+        if self.records_since_snapshot >= self.snapshot_every:
+            self.log_snapshot(board, history, score, moves, accumulated_time, rng)
+
+
+def _split_records(data):
+    """Returns: the complete (type, payload) records and the offset where they end."""
+    records = []
+    offset = len(MAGIC)
+    end = len(data)
+    while offset + _HEADER.size <= end:
+        kind, length = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        if start + length > end:
+            break
+        records.append((kind, data[start:start + length]))
+        offset = start + length
+    return records, offset
+
+
+def read_records(data):
+    """
+    Split journal bytes into (type, payload) records.
+    Returns None if the header is missing; a truncated last record is dropped.
+    """
+    if not data.startswith(MAGIC):
+        return None
+    return _split_records(data)[0]
+
+
+def encode_state(board, history, score, moves, accumulated_time, rng, variant=DEFAULT_VARIANT):
+    """Returns: the STATE payload for a game (also the slot format of savestore.py)."""
+    size = len(board)
+    board_bytes = _packed_board_bytes(size)
+    parts = [bytes([size]), _pack_cells(board),
+             _STATE.pack(score, moves, accumulated_time, history.cursor, len(history))]
+    for packed, entry_score, entry_moves, entry_time in history.entries():
+        parts.append(packed.to_bytes(board_bytes, "little"))
+        parts.append(_ENTRY.pack(entry_score, entry_moves, entry_time))
+    parts.append(_RNG.pack(rng.seed, rng.counter))
+    variant = variant.encode("ascii")
+    parts.append(bytes([len(variant)]) + variant)
+    return b"".join(parts)
+
+
+def _read_snapshot(payload):
+    # Older full-state record: history is a plain list of boards.
+    size = payload[0]
+    cells = size * size
+    board = _unpack_cells(payload[1:1 + cells], size)
+    offset = 1 + cells
+    score, moves, accumulated_time, count = _SNAPSHOT_STATE.unpack_from(payload, offset)
+    offset += _SNAPSHOT_STATE.size
+    boards = []
+    for i in range(count):
+        boards.append(_unpack_cells(payload[offset + i * cells:offset + (i + 1) * cells], size))
+    history = GameHistory.from_boards(boards or [board], score, moves, accumulated_time, MAX_HISTORY_SIZE)
+    return {"board": board, "history": history, "score": score, "moves": moves,
+            "accumulated_time": accumulated_time, "rng": GameRng(), "variant": DEFAULT_VARIANT}
+
+
+def decode_state(payload):
+    """Returns: the load_game()-style dict for a STATE payload."""
+    size = payload[0]
+    cells = size * size
+    board = _unpack_cells(payload[1:1 + cells], size)
+    offset = 1 + cells
+    score, moves, accumulated_time, cursor, count = _STATE.unpack_from(payload, offset)
+    offset += _STATE.size
+    board_bytes = _packed_board_bytes(size)
+    entries = []
+    for _ in range(count):
+        packed = int.from_bytes(payload[offset:offset + board_bytes], "little")
+        offset += board_bytes
+        entries.append((packed,) + _ENTRY.unpack_from(payload, offset))
+        offset += _ENTRY.size
+    history = GameHistory(size, MAX_HISTORY_SIZE)
+    history.restore(entries, cursor)
+    # Snapshots written before seeded games have no RNG trailer, and ones
+    # written before rule variants no variant name.
+    rng = GameRng()
+    variant = DEFAULT_VARIANT
+    if offset + _RNG.size <= len(payload):
+        rng = GameRng(*_RNG.unpack_from(payload, offset))
+        offset += _RNG.size
+        if offset < len(payload):
+            length = payload[offset]
+            variant = payload[offset + 1:offset + 1 + length].decode("ascii")
+    return {"board": board, "history": history, "score": score, "moves": moves,
+            "accumulated_time": accumulated_time, "rng": rng, "variant": variant}
+
+
+def replay_records(records):
+    """
+    Rebuild the game state from the last snapshot onwards, applying the same
+    state changes as the game loop. Returns the load_game()-style dict, or
+    None if the journal holds no snapshot.
+    """
+    last_snapshot = None
+    for i, (kind, _) in enumerate(records):
+        if kind in SNAPSHOT_KINDS:
+            last_snapshot = i
+    if last_snapshot is None:
+        return None
+
+    kind, payload = records[last_snapshot]
+    state = decode_state(payload) if kind == STATE else _read_snapshot(payload)
+    board = state["board"]
+    history = state["history"]
+    rng = state["rng"]
+    rules = get_rules(state["variant"])
+    size = len(board)
+    for kind, payload in records[last_snapshot + 1:]:
+        # Moves, shuffles and removals each used one RNG stream in the game.
+        if kind in (MOVE, SHUFFLE, REMOVE):
+            rng.counter += 1
+        if kind == MOVE:
+            direction, cell, exponent, accumulated_time = _MOVE.unpack_from(payload)
+            moved, move_score, _, _ = rules.apply_move(board, direction, animate=False)
+            spawns = payload[_MOVE.size:]
+            if cell != NO_SPAWN:
+                board[cell // size][cell % size] = 1 << exponent
+            for i in range(0, len(spawns) - 1, 2):
+                board[spawns[i] // size][spawns[i] % size] = 1 << spawns[i + 1]
+            state["score"] += move_score
+            state["moves"] += 1
+            state["accumulated_time"] = accumulated_time
+            history.push(board, state["score"], state["moves"], accumulated_time)
+        elif kind == SWAP:
+            a, b, accumulated_time = _SWAP.unpack(payload)
+            r1, c1, r2, c2 = a // size, a % size, b // size, b % size
+            board[r1][c1], board[r2][c2] = board[r2][c2], board[r1][c1]
+            state["moves"] += 1
+            state["accumulated_time"] = accumulated_time
+            history.push(board, state["score"], state["moves"], accumulated_time)
+        elif kind == SHUFFLE:
+            (accumulated_time,) = _TIME.unpack_from(payload)
+            perm = payload[_TIME.size:]
+            flat = [val for row in board for val in row]
+            tiles = iter(flat[src] for src in perm)
+            new_flat = [next(tiles) if val else 0 for val in flat]
+            board = [new_flat[r * size:(r + 1) * size] for r in range(size)]
+            state["accumulated_time"] = accumulated_time
+            history.push(board, state["score"], state["moves"], accumulated_time)
+        elif kind == REMOVE:
+            for cell in payload:
+                board[cell // size][cell % size] = 0
+        elif kind in (UNDO, REDO):
+            entry = history.undo() if kind == UNDO else history.redo()
+            if entry:
+                board, state["score"], state["moves"], state["accumulated_time"] = entry
+    state["board"] = board
+    state["history"] = history
+    return state
+
+
+def load_journal(path=JOURNAL_FILE):
+    """
+    Returns: the load_game()-style dict replayed from the journal, or None
+    if there is none or it cannot be replayed (load_game() then falls back
+    to the autosaves).
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        records = read_records(data)
+        if records is None:
+            return None
+        return replay_records(records)
+    except (OSError, struct.error, IndexError, ValueError) as e:
+        # A complete but malformed record (bad payload, unknown variant).
+        print("Error loading journal:", e)
+        return None
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+
+from profiler import Histogram
+from server import HOST, OP_CLOSE, OP_TEXT, PORT, encode_frame, read_frame, read_http_message, ws_accept_key
+
+# --- Load generator for server.py ---
+#
+# Opens --connections client connections, creates --sessions games spread
+# across them, then has every connection play --moves random moves in each
+# of its sessions, one request in flight per connection. Round-trip latency
+# of every move is folded into a profiler.Histogram; the server's own
+# per-move processing time comes from its /stats endpoint.
+#
+#   python server.py --store ''
+#   python loadgen.py --sessions 2000 --connections 50 --moves 100 [--http]
+
+DIRECTIONS = ("up", "down", "left", "right")
+
+
+class WebSocketClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write((f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+                     .encode("latin-1"))
+        (_, status, _), headers, _ = await read_http_message(reader)
+        if status != "101" or headers.get("sec-websocket-accept") != ws_accept_key(key):
+            raise ConnectionError(f"WebSocket handshake failed with status {status}")
+        return cls(reader, writer)
+
+    async def request(self, message):
+        self.writer.write(encode_frame(json.dumps(message).encode("utf-8"), OP_TEXT, mask=True))
+        opcode, payload = await read_frame(self.reader)
+        if opcode != OP_TEXT:
+            raise ConnectionError("server closed the WebSocket")
+        return json.loads(payload)
+
+    async def close(self):
+        self.writer.write(encode_frame(b"\x03\xe8", OP_CLOSE, mask=True))
+        self.writer.close()
+
+
+class HttpClient:
+    def __init__(self, reader, writer, host):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, f"{host}:{port}")
+
+    async def call(self, method, path, message=None):
+        body = json.dumps(message).encode("utf-8") if message is not None else b""
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+                          .encode("latin-1") + body)
+        _, _, payload = await read_http_message(self.reader)
+        return json.loads(payload)
+
+    async def request(self, message):
+        """Map a WebSocket-style message onto the HTTP routes."""
+        action = message["action"]
+        if action == "create":
+            return await self.call("POST", "/sessions", {"size": message["size"], "seed": message["seed"]})
+        return await self.call("POST", f"/sessions/{message['id']}/{action}", message)
+
+    async def close(self):
+        self.writer.close()
+
+
+async def run_connection(client, sessions, moves, size, rng, latency):
+    """Create this connection's sessions, then play moves rounds over all of them."""
+    ids = []
+    for _ in range(sessions):
+        state = await client.request({"action": "create", "size": size, "seed": rng.getrandbits(63)})
+        ids.append(state["id"])
+    game_overs = 0
+    for _ in range(moves):
+        for session_id in ids:
+            start = time.perf_counter()
+            state = await client.request({"action": "move", "id": session_id, "direction": rng.choice(DIRECTIONS)})
+            latency.add(time.perf_counter() - start)
+            if state.get("game_over"):
+                game_overs += 1
+                await client.request({"action": "undo", "id": session_id})
+    await client.close()
+    return game_overs
+
+
+async def run(args):
+    client_class = HttpClient if args.http else WebSocketClient
+    clients = [await client_class.connect(args.host, args.port) for _ in range(args.connections)]
+    latency = Histogram()
+    rng = random.Random(args.seed)
+    per_connection = [args.sessions // args.connections + (i < args.sessions % args.connections)
+                      for i in range(args.connections)]
+    start = time.perf_counter()
+    game_overs = await asyncio.gather(*(
+        run_connection(client, sessions, args.moves, args.size, random.Random(rng.getrandbits(64)), latency)
+        for client, sessions in zip(clients, per_connection)))
+    elapsed = time.perf_counter() - start
+
+    stats = await (await HttpClient.connect(args.host, args.port)).call("GET", "/stats")
+    print(f"{'http' if args.http else 'websocket'}: {args.connections} connections, {args.sessions} sessions, "
+          f"{latency.count} moves in {elapsed:.2f}s ({latency.count / elapsed:.0f} moves/s, "
+          f"{sum(game_overs)} game overs undone)")
+    print(f"round trip ms: mean {latency.mean() * 1000:.3f}, p50 {latency.quantile(0.5) * 1000:.3f}, "
+          f"p90 {latency.quantile(0.9) * 1000:.3f}, p99 {latency.quantile(0.99) * 1000:.3f}, "
+          f"max {latency.max * 1000:.3f}")
+    print(f"server: {stats['sessions']} sessions, move processing us p50 {stats['move_us_p50']}, "
+          f"p99 {stats['move_us_p99']}, max {stats['move_us_max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive server.py with many concurrent game sessions.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--moves", type=int, default=100, help="moves per session")
+    parser.add_argument("--size", type=int, default=4, help="board size of the created sessions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--http", action="store_true", help="use the HTTP endpoints instead of one WebSocket per connection")
+    args = parser.parse_args()
+    args.connections = max(1, min(args.connections, args.sessions))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
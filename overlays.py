@@ -0,0 +1,265 @@
+import time
+
+import pygame
+
+from fonts import get_font, render_static, CachedText
+
+# --- Overlay stack ---
+#
+# Confirm dialogs, toast messages and the undo fade are objects on a stack
+# that the single main loop updates and draws, instead of each running its
+# own blocking event loop. Every overlay renders its surfaces once when it is
+# created, so a frame only blits. Only modal overlays (the confirm dialog)
+# take input; toasts and fades let every event through to the game, so
+# play, the timer and animations carry on underneath them.
+#
+# A finished modal leaves (action, result) behind for the main loop to act
+# on, e.g. ("shuffle", True) once the player typed "yes".
+
+OVERLAY_COLOR = (50, 50, 50, 200)
+PROMPT_COLOR = (255, 182, 193)
+MESSAGE_COLOR = (255, 255, 255)
+
+
+class Toast:
+    """A message box that disappears after `duration` seconds without blocking input."""
+
+    modal = False
+    animating = False
+    version = 0
+
+    def __init__(self, message, duration, screen_rect, scale=1.0):
+        font = get_font(int(24 * scale))
+        lines = [font.render(line, True, MESSAGE_COLOR) for line in message.split("\n")]
+        line_height = font.get_linesize()
+        padding = int(16 * scale)
+        width = min(screen_rect.width, max(line.get_width() for line in lines) + 2 * padding)
+        height = len(lines) * line_height + 2 * padding
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        pygame.draw.rect(self.surface, OVERLAY_COLOR, self.surface.get_rect(), border_radius=int(12 * scale))
+        for i, line in enumerate(lines):
+            line_rect = line.get_rect(center=(width // 2, padding + i * line_height + line_height // 2))
+            self.surface.blit(line, line_rect)
+        self.rect = self.surface.get_rect(center=screen_rect.center)
+        self.expires = time.time() + duration
+
+    def update(self, now):
+        return now < self.expires
+
+    def seconds_left(self, now):
+        return self.expires - now
+
+    def handle_event(self, event):
+        return False
+
+    def draw(self, surface):
+        surface.blit(self.surface, self.rect)
+
+
+class ConfirmDialog:
+    """
+    Full-screen "type yes to confirm" prompt. Takes all input while it is on
+    top; Enter answers, Escape cancels.
+    """
+
+    modal = True
+    animating = False
+
+    def __init__(self, prompt_text, action, screen_rect, scale=1.0):
+        self.action = action
+        self.result = None
+        self.answer = ""
+        self.version = 0
+        self.rect = screen_rect
+        self.scale = scale
+        self.surface = pygame.Surface(screen_rect.size, pygame.SRCALPHA)
+        self.surface.fill(OVERLAY_COLOR)
+        center_x, center_y = screen_rect.width // 2, screen_rect.height // 2
+        text = render_static(int(32 * scale), prompt_text, PROMPT_COLOR)
+        self.surface.blit(text, text.get_rect(center=(center_x, center_y - int(20 * scale))))
+        input_prompt = render_static(int(28 * scale), "输入答案：", MESSAGE_COLOR)
+        self.surface.blit(input_prompt, input_prompt.get_rect(center=(center_x, center_y + int(20 * scale))))
+        self.answer_text = CachedText(get_font(int(28 * scale)), MESSAGE_COLOR)
+        self.answer_center = (screen_rect.x + center_x, screen_rect.y + center_y + int(60 * scale))
+
+    def update(self, now):
+        return self.result is None
+
+    def seconds_left(self, now):
+        return None
+
+    def handle_event(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_RETURN:
+                self.result = self.answer.lower() == "yes"
+            elif event.key == pygame.K_ESCAPE:
+                self.result = False
+            elif event.key == pygame.K_BACKSPACE:
+                self.answer = self.answer[:-1]
+            elif len(self.answer) < 10:
+                self.answer += event.unicode
+            self.version += 1
+        return True
+
+    def draw(self, surface):
+        surface.blit(self.surface, self.rect)
+        answer = self.answer_text.render(self.answer)
+        answer_rect = answer.get_rect(center=self.answer_center)
+        surface.blit(answer, answer_rect)
+        pygame.draw.line(surface, MESSAGE_COLOR,
+                         (answer_rect.left, answer_rect.bottom + 2),
+                         (answer_rect.right, answer_rect.bottom + 2), 2)
+
+
+class Fade:
+    """Fades a captured image of a screen region (the board before an undo) out over `duration` seconds."""
+
+    modal = False
+    animating = True
+    version = 0
+
+    def __init__(self, surface, rect, duration=1.5):
+        self.surface = surface
+        self.rect = rect
+        self.start = time.time()
+        self.duration = duration
+
+    def update(self, now):
+        elapsed = now - self.start
+        if elapsed >= self.duration:
+            return False
+        # Surface alpha is applied at blit time, so no per-frame copy is needed.
+        self.surface.set_alpha(int(255 * (1 - elapsed / self.duration)))
+        return True
+
+    def seconds_left(self, now):
+        return None
+
+    def handle_event(self, event):
+        return False
+
+    def draw(self, surface):
+        surface.blit(self.surface, self.rect)
+
+
+class OverlayStack:
+    def __init__(self):
+        self.overlays = []
+        self.results = []
+
+    def push(self, overlay):
+        # A new toast or fade replaces the one already showing; a dialog
+        # clears any toast so the two never overlap.
+        if overlay.modal:
+            self.overlays = [o for o in self.overlays if not isinstance(o, Toast)]
+        else:
+            self.overlays = [o for o in self.overlays if type(o) is not type(overlay)]
+        self.overlays.append(overlay)
+
+    def modal_active(self):
+        return any(o.modal for o in self.overlays)
+
+    def animating(self):
+        return any(o.animating for o in self.overlays)
+
+    def key(self):
+        """Changes whenever an overlay appears, disappears or redraws differently."""
+        return tuple((id(o), o.version) for o in self.overlays)
+
+    def handle_event(self, event):
+        """Returns: True if a modal overlay consumed the event."""
+        for overlay in reversed(self.overlays):
+            if overlay.handle_event(event):
+                return True
+        return False
+
+    def update(self, now):
+        alive = []
+        for overlay in self.overlays:
+            if overlay.update(now):
+                alive.append(overlay)
+            elif overlay.modal:
+                self.results.append((overlay.action, overlay.result))
+        self.overlays = alive
+
+    def pop_results(self):
+        results, self.results = self.results, []
+        return results
+
+    def wait_ms(self, now, default_ms):
+        """How long the idle loop may sleep before an overlay needs a redraw."""
+        wait = default_ms
+        for overlay in self.overlays:
+            left = overlay.seconds_left(now)
+            if left is not None:
+                wait = min(wait, max(0, int(left * 1000) + 1))
+        return wait
+
+    def draw(self, surface, clip_rects=None):
+        """Draw every overlay, or only the parts inside clip_rects (the regions redrawn this frame)."""
+        if clip_rects is None:
+            for overlay in self.overlays:
+                overlay.draw(surface)
+            return
+        for rect in clip_rects:
+            covering = [o for o in self.overlays if o.rect.colliderect(rect)]
+            if covering:
+                surface.set_clip(rect)
+                for overlay in covering:
+                    overlay.draw(surface)
+        surface.set_clip(None)
+
+
+class ProfilerHud:
+    """
+    FPS, frame-time percentiles and the slowest phase of a FrameProfiler in a
+    corner panel. Re-rendered every `interval` seconds, not every frame.
+    """
+
+    def __init__(self, profiler, position, scale=1.0, interval=0.5):
+        self.profiler = profiler
+        self.position = position
+        self.font = get_font(max(10, int(18 * scale)))
+        self.padding = int(6 * scale)
+        self.interval = interval
+        self.next_refresh = 0.0
+        self.last_time = time.time()
+        self.last_frames = profiler.frames
+        self.surface = None
+        self.rect = pygame.Rect(position, (0, 0))
+
+    def update(self, now):
+        """Returns: the screen rect to repaint if the panel changed, else None."""
+        if now < self.next_refresh:
+            return None
+        profiler = self.profiler
+        elapsed = now - self.last_time
+        fps = (profiler.frames - self.last_frames) / elapsed if elapsed > 0 else 0.0
+        self.last_time, self.last_frames = now, profiler.frames
+        self.next_refresh = now + self.interval
+        frame = profiler.frame_hist
+        lines = [
+            f"FPS {fps:.0f}",
+            f"frame p50 {frame.quantile(0.5) * 1000:.2f}ms  p99 {frame.quantile(0.99) * 1000:.2f}ms",
+        ]
+        slowest = profiler.slowest_phase()
+        if slowest:
+            lines.append(f"slowest {slowest[0]} p99 {slowest[1] * 1000:.2f}ms")
+        rendered = [self.font.render(line, True, MESSAGE_COLOR) for line in lines]
+        line_height = self.font.get_linesize()
+        width = max(line.get_width() for line in rendered) + 2 * self.padding
+        height = len(rendered) * line_height + 2 * self.padding
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.surface.fill(OVERLAY_COLOR)
+        for i, line in enumerate(rendered):
+            self.surface.blit(line, (self.padding, self.padding + i * line_height))
+        old_rect = self.rect
+        self.rect = self.surface.get_rect(topleft=self.position)
+        return self.rect.union(old_rect)
+
+    def seconds_left(self, now):
+        return max(0.0, self.next_refresh - now)
+
+    def draw(self, surface):
+        if self.surface is not None:
+            surface.blit(self.surface, self.rect)
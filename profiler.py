@@ -0,0 +1,171 @@
+import csv
+import json
+import math
+import time
+
+# --- Frame profiler ---
+#
+# Times the phases of the main loop with begin(phase) / end() pairs and folds
+# every frame into fixed-size histograms, so a long session never grows the
+# recorded data. Phases nest: a phase's time excludes the phases begun inside
+# it (event handling does not count the move and spawn work it triggers).
+#
+# While disabled, begin/end/end_frame are a shared no-op function, so the
+# instrumented loop pays one empty call per hook.
+#
+# Histograms use log-spaced buckets, BUCKETS_PER_OCTAVE per doubling starting
+# at 1 microsecond, which bounds a percentile's error to about 9%.
+
+PHASES = ("events", "move", "spawn", "ai", "draw_board", "draw_info", "save", "display", "idle")
+# Time spent waiting for input or the frame limiter: not part of a frame's work.
+IDLE_PHASE = "idle"
+
+BUCKETS_PER_OCTAVE = 8
+# 1us .. ~16.8s
+BUCKET_COUNT = 24 * BUCKETS_PER_OCTAVE + 1
+
+EXPORT_COLUMNS = ("phase", "count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms", "total_ms")
+
+
+def _noop(*args):
+    pass
+
+
+def bucket_upper(index):
+    """Returns: the upper edge of a histogram bucket in seconds."""
+    return 2.0 ** (index / BUCKETS_PER_OCTAVE) * 1e-6
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        index = int(math.log2(us) * BUCKETS_PER_OCTAVE) + 1 if us >= 1.0 else 0
+        self.counts[min(index, BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Returns: the upper edge of the bucket holding quantile q (0..1), capped at the maximum."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return min(bucket_upper(index), self.max)
+        return self.max
+
+
+class FrameProfiler:
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self.index = {name: i for i, name in enumerate(phases)}
+        self.idle_index = self.index.get(IDLE_PHASE)
+        self.frame_hist = Histogram()
+        self.phase_hists = [Histogram() for _ in phases]
+        self.frames = 0
+        self.enabled = False
+        self._frame_times = [0.0] * len(phases)
+        self._ran = [False] * len(phases)
+        self._stack = []
+        self._frame_start = None
+        self.begin = self.end = self.end_frame = _noop
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            self._frame_start = None
+            self.begin = self._begin
+            self.end = self._end
+            self.end_frame = self._end_frame
+
+    def disable(self):
+        self.enabled = False
+        self._stack.clear()
+        self._frame_times = [0.0] * len(self.phases)
+        self._ran = [False] * len(self.phases)
+        self.begin = self.end = self.end_frame = _noop
+
+    def _begin(self, phase):
+        self._stack.append([self.index[phase], time.perf_counter(), 0.0])
+
+    def _end(self):
+        if not self._stack:
+            # Enabled between this phase's begin() and end().
+            return
+        index, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self._frame_times[index] += elapsed - nested
+        self._ran[index] = True
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def _end_frame(self):
+        """Close the current frame: record its work time and each phase that ran in it."""
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            work = now - self._frame_start
+            if self.idle_index is not None:
+                work -= self._frame_times[self.idle_index]
+            self.frame_hist.add(work)
+            self.frames += 1
+        for i, ran in enumerate(self._ran):
+            if ran:
+                self.phase_hists[i].add(self._frame_times[i])
+                self._frame_times[i] = 0.0
+                self._ran[i] = False
+        self._frame_start = now
+
+    def slowest_phase(self):
+        """Returns: (phase, p99 seconds) of the working phase with the worst p99, or None."""
+        worst = None
+        for name, hist in zip(self.phases, self.phase_hists):
+            if name == IDLE_PHASE or not hist.count:
+                continue
+            p99 = hist.quantile(0.99)
+            if worst is None or p99 > worst[1]:
+                worst = (name, p99)
+        return worst
+
+    def summary(self):
+        """Returns: one row per histogram (the frame first) with the EXPORT_COLUMNS fields."""
+        rows = []
+        for name, hist in [("frame", self.frame_hist)] + list(zip(self.phases, self.phase_hists)):
+            rows.append({
+                "phase": name,
+                "count": hist.count,
+                "mean_ms": round(hist.mean() * 1000, 4),
+                "p50_ms": round(hist.quantile(0.5) * 1000, 4),
+                "p90_ms": round(hist.quantile(0.9) * 1000, 4),
+                "p99_ms": round(hist.quantile(0.99) * 1000, 4),
+                "max_ms": round(hist.max * 1000, 4),
+                "total_ms": round(hist.total * 1000, 4),
+            })
+        return rows
+
+    def export(self, path):
+        """Write the summary to path: CSV for a .csv path, otherwise JSON including the bucket counts."""
+        rows = self.summary()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+            return
+        histograms = {}
+        for name, hist in [("frame", self.frame_hist)] + list(zip(self.phases, self.phase_hists)):
+            histograms[name] = {f"{bucket_upper(i) * 1000:.4f}": n for i, n in enumerate(hist.counts) if n}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"frames": self.frames, "summary": rows, "histograms_ms": histograms}, f, indent=2)
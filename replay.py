@@ -0,0 +1,211 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from game_core import (
+    GRID_SIZE, MAX_HISTORY_SIZE, UP, DOWN, LEFT, RIGHT, init_new_game, remove_random_tile, shuffle_board,
+    write_save_file,
+)
+from history import GameHistory
+from variants import DEFAULT_VARIANT, get_rules
+
+# --- Replay files and headless verifier ---
+#
+# A replay is the game seed plus every input, in order. Because all
+# randomness comes from the seeded GameRng, re-executing the inputs
+# reproduces the game exactly, so the stored final board and score can be
+# audited without trusting the save. Replays are JSON:
+#
+#   {"version": 1, "seed": ..., "size": 4, "variant": "classic", "inputs": ["L", "U", "W3-7", ...],
+#    "board": [...], "score": ..., "moves": ..., "rng_counter": ...}
+#
+# Replays without "variant" (recorded before rule variants) are classic games.
+#
+# Inputs:
+#   U D L R   move (only recorded when the board changed)
+#   W<a>-<b>  swap the tiles at row-major cells a and b
+#   S         shuffle
+#   X         cheat code: remove two random tiles
+#   Z / Y     undo / redo
+#
+#   python replay.py replays/*.json --workers 8
+
+REPLAY_FILE = "savegame.replay.json"
+REPLAY_DIR = "replays"
+REPLAY_VERSION = 1
+
+MOVE_TOKENS = {UP: "U", DOWN: "D", LEFT: "L", RIGHT: "R"}
+TOKEN_MOVES = {token: direction for direction, token in MOVE_TOKENS.items()}
+SHUFFLE, CHEAT, UNDO, REDO = "S", "X", "Z", "Y"
+
+
+def swap_token(cell_a, cell_b, size=GRID_SIZE):
+    return f"W{cell_a[0] * size + cell_a[1]}-{cell_b[0] * size + cell_b[1]}"
+
+
+class ReplayRecorder:
+    """Collects the inputs of one game; the front end records every action here."""
+
+    def __init__(self, seed, size=GRID_SIZE, inputs=None, variant=DEFAULT_VARIANT):
+        self.seed = seed
+        self.size = size
+        self.variant = variant
+        self.inputs = inputs if inputs is not None else []
+
+    def record(self, token):
+        self.inputs.append(token)
+
+    def to_dict(self, board, score, moves, rng):
+        return {
+            "version": REPLAY_VERSION,
+            "seed": self.seed,
+            "size": self.size,
+            "variant": self.variant,
+            "inputs": self.inputs,
+            "board": board,
+            "score": score,
+            "moves": moves,
+            "rng_counter": rng.counter,
+        }
+
+    def save(self, board, score, moves, rng, path=REPLAY_FILE):
+        write_save_file(self.to_dict(board, score, moves, rng), path)
+
+    def archive(self, board, score, moves, rng, directory=REPLAY_DIR):
+        """Keep a finished game's replay as <directory>/<seed>.json."""
+        os.makedirs(directory, exist_ok=True)
+        self.save(board, score, moves, rng, os.path.join(directory, f"{self.seed}.json"))
+
+
+def load_replay(path=REPLAY_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != REPLAY_VERSION:
+            return None
+        return data
+    except Exception as e:
+        print("Error loading replay:", e)
+        return None
+
+
+def resume_recorder(replay, board, score, moves, rng):
+    """
+    Continue recording a loaded game if the replay file on disk ends exactly
+    where the save does. Returns None if it does not (for example a save from
+    before seeded games, or a crash after the last replay write).
+    """
+    if (replay and replay["seed"] == rng.seed and replay["rng_counter"] == rng.counter
+            and replay["board"] == board and replay["score"] == score and replay["moves"] == moves):
+        return ReplayRecorder(replay["seed"], replay["size"], replay["inputs"],
+                              replay.get("variant", DEFAULT_VARIANT))
+    return None
+
+
+def execute(replay):
+    """
+    Re-run a replay from its seed, applying the same state changes as the
+    game loop. Returns: final board, score, moves and the GameRng.
+    """
+    size = replay["size"]
+    rules = get_rules(replay.get("variant", DEFAULT_VARIANT))
+    board, _, score, moves, _, _, rng = init_new_game(replay["seed"], size, rules)
+    # Same depth as the game, so undo stops where it stopped for the player.
+    history = GameHistory(size, MAX_HISTORY_SIZE)
+    history.push(board, score, moves, 0.0)
+    for token in replay["inputs"]:
+        direction = TOKEN_MOVES.get(token)
+        if direction is not None:
+            moved, move_score, _, _ = rules.apply_move(board, direction, animate=False)
+            if moved:
+                rules.spawn(board, rng.stream())
+                score += move_score
+                moves += 1
+                history.push(board, score, moves, 0.0)
+        elif token[0] == "W":
+            a, b = (int(cell) for cell in token[1:].split("-"))
+            r1, c1, r2, c2 = a // size, a % size, b // size, b % size
+            board[r1][c1], board[r2][c2] = board[r2][c2], board[r1][c1]
+            moves += 1
+            history.push(board, score, moves, 0.0)
+        elif token == SHUFFLE:
+            board = shuffle_board(board, rng.stream())
+            history.push(board, score, moves, 0.0)
+        elif token == CHEAT:
+            stream = rng.stream()
+            remove_random_tile(board, stream)
+            remove_random_tile(board, stream)
+        elif token in (UNDO, REDO):
+            state = history.undo() if token == UNDO else history.redo()
+            if state:
+                board, score, moves, _ = state
+        else:
+            raise ValueError(f"unknown replay input {token!r}")
+    return board, score, moves, rng
+
+
+def verify(replay):
+    """
+    Re-execute a replay and compare it with the result it claims.
+    Returns: a dict with "ok", the claimed and the reproduced score, and
+    "error" if the replay could not be executed.
+    """
+    result = {"seed": replay.get("seed"), "claimed_score": replay.get("score"), "ok": False}
+    try:
+        board, score, moves, rng = execute(replay)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["score"] = score
+    result["moves"] = moves
+    result["ok"] = (board == replay["board"] and score == replay["score"]
+                    and moves == replay["moves"] and rng.counter == replay["rng_counter"])
+    return result
+
+
+def _verify_file(path):
+    replay = load_replay(path)
+    if replay is None:
+        return {"path": path, "ok": False, "error": "unreadable replay"}
+    result = verify(replay)
+    result["path"] = path
+    return result
+
+
+def verify_files(paths, workers=None):
+    """Verify many replay files across a process pool (one worker per core by default)."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(paths)))
+    if workers == 1:
+        return [_verify_file(path) for path in paths]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(_verify_file, paths, chunksize=max(1, len(paths) // (workers * 4)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify 2048 replay files by re-executing them.")
+    parser.add_argument("paths", nargs="+", help="replay JSON files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = verify_files(args.paths, args.workers)
+    elapsed = time.perf_counter() - start
+    failed = [r for r in results if not r["ok"]]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for r in failed:
+            print(f"FAIL {r['path']}: {r.get('error') or 'claimed %s, replayed %s' % (r['claimed_score'], r['score'])}")
+        print(f"{len(results) - len(failed)}/{len(results)} replays verified in {elapsed:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+
+from game_core import MAX_HISTORY_SIZE, GameRng, copy_board
+from history import GameHistory
+from savestore import STORE_FILE, SaveStore, encode_slot, set_aside
+from variants import DEFAULT_VARIANT
+
+# --- Write-behind saver ---
+#
+# The game loop hands snapshots to a background thread through a bounded
+# queue instead of writing the save store itself. A snapshot is a cheap copy
+# of the board, history and RNG, so later changes to the game cannot leak
+# into it. The thread coalesces everything that queued up while it was busy
+# (only the newest snapshot is worth encoding), then encodes it and appends
+# it to the store (savestore.py) as one checksummed record, into the given
+# slot or the autosave rotation. The store is opened on the first write; an
+# unreadable one is moved aside and replaced by a fresh store, and any error
+# while writing is reported without stopping the thread.
+#
+# Durability policy (the default, with neither set, writes every move):
+#   every_n_moves=N   write once N snapshots have accumulated
+#   interval=T        write pending snapshots once T seconds have passed
+# Setting both writes on whichever comes first. flush() and close() always
+# write whatever is pending.
+
+DEFAULT_QUEUE_SIZE = 16
+
+
+class BackgroundSaver:
+    def __init__(self, path=STORE_FILE, slot=None, every_n_moves=None, interval=None,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.path = path
+        self.slot = slot
+        # Opened by the writer thread on its first write (see _open_store).
+        self.store = None
+        if every_n_moves is None and interval is None:
+            every_n_moves = 1
+        self.every_n_moves = every_n_moves
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writes = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="save-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, board, history, score, moves, accumulated_time, rng=None, variant=DEFAULT_VARIANT):
+        """Queue a snapshot of the game; returns immediately."""
+        if isinstance(history, GameHistory):
+            history = history.copy()
+        else:
+            history = GameHistory.from_boards(history, score, moves, accumulated_time, MAX_HISTORY_SIZE)
+        if rng is not None:
+            rng = GameRng(rng.seed, rng.counter)
+        self._put(("snapshot", (copy_board(board), history, score, moves, accumulated_time, rng, variant)))
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is on disk."""
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        """Write pending state and stop the writer thread (call on pygame.QUIT)."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._put(("stop", None))
+        self._thread.join(timeout)
+        if self.store is not None:
+            self.store.close()
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # The writer is a whole queue behind; wait for room instead of
+            # growing without bound.
+            self.queue.put(item)
+
+    def _open_store(self):
+        try:
+            return SaveStore(self.path)
+        except (OSError, ValueError) as e:
+            # A damaged store must not stop the game: keep it for inspection
+            # and start a fresh one.
+            print(f"Error opening save store: {e}; moved to {set_aside(self.path)}")
+            return SaveStore(self.path)
+
+    def _run(self):
+        pending = None
+        pending_count = 0
+        last_write = time.monotonic()
+        while True:
+            timeout = None
+            if pending is not None and self.interval is not None:
+                timeout = max(0.0, last_write + self.interval - time.monotonic())
+            try:
+                kind, payload = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = "tick", None
+
+            waiters = []
+            stop = False
+            # Coalesce the whole burst that is already queued.
+            while True:
+                if kind == "snapshot":
+                    pending = payload
+                    pending_count += 1
+                elif kind == "flush":
+                    waiters.append(payload)
+                elif kind == "stop":
+                    stop = True
+                try:
+                    kind, payload = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            due = bool(waiters) or stop
+            if self.every_n_moves is not None and pending_count >= self.every_n_moves:
+                due = True
+            if self.interval is not None and time.monotonic() - last_write >= self.interval:
+                due = True
+            if pending is not None and due:
+                try:
+                    if self.store is None:
+                        self.store = self._open_store()
+                    self.store.write(self.slot or self.store.next_autosave(), encode_slot(*pending))
+                    self.writes += 1
+                except Exception as e:
+                    # Report and keep going: a dead writer would leave
+                    # flush() and close() waiting forever.
+                    print("Error saving game:", e)
+                pending = None
+                pending_count = 0
+                last_write = time.monotonic()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
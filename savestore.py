@@ -0,0 +1,426 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from game_core import SAVE_FILE, GameRng, make_save_data, read_save_file, write_save_file
+from journal import decode_state, encode_state
+from variants import DEFAULT_VARIANT
+
+# --- Binary multi-slot save store ---
+#
+# Any number of named save slots in one append-only file, read through
+# mmap. Saving a slot appends a record; the newest record of a name wins.
+# Listing slots reads only the small fixed part of each record, and loading
+# a slot decodes that one record, so neither parses the other slots.
+#
+#   header   b"2048SAV2" (a new layout gets a new magic)
+#   record   sync marker, CRC32 of the rest of the record, body length,
+#            kind, body
+#
+#   SLOT     name length, variant length, board size, score, moves, play
+#            time, saved-at (Unix time), then the name (UTF-8), the variant
+#            name and the zlib-compressed journal STATE payload: board,
+#            packed history with per-entry score, moves and time, and RNG
+#   DELETE   name
+#
+# Opening the store checks every record's CRC (without decoding it). A
+# damaged or torn record (crash mid-append) is skipped: the scan resumes at
+# the next sync marker, so every other record stays readable, and loading
+# falls back to the slot's previous record or to the previous autosave.
+# Writes only ever append at the end of the file. Once superseded or damaged
+# records make up most of the file, it is compacted to the newest intact
+# record of every slot and atomically replaced.
+#
+# The game autosaves into a rotation of AUTOSAVE_SLOTS slots, so a damaged
+# newest autosave still leaves the one before it. savegame.json stays the
+# JSON import/export format:
+#
+#   python savestore.py list
+#   python savestore.py import savegame.json --name opening-1
+#   python savestore.py export opening-1 opening-1.json
+#   python savestore.py delete opening-1
+
+STORE_FILE = "savegame.saves"
+MAGIC = b"2048SAV2"
+SYNC = b"\xa5SAV"
+AUTOSAVE_PREFIX = "autosave-"
+AUTOSAVE_SLOTS = 3
+# Compact once the file is this many times the size of its live records
+# (and at least COMPACT_SLACK bytes larger).
+COMPACT_RATIO = 2
+COMPACT_SLACK = 1 << 16
+
+SLOT, DELETE = 1, 2
+_RECORD = struct.Struct("<4sIIB")
+_META = struct.Struct("<BBBQIdd")
+# The CRC covers everything after the sync marker and itself.
+_CRC_END = 8
+
+
+def encode_slot(board, history, score, moves, accumulated_time, rng=None, variant=DEFAULT_VARIANT):
+    """Returns: a game's slot metadata and compressed state, ready for SaveStore.write()."""
+    if rng is None:
+        rng = GameRng()
+    payload = encode_state(board, history, score, moves, accumulated_time, rng, variant)
+    return len(board), score, moves, accumulated_time, variant, zlib.compress(payload)
+
+
+def _record(kind, body):
+    rest = _RECORD.pack(SYNC, 0, len(body), kind)[_CRC_END:] + body
+    return SYNC + struct.pack("<I", zlib.crc32(rest)) + rest
+
+
+def _record_end(data, pos):
+    """Returns: the end of the intact record at pos, or None if there is none."""
+    sync, crc, length, kind = _RECORD.unpack_from(data, pos)
+    end = pos + _RECORD.size + length
+    if sync != SYNC or end > len(data) or kind not in (SLOT, DELETE) or (kind == SLOT and length < _META.size):
+        return None
+    if zlib.crc32(data[pos + _CRC_END:end]) != crc:
+        return None
+    return end
+
+
+class SaveStore:
+    """
+    One save store file. Writes go through this object, which keeps an index
+    of the records per slot; if another SaveStore changes the file, the index
+    is rebuilt on the next call. Use one writer at a time.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self._map = None
+        # name -> (start, end) of each of its records, oldest first.
+        self._slots = {}
+        # (start, end) of every byte range skipped as damaged.
+        self.damaged = []
+        self._end = len(MAGIC)
+        self._stat = None
+        self._scan()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _scan(self):
+        """Rebuild the index from the record headers."""
+        self.close()
+        self._slots = {}
+        self.damaged = []
+        self._end = len(MAGIC)
+        self._stat = self._file_stat()
+        # A file cut short before its header is as good as no file.
+        if self._stat is None or self._stat[1] < len(MAGIC):
+            return
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a save store")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._map
+        pos = len(MAGIC)
+        while pos < len(data):
+            end = _record_end(data, pos) if pos + _RECORD.size <= len(data) else None
+            if end is None:
+                # Damaged, torn or not a record: resume at the next sync marker.
+                resume = data.find(SYNC, pos + 1)
+                resume = len(data) if resume < 0 else resume
+                self.damaged.append((pos, resume))
+                pos = resume
+                continue
+            body = pos + _RECORD.size
+            if data[pos + _RECORD.size - 1] == SLOT:
+                name = data[body + _META.size:body + _META.size + data[body]].decode("utf-8", "replace")
+                self._slots.setdefault(name, []).append((pos, end))
+            else:
+                self._slots.pop(data[body:end].decode("utf-8", "replace"), None)
+            pos = end
+        self._end = pos
+
+    def _refresh(self):
+        if self._file_stat() != self._stat:
+            self._scan()
+
+    def _append(self, kind, body):
+        self._refresh()
+        record = _record(kind, body)
+        new_file = self._stat is None or self._stat[1] < len(MAGIC)
+        # Always at the end of the file: nothing already written is overwritten.
+        with open(self.path, "wb" if new_file else "ab") as f:
+            if new_file:
+                f.write(MAGIC)
+            start = f.tell()
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        end = start + len(record)
+        self.close()
+        # If someone else appended meanwhile, the stale stat makes the next call rescan.
+        if start == self._end:
+            self._stat = self._file_stat()
+            self._end = end
+        return start, end
+
+    def _data(self):
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _intact(self, start, end):
+        return _record_end(self._data(), start) == end
+
+    def _meta(self, start):
+        data = self._data()
+        body = start + _RECORD.size
+        name_length, variant_length, size, score, moves, accumulated_time, saved_at = _META.unpack_from(data, body)
+        name_start = body + _META.size
+        variant_start = name_start + name_length
+        return {
+            "name": data[name_start:variant_start].decode("utf-8", "replace"),
+            "variant": data[variant_start:variant_start + variant_length].decode("ascii", "replace"),
+            "size": size,
+            "score": score,
+            "moves": moves,
+            "accumulated_time": accumulated_time,
+            "saved_at": saved_at,
+        }, variant_start + variant_length
+
+    def _read(self, start, end):
+        """Returns: the load_game()-style dict for one record, or None if it is damaged."""
+        if not self._intact(start, end):
+            return None
+        meta, payload_start = self._meta(start)
+        try:
+            state = decode_state(zlib.decompress(self._data()[payload_start:end]))
+        except (zlib.error, struct.error, IndexError, ValueError):
+            return None
+        state["slot"] = meta["name"]
+        state["saved_at"] = meta["saved_at"]
+        return state
+
+    def names(self):
+        self._refresh()
+        return list(self._slots)
+
+    def __contains__(self, name):
+        self._refresh()
+        return name in self._slots
+
+    def list(self):
+        """
+        Returns: name, variant, size, score, moves, accumulated_time and
+        saved_at of every slot, least recently saved first. Only the
+        metadata of each slot's newest record is decoded.
+        """
+        self._refresh()
+        newest = sorted(records[-1][0] for records in self._slots.values())
+        return [self._meta(start)[0] for start in newest]
+
+    def write(self, name, slot):
+        """Save an encode_slot() result under name, replacing the slot."""
+        encoded_name = name.encode("utf-8")
+        size, score, moves, accumulated_time, variant, payload = slot
+        variant = variant.encode("ascii")
+        if not encoded_name or len(encoded_name) > 255:
+            raise ValueError("a slot name must be 1 to 255 bytes long")
+        body = b"".join([_META.pack(len(encoded_name), len(variant), size, score, moves, accumulated_time,
+                                    time.time()), encoded_name, variant, payload])
+        record = self._append(SLOT, body)
+        self._slots.setdefault(name, []).append(record)
+        if self._end > max(COMPACT_RATIO * self.live_bytes(), len(MAGIC) + COMPACT_SLACK):
+            self.compact()
+
+    def save(self, name, board, history, score, moves, accumulated_time, rng=None, variant=DEFAULT_VARIANT):
+        self.write(name, encode_slot(board, history, score, moves, accumulated_time, rng, variant))
+
+    def load(self, name):
+        """
+        Returns: the load_game()-style dict of a slot (plus "slot" and
+        "saved_at"), from its newest intact record, or None.
+        """
+        self._refresh()
+        for start, end in reversed(self._slots.get(name, [])):
+            state = self._read(start, end)
+            if state is not None:
+                return state
+            print(f"Save slot {name!r} is damaged (record at byte {start}); trying an older copy")
+        return None
+
+    def delete(self, name):
+        self._refresh()
+        if name in self._slots:
+            self._append(DELETE, name.encode("utf-8"))
+            del self._slots[name]
+
+    def live_bytes(self):
+        return sum(records[-1][1] - records[-1][0] for records in self._slots.values())
+
+    def compact(self):
+        """Rewrite the file with only the newest intact record of every slot."""
+        self._refresh()
+        if self._stat is None or self._stat[1] < len(MAGIC):
+            return
+        data = self._data()
+        kept = []
+        for records in self._slots.values():
+            for start, end in reversed(records):
+                if self._intact(start, end):
+                    kept.append((start, end))
+                    break
+        kept.sort()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            for start, end in kept:
+                f.write(data[start:end])
+            f.flush()
+            os.fsync(f.fileno())
+        # The map has to go first: a mapped file cannot be replaced on Windows.
+        self.close()
+        os.replace(tmp_path, self.path)
+        self._scan()
+
+    # --- Autosave rotation ---
+
+    def autosave_names(self):
+        """Returns: the autosave slots that exist, most recently saved first."""
+        self._refresh()
+        names = [AUTOSAVE_PREFIX + str(i + 1) for i in range(AUTOSAVE_SLOTS)]
+        return sorted((name for name in names if name in self._slots),
+                      key=lambda name: self._slots[name][-1][0], reverse=True)
+
+    def next_autosave(self):
+        """Returns: the autosave slot to overwrite next (an unused one, else the oldest)."""
+        used = self.autosave_names()
+        for i in range(AUTOSAVE_SLOTS):
+            name = AUTOSAVE_PREFIX + str(i + 1)
+            if name not in used:
+                return name
+        return used[-1]
+
+    def autosave(self, board, history, score, moves, accumulated_time, rng=None, variant=DEFAULT_VARIANT):
+        name = self.next_autosave()
+        self.save(name, board, history, score, moves, accumulated_time, rng, variant)
+        return name
+
+    def load_autosave(self):
+        """Returns: the most recently written autosave record that loads intact, or None."""
+        records = sorted((record for name in self.autosave_names() for record in self._slots[name]), reverse=True)
+        for start, end in records:
+            state = self._read(start, end)
+            if state is not None:
+                return state
+            print(f"Autosave record at byte {start} is damaged; trying an older one")
+        return None
+
+    # --- JSON import / export ---
+
+    def import_json(self, name, path=SAVE_FILE):
+        """Copy a savegame.json-format file into slot name."""
+        data = read_save_file(path)
+        if data is None:
+            raise ValueError(f"{path} is not a readable save file")
+        self.save(name, data["board"], data["history"], data["score"], data["moves"], data["accumulated_time"],
+                  data["rng"], data.get("variant", DEFAULT_VARIANT))
+
+    def export_json(self, name, path=SAVE_FILE):
+        """Write slot name as a savegame.json-format file."""
+        state = self.load(name)
+        if state is None:
+            raise KeyError(f"no save slot {name!r}")
+        # Classic games export exactly the legacy format.
+        variant = state["variant"] if state["variant"] != DEFAULT_VARIANT else None
+        data = make_save_data(state["board"], state["history"], state["score"], state["moves"],
+                              state["accumulated_time"], state["rng"], variant)
+        write_save_file(data, path)
+
+
+_stores = {}
+
+
+def open_store(path=STORE_FILE):
+    """Returns: a shared SaveStore for path (relative to the current directory)."""
+    key = os.path.abspath(path)
+    if key not in _stores:
+        _stores[key] = SaveStore(key)
+    return _stores[key]
+
+
+def set_aside(path=STORE_FILE):
+    """
+    Move an unreadable store out of the way (to path + ".damaged", replacing
+    an older one) so a fresh store can start in its place.
+    Returns: the new name of the damaged file.
+    """
+    store = _stores.pop(os.path.abspath(path), None)
+    if store is not None:
+        store.close()
+    damaged = path + ".damaged"
+    os.replace(path, damaged)
+    return damaged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, import, export and delete save slots.")
+    parser.add_argument("--store", default=STORE_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the slots")
+    import_parser = commands.add_parser("import", help="copy a savegame.json-format file into a slot")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--name", help="slot name (default: the file name)")
+    export_parser = commands.add_parser("export", help="write a slot as a savegame.json-format file")
+    export_parser.add_argument("name")
+    export_parser.add_argument("path", nargs="?", default=SAVE_FILE)
+    delete_parser = commands.add_parser("delete", help="delete slots")
+    delete_parser.add_argument("names", nargs="+")
+    commands.add_parser("compact", help="drop superseded and deleted records")
+    args = parser.parse_args()
+
+    try:
+        store = SaveStore(args.store)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        if args.command == "list":
+            for slot in store.list():
+                saved = time.strftime("%Y-%m-%d %H:%M", time.localtime(slot["saved_at"]))
+                print(f"{slot['name']:24} {slot['size']}x{slot['size']} {slot['variant']:10} "
+                      f"score {slot['score']:>8}  moves {slot['moves']:>6}  saved {saved}")
+            if store.damaged:
+                print(f"{sum(end - start for start, end in store.damaged)} damaged bytes skipped "
+                      f"(dropped by: python savestore.py compact)")
+        elif args.command == "import":
+            name = args.name or os.path.splitext(os.path.basename(args.path))[0]
+            store.import_json(name, args.path)
+        elif args.command == "export":
+            store.export_json(args.name, args.path)
+        elif args.command == "delete":
+            for name in args.names:
+                if name not in store:
+                    parser.error(f"no save slot {name!r}")
+                store.delete(name)
+        elif args.command == "compact":
+            before = os.path.getsize(store.path) if os.path.exists(store.path) else 0
+            store.compact()
+            after = os.path.getsize(store.path) if os.path.exists(store.path) else 0
+            print(f"{before} -> {after} bytes")
+    except (KeyError, ValueError) as e:
+        parser.error(str(e).strip("'\""))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import bitboard
+from game_core import NUM_TO_TEXT, UP, DOWN, LEFT, RIGHT
+from variants import DEFAULT_VARIANT, PACKED_BLOCKER, VARIANTS, get_rules
+
+# --- Headless self-play benchmark ---
+#
+# Plays complete games on packed bitboards across a process pool (one worker
+# per core by default, each with its own seeded RNG) and reports throughput,
+# score statistics and the distribution of the largest tile reached.
+#
+#   python selfplay.py --games 1000 --policy corner
+#   python selfplay.py --games 20 --policy ai --ai-budget 0.02 --json
+#   python selfplay.py --games 1000 --policy corner --variant fibonacci
+#
+# Other rule variants play on the same packed boards through their compiled
+# tables (variants.Rules.move / legal_moves_packed / spawn_packed).
+
+POLICIES = ("random", "greedy", "corner", "ai")
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+# Preference order for the corner heuristic: keep the big tiles bottom-left.
+CORNER_ORDER = (DOWN, LEFT, RIGHT, UP)
+
+_CELL_SHIFTS = tuple(range(0, 64, 4))
+
+
+def spawn_tile(b, rng):
+    """add_new_tile on a packed board: a random empty cell gets a 2 (90%) or a 4 (10%)."""
+    empty = [shift for shift in _CELL_SHIFTS if not (b >> shift) & 0xF]
+    if not empty:
+        return b
+    shift = rng.choice(empty)
+    exponent = 1 if rng.random() < 0.9 else 2
+    return b | (exponent << shift)
+
+
+def max_tile(b, skip=None):
+    """Returns: the largest tile of a packed board, ignoring nibble value skip (a blocker)."""
+    highest = 0
+    while b:
+        nibble = b & 0xF
+        if nibble != skip:
+            highest = max(highest, nibble)
+        b >>= 4
+    return 1 << highest if highest else 0
+
+
+# Policies get the legal directions from bitboard.legal_moves (one transpose
+# and eight table lookups) and the loop then makes only the chosen move, so a
+# step no longer tries all four moves just to find out which ones are legal.
+
+def _random_policy(b, legal, rng):
+    return rng.choice(legal)
+
+
+def _greedy_policy(b, legal, rng, move=bitboard.move):
+    scores = [(move(b, direction)[1], direction) for direction in legal]
+    best_score = max(score for score, _ in scores)
+    return rng.choice([direction for score, direction in scores if score == best_score])
+
+
+def _corner_policy(b, legal, rng):
+    for direction in CORNER_ORDER:
+        if direction in legal:
+            return direction
+
+
+def _make_policy(name, ai_budget, rules=None):
+    if name == "random":
+        return _random_policy
+    if name == "greedy":
+        if rules is not None:
+            return lambda b, legal, rng: _greedy_policy(b, legal, rng, rules.move)
+        return _greedy_policy
+    if name == "corner":
+        return _corner_policy
+    if name == "ai":
+        if rules is not None:
+            raise ValueError("the ai policy only plays the classic rules")
+        import ai
+        solver = ai.ExpectimaxAI(time_budget=ai_budget)
+        return lambda b, legal, rng: solver.best_move(b)
+    raise ValueError(f"Unknown policy: {name}")
+
+
+def play_game(policy, rng, rules=None):
+    """
+    Play one game from the standard two-tile start (or a variant's start,
+    under variants.Rules) until no move is left.
+    Returns: final score, largest tile and number of moves.
+    """
+    if rules is None:
+        legal_moves, move, spawn = bitboard.legal_moves, bitboard.move, spawn_tile
+        b = spawn_tile(spawn_tile(0, rng), rng)
+        skip = None
+    else:
+        legal_moves, move, spawn = rules.legal_moves_packed, rules.move, rules.spawn_packed
+        b = rules.pack(rules.new_board(bitboard.GRID_SIZE, rng)[0])
+        skip = PACKED_BLOCKER if rules.blockers else None
+    score = 0
+    moves = 0
+    while True:
+        legal = legal_moves(b)
+        if not legal:
+            break
+        new_b, gained = move(b, policy(b, legal, rng))
+        b = spawn(new_b, rng)
+        score += gained
+        moves += 1
+    return score, max_tile(b, skip), moves
+
+
+def _worker(task):
+    worker_index, games, policy_name, seed, ai_budget, variant = task
+    rng = random.Random(seed * 1000003 + worker_index)
+    rules = None if variant == DEFAULT_VARIANT else get_rules(variant)
+    policy = _make_policy(policy_name, ai_budget, rules)
+    results = [play_game(policy, rng, rules) for _ in range(games)]
+    if rules is not None:
+        # Report face values rather than the variant's tile codes.
+        results = [(score, rules.value(tile), moves) for score, tile, moves in results]
+    return results
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run(games, policy="random", workers=None, seed=0, ai_budget=0.02, variant=DEFAULT_VARIANT):
+    """
+    Play `games` games split over `workers` processes.
+    Returns: a dict of aggregate statistics.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, games))
+    tasks = []
+    for i in range(workers):
+        share = games // workers + (1 if i < games % workers else 0)
+        tasks.append((i, share, policy, seed, ai_budget, variant))
+
+    start = time.perf_counter()
+    if workers == 1:
+        chunks = [_worker(tasks[0])]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            chunks = pool.map(_worker, tasks)
+    elapsed = time.perf_counter() - start
+
+    results = [result for chunk in chunks for result in chunk]
+    scores = sorted(score for score, _, _ in results)
+    total_moves = sum(moves for _, _, moves in results)
+    tiles = {}
+    for _, tile, _ in results:
+        tiles[tile] = tiles.get(tile, 0) + 1
+
+    return {
+        "policy": policy,
+        "variant": variant,
+        "games": len(results),
+        "workers": workers,
+        "seconds": elapsed,
+        "games_per_sec": len(results) / elapsed if elapsed else 0.0,
+        "moves_per_sec": total_moves / elapsed if elapsed else 0.0,
+        "score_mean": sum(scores) / len(scores) if scores else 0.0,
+        "score_min": scores[0] if scores else 0,
+        "score_max": scores[-1] if scores else 0,
+        "score_percentiles": {str(p): percentile(scores, p) for p in PERCENTILES},
+        "max_tile_counts": {str(tile): tiles[tile] for tile in sorted(tiles)},
+    }
+
+
+def format_report(stats):
+    lines = [
+        f"policy: {stats['policy']}  variant: {stats['variant']}  games: {stats['games']}  workers: {stats['workers']}",
+        f"time: {stats['seconds']:.2f}s  games/sec: {stats['games_per_sec']:.1f}  moves/sec: {stats['moves_per_sec']:.0f}",
+        f"score: mean {stats['score_mean']:.1f}  min {stats['score_min']}  max {stats['score_max']}",
+        "score percentiles: " + "  ".join(f"p{p} {v}" for p, v in stats["score_percentiles"].items()),
+        "max tile reached:",
+    ]
+    games = stats["games"] or 1
+    reached = 0
+    # Walk from the largest tile down so each line shows "reached at least".
+    for tile, count in sorted(((int(t), c) for t, c in stats["max_tile_counts"].items()), reverse=True):
+        reached += count
+        label = NUM_TO_TEXT.get(tile, str(tile)) if stats["variant"] == DEFAULT_VARIANT else str(tile)
+        lines.append(f"  {label} ({tile}): {count}  ({100.0 * count / games:.1f}%, reached by {100.0 * reached / games:.1f}%)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless 2048 self-play benchmark.")
+    parser.add_argument("--games", type=int, default=200, help="number of complete games to play")
+    parser.add_argument("--policy", choices=POLICIES, default="random")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ai-budget", type=float, default=0.02, help="seconds per move for the ai policy")
+    parser.add_argument("--variant", default=DEFAULT_VARIANT, choices=VARIANTS, help="rule variant (see variants.py)")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    args = parser.parse_args()
+
+    stats = run(args.games, policy=args.policy, workers=args.workers, seed=args.seed, ai_budget=args.ai_budget,
+                variant=args.variant)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(stats))
+
+
+if __name__ == "__main__":
+    main()
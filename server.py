@@ -0,0 +1,586 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+import uuid
+
+from game_core import (
+    GRID_SIZE, MIN_GRID_SIZE, MAX_GRID_SIZE, WIN_TILE, UP, DOWN, LEFT, RIGHT, GameRng, add_new_tile,
+    apply_move, legal_moves, shuffle_board,
+)
+from history import CELL_BITS, GameHistory, pack_state_board, unpack_state_board
+from profiler import Histogram
+
+# --- Multi-session game server ---
+#
+# One asyncio process hosts many games at once. Each session keeps only its
+# board packed into an int (history.pack_state_board), score, move count,
+# GameRng (seed + counter) and a short undo ring, and runs the same core
+# functions as the pygame front end: apply_move, add_new_tile, swaps,
+# shuffle_board and undo/redo, with the same per-action random streams.
+#
+# Protocol: JSON over localhost HTTP/1.1 (keep-alive) or WebSocket.
+#
+#   POST   /sessions                  {"size": 4, "seed": 123} -> state
+#   GET    /sessions/<id>             state
+#   DELETE /sessions/<id>
+#   POST   /sessions/<id>/<action>    move {"direction": "left"}, swap {"a": [r, c], "b": [r, c]},
+#                                     shuffle, undo, redo -> state
+#   GET    /stats                     session count, requests, move latency percentiles
+#   GET    /ws  or  /ws/<id>          WebSocket; each text message is {"action": ..., "id": ...,
+#                                     ...}, answered with the same JSON as HTTP. "create" starts a
+#                                     session; /ws/<id> makes <id> the default "id".
+#
+# Persistence is batched: actions only mark sessions dirty, and every
+# persist_interval seconds the dirty sessions are appended to STORE_FILE in
+# one write and fsync on a worker thread. Later records of a session replace
+# earlier ones; the file is compacted on load and whenever it holds far more
+# records than live sessions. Undo history is kept in memory only.
+#
+# Each session costs about 2 KB in memory, mostly its undo ring. The server
+# refuses new sessions (503) beyond MAX_SESSIONS and deletes sessions nobody
+# has touched for SESSION_IDLE_TIMEOUT seconds, persisting the deletion like
+# a DELETE request.
+#
+#   python server.py --port 8048
+#   python loadgen.py --sessions 2000 --connections 50 --moves 100
+
+HOST = "127.0.0.1"
+PORT = 8048
+STORE_FILE = "server_sessions.db"
+STORE_MAGIC = b"2048SES1"
+PERSIST_INTERVAL = 1.0
+# Compact the store once it holds this many records per live session.
+COMPACT_RATIO = 4
+# Undo depth per session (GameHistory capacity), kept small so sessions stay compact.
+SESSION_HISTORY = 32
+MAX_SESSIONS = 50000
+SESSION_IDLE_TIMEOUT = 24 * 3600
+# Seconds between sweeps for idle sessions.
+EXPIRE_INTERVAL = 60.0
+MAX_BODY = 1 << 16
+
+DIRECTIONS = {"up": UP, "down": DOWN, "left": LEFT, "right": RIGHT, "U": UP, "D": DOWN, "L": LEFT, "R": RIGHT}
+DIRECTION_NAMES = {UP: "up", DOWN: "down", LEFT: "left", RIGHT: "right"}
+
+# Store records: kind, session id, then for SAVE the size, score, moves,
+# seed, RNG counter and the packed board.
+RECORD_SAVE, RECORD_DELETE = 1, 2
+_SAVE = struct.Struct("<B16sBQIQI")
+_DELETE = struct.Struct("<B16s")
+
+
+class RequestError(Exception):
+    """A bad request: answered with this HTTP status and message instead of a state."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _packed_board_bytes(size):
+    return (size * size * CELL_BITS + 7) // 8
+
+
+class Session:
+    __slots__ = ("id", "size", "board", "score", "moves", "rng", "history", "last_used")
+
+    def __init__(self, session_id, size, board, score, moves, rng):
+        self.id = session_id
+        self.size = size
+        self.board = board
+        self.score = score
+        self.moves = moves
+        self.rng = rng
+        self.last_used = time.monotonic()
+        self.history = GameHistory(size, SESSION_HISTORY)
+        self.history.push(unpack_state_board(board, size), score, moves, 0.0)
+
+    def record(self):
+        size = self.size
+        header = _SAVE.pack(RECORD_SAVE, bytes.fromhex(self.id), size, self.score, self.moves,
+                            self.rng.seed, self.rng.counter)
+        return header + self.board.to_bytes(_packed_board_bytes(size), "little")
+
+
+def _parse_cell(value, size):
+    try:
+        row, col = (int(v) for v in value)
+    except (TypeError, ValueError):
+        raise RequestError(400, "cells are [row, col]")
+    if not (0 <= row < size and 0 <= col < size):
+        raise RequestError(400, "cell outside the board")
+    return row, col
+
+
+def _parse_id(value):
+    """Session ids are the 32 hex digits handed out by create; anything else is refused, never echoed."""
+    if not isinstance(value, str) or len(value) != 32:
+        raise RequestError(400, "id must be a session id")
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        raise RequestError(400, "id must be a session id")
+    return value
+
+
+class SessionStore:
+    def __init__(self):
+        self.sessions = {}
+        self.dirty = set()
+        self.deleted = set()
+        self.move_latency = Histogram()
+        self.actions = 0
+
+    def create(self, size=GRID_SIZE, seed=None):
+        if not isinstance(size, int) or not MIN_GRID_SIZE <= size <= MAX_GRID_SIZE:
+            raise RequestError(400, f"size must be between {MIN_GRID_SIZE} and {MAX_GRID_SIZE}")
+        if seed is not None and (not isinstance(seed, int) or not 0 <= seed < 1 << 63):
+            raise RequestError(400, "seed must be a non-negative 63-bit integer")
+        if len(self.sessions) >= MAX_SESSIONS:
+            raise RequestError(503, "too many sessions")
+        # Same start as init_new_game: two tiles from the game's first random stream.
+        rng = GameRng(seed)
+        stream = rng.stream()
+        board = [[0] * size for _ in range(size)]
+        add_new_tile(board, stream)
+        add_new_tile(board, stream)
+        session = Session(uuid.uuid4().hex, size, pack_state_board(board), 0, 0, rng)
+        self.sessions[session.id] = session
+        self.dirty.add(session.id)
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise RequestError(404, "no such session")
+        session.last_used = time.monotonic()
+        return session
+
+    def delete(self, session_id):
+        self.get(session_id)
+        del self.sessions[session_id]
+        self.dirty.discard(session_id)
+        self.deleted.add(session_id)
+
+    def expire(self, now=None, timeout=SESSION_IDLE_TIMEOUT):
+        """Delete every session idle for longer than timeout seconds. Returns: how many were deleted."""
+        cutoff = (time.monotonic() if now is None else now) - timeout
+        idle = [session_id for session_id, session in self.sessions.items() if session.last_used < cutoff]
+        for session_id in idle:
+            del self.sessions[session_id]
+            self.dirty.discard(session_id)
+            self.deleted.add(session_id)
+        return len(idle)
+
+    def state(self, session, board=None):
+        if board is None:
+            board = unpack_state_board(session.board, session.size)
+        legal = legal_moves(board)
+        return {
+            "id": session.id,
+            "size": session.size,
+            "board": board,
+            "score": session.score,
+            "moves": session.moves,
+            "legal": [DIRECTION_NAMES[d] for d in legal],
+            "game_over": not legal,
+            "won": max(map(max, board)) >= WIN_TILE,
+        }
+
+    def act(self, session, action, message):
+        """
+        Apply one action to a session the way the game loop does.
+        Returns: the session state after it, plus "changed".
+        """
+        start = time.perf_counter()
+        size = session.size
+        board = unpack_state_board(session.board, size)
+        changed = False
+        if action == "move":
+            direction = DIRECTIONS.get(message.get("direction"))
+            if direction is None:
+                raise RequestError(400, "direction must be up, down, left or right")
+            moved, gained, _, _ = apply_move(board, direction, animate=False)
+            if moved:
+                add_new_tile(board, session.rng.stream())
+                session.score += gained
+                session.moves += 1
+                changed = True
+        elif action == "swap":
+            r1, c1 = _parse_cell(message.get("a"), size)
+            r2, c2 = _parse_cell(message.get("b"), size)
+            board[r1][c1], board[r2][c2] = board[r2][c2], board[r1][c1]
+            session.moves += 1
+            changed = True
+        elif action == "shuffle":
+            board = shuffle_board(board, session.rng.stream())
+            changed = True
+        elif action in ("undo", "redo"):
+            restored = session.history.undo() if action == "undo" else session.history.redo()
+            if restored:
+                board, session.score, session.moves, _ = restored
+                session.board = pack_state_board(board)
+                self.dirty.add(session.id)
+                changed = True
+        elif action != "state":
+            raise RequestError(400, f"unknown action {action!r}")
+        if changed and action not in ("undo", "redo"):
+            session.board = pack_state_board(board)
+            session.history.push(board, session.score, session.moves, 0.0)
+            self.dirty.add(session.id)
+        state = self.state(session, board)
+        state["changed"] = changed
+        self.actions += 1
+        if action == "move":
+            self.move_latency.add(time.perf_counter() - start)
+        return state
+
+    def handle(self, message, default_id=None):
+        """Run a WebSocket-style message ({"action": ..., "id": ...}). Returns: the response dict."""
+        action = message.get("action")
+        if action == "create":
+            session = self.create(message.get("size", GRID_SIZE), message.get("seed"))
+            return self.state(session)
+        session_id = message.get("id", default_id)
+        if session_id is None:
+            raise RequestError(400, "missing session id")
+        session_id = _parse_id(session_id)
+        if action == "delete":
+            self.delete(session_id)
+            return {"id": session_id, "deleted": True}
+        return self.act(self.get(session_id), action, message)
+
+    def stats(self):
+        latency = self.move_latency
+        return {
+            "sessions": len(self.sessions),
+            "actions": self.actions,
+            "moves": latency.count,
+            "move_us_p50": round(latency.quantile(0.5) * 1e6, 1),
+            "move_us_p99": round(latency.quantile(0.99) * 1e6, 1),
+            "move_us_max": round(latency.max * 1e6, 1),
+        }
+
+    # --- Persistence ---
+
+    def take_batch(self):
+        """Returns: the store records for every session changed since the last batch."""
+        records = [_DELETE.pack(RECORD_DELETE, bytes.fromhex(session_id)) for session_id in self.deleted]
+        records += [self.sessions[session_id].record() for session_id in self.dirty]
+        self.dirty.clear()
+        self.deleted.clear()
+        return b"".join(records), len(records)
+
+    def snapshot(self):
+        return STORE_MAGIC + b"".join(session.record() for session in self.sessions.values())
+
+    def load(self, data):
+        """Rebuild the sessions from store file contents. Returns: the number of records read."""
+        if not data.startswith(STORE_MAGIC):
+            return 0
+        pos = len(STORE_MAGIC)
+        records = 0
+        while pos < len(data):
+            kind = data[pos]
+            if kind == RECORD_DELETE and pos + _DELETE.size <= len(data):
+                _, raw_id = _DELETE.unpack_from(data, pos)
+                self.sessions.pop(raw_id.hex(), None)
+                pos += _DELETE.size
+            elif kind == RECORD_SAVE and pos + _SAVE.size <= len(data):
+                _, raw_id, size, score, moves, seed, counter = _SAVE.unpack_from(data, pos)
+                end = pos + _SAVE.size + _packed_board_bytes(size)
+                if end > len(data):
+                    break
+                board = int.from_bytes(data[pos + _SAVE.size:end], "little")
+                session = Session(raw_id.hex(), size, board, score, moves, GameRng(seed, counter))
+                self.sessions[session.id] = session
+                pos = end
+            else:
+                # A torn last batch (crash mid-write): keep everything before it.
+                break
+            records += 1
+        return records
+
+
+def _write_file(path, data, append):
+    with open(path, "ab" if append else "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _replace_file(path, data):
+    tmp_path = path + ".tmp"
+    _write_file(tmp_path, data, append=False)
+    os.replace(tmp_path, path)
+
+
+# --- WebSocket framing (RFC 6455, unfragmented text messages) ---
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 1, 8, 9, 10
+
+
+def ws_accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def _apply_mask(payload, mask):
+    if not payload:
+        return payload
+    key = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")).to_bytes(len(payload), "little")
+
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    """Servers send unmasked frames; clients must mask theirs."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, (0x80 if mask else 0) | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, (0x80 if mask else 0) | 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, (0x80 if mask else 0) | 127, length)
+    if mask:
+        key = os.urandom(4)
+        return header + key + _apply_mask(payload, key)
+    return header + payload
+
+
+async def read_frame(reader):
+    """Returns: (opcode, payload) of the next frame."""
+    first, second = await reader.readexactly(2)
+    if not first & 0x80:
+        raise RequestError(400, "fragmented WebSocket messages are not supported")
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY:
+        raise RequestError(413, "message too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    return first & 0x0F, _apply_mask(payload, mask) if mask else payload
+
+
+# --- HTTP ---
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            503: "Service Unavailable"}
+
+
+async def read_http_message(reader):
+    """
+    Read one request or response head and body.
+    Returns: (start line parts, lower-cased headers, body), or None at end of stream.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise RequestError(413, "body too large")
+    body = await reader.readexactly(length) if length else b""
+    return lines[0].split(" ", 2), headers, body
+
+
+def _http_response(status, data):
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+class GameServer:
+    def __init__(self, store_path=STORE_FILE, persist_interval=PERSIST_INTERVAL):
+        self.store = SessionStore()
+        self.store_path = store_path
+        self.persist_interval = persist_interval
+        self.records_in_file = 0
+        self.requests = 0
+
+    def load(self):
+        if self.store_path and os.path.exists(self.store_path):
+            with open(self.store_path, "rb") as f:
+                self.store.load(f.read())
+        if self.store_path:
+            # Start from a compact file holding exactly the live sessions.
+            _replace_file(self.store_path, self.store.snapshot())
+            self.records_in_file = len(self.store.sessions)
+
+    async def persist(self):
+        """Append the changed sessions as one batch; compact the file when it has grown stale."""
+        if not self.store_path:
+            return
+        loop = asyncio.get_running_loop()
+        live = len(self.store.sessions)
+        if self.records_in_file > COMPACT_RATIO * live + 1024:
+            # The snapshot includes every dirty session, so the pending batch is dropped.
+            self.store.take_batch()
+            await loop.run_in_executor(None, _replace_file, self.store_path, self.store.snapshot())
+            self.records_in_file = live
+            return
+        batch, count = self.store.take_batch()
+        if count:
+            await loop.run_in_executor(None, _write_file, self.store_path, batch, True)
+            self.records_in_file += count
+
+    async def persist_loop(self):
+        last_expire = time.monotonic()
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            now = time.monotonic()
+            if now - last_expire >= EXPIRE_INTERVAL:
+                last_expire = now
+                self.store.expire(now)
+            try:
+                await self.persist()
+            except OSError as e:
+                print("Error persisting sessions:", e)
+
+    def route(self, method, path, body):
+        """Returns: (status, response dict) for one HTTP request."""
+        parts = [part for part in path.split("?", 1)[0].split("/") if part]
+        try:
+            message = json.loads(body) if body else {}
+        except ValueError:
+            raise RequestError(400, "body is not JSON")
+        if not isinstance(message, dict):
+            raise RequestError(400, "body must be a JSON object")
+        store = self.store
+        if parts == ["stats"] and method == "GET":
+            stats = store.stats()
+            stats["requests"] = self.requests
+            return 200, stats
+        if not parts or parts[0] != "sessions" or len(parts) > 3:
+            raise RequestError(404, "no such endpoint")
+        if len(parts) == 1:
+            if method != "POST":
+                raise RequestError(405, "use POST to create a session")
+            return 200, store.state(store.create(message.get("size", GRID_SIZE), message.get("seed")))
+        session_id = parts[1]
+        if len(parts) == 2:
+            if method == "GET":
+                return 200, store.state(store.get(session_id))
+            if method == "DELETE":
+                store.delete(session_id)
+                return 200, {"id": session_id, "deleted": True}
+            raise RequestError(405, "use GET or DELETE")
+        if method != "POST":
+            raise RequestError(405, "use POST for actions")
+        return 200, store.act(store.get(session_id), parts[2], message)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_http_message(reader)
+                    if request is None:
+                        break
+                    (method, path, _), headers, body = request
+                    if headers.get("upgrade", "").lower() == "websocket":
+                        await self.websocket(reader, writer, path, headers)
+                        break
+                    self.requests += 1
+                    status, data = self.route(method, path, body)
+                except RequestError as e:
+                    status, data = e.status, {"error": str(e)}
+                except (ValueError, asyncio.LimitOverrunError):
+                    status, data = 400, {"error": "malformed request"}
+                writer.write(_http_response(status, data))
+                await writer.drain()
+                if status == 413:
+                    # The oversized body was never read, so the stream cannot be resynchronised.
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def websocket(self, reader, writer, path, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            raise RequestError(400, "missing Sec-WebSocket-Key")
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept_key(key)}\r\n\r\n").encode("latin-1"))
+        parts = [part for part in path.split("/") if part]
+        default_id = parts[1] if len(parts) == 2 else None
+        while True:
+            try:
+                opcode, payload = await read_frame(reader)
+            except RequestError:
+                # 1009: message too big (or one we cannot process).
+                writer.write(encode_frame(struct.pack("!H", 1009), OP_CLOSE))
+                await writer.drain()
+                return
+            if opcode == OP_CLOSE:
+                writer.write(encode_frame(payload[:2], OP_CLOSE))
+                await writer.drain()
+                return
+            if opcode == OP_PING:
+                writer.write(encode_frame(payload, OP_PONG))
+                continue
+            if opcode != OP_TEXT:
+                continue
+            self.requests += 1
+            try:
+                message = json.loads(payload)
+                if not isinstance(message, dict):
+                    raise RequestError(400, "messages must be JSON objects")
+                response = self.store.handle(message, default_id)
+            except RequestError as e:
+                response = {"error": str(e), "status": e.status}
+            except ValueError:
+                response = {"error": "message is not JSON", "status": 400}
+            writer.write(encode_frame(json.dumps(response, separators=(",", ":")).encode("utf-8")))
+            await writer.drain()
+
+    async def serve(self, host=HOST, port=PORT, ready=None):
+        self.load()
+        # Build the default size's move tables now rather than inside the first move.
+        board = [[2] + [0] * (GRID_SIZE - 1) for _ in range(GRID_SIZE)]
+        apply_move(board, RIGHT, animate=False)
+        legal_moves(board)
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        persister = asyncio.create_task(self.persist_loop())
+        print(f"Serving {len(self.store.sessions)} sessions on http://{host}:{port}", flush=True)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            persister.cancel()
+            await self.persist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-session 2048 server (JSON over HTTP and WebSocket).")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--store", default=STORE_FILE, help="session store file ('' to keep sessions in memory only)")
+    parser.add_argument("--persist-interval", type=float, default=PERSIST_INTERVAL,
+                        help="seconds between batched writes of changed sessions")
+    args = parser.parse_args()
+    server = GameServer(args.store, args.persist_interval)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
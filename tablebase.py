@@ -0,0 +1,287 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+import numpy as np
+
+import batch_sim
+from bitboard import trace_line
+from game_core import UP, DOWN, LEFT, RIGHT, legal_moves
+
+# --- 3x3 endgame tablebase ---
+#
+# For every 3x3 board whose tiles are all below TARGET, the probability of
+# reaching TARGET under perfect play and the move that achieves it, computed
+# by retrograde analysis and stored in one memory-mapped file. A lookup is
+# an index computation and one read: no search.
+#
+# Boards are indexed densely: cell c (row * 3 + col) holding exponent e
+# contributes e * k**c, with k = log2(TARGET), so the table has k**9
+# entries. A move never changes the tile sum and a spawn adds 2 or 4, so the
+# boards of one tile sum depend only on the sums 2 and 4 above it: the build
+# fills the sums from the largest down, each "layer" split into chunks
+# that worker processes evaluate in parallel against the layers already
+# written. Spawns follow add_new_tile: a uniformly chosen empty cell gets a
+# 2 with probability 0.9 and a 4 otherwise. A move that creates TARGET
+# wins outright; a board without legal moves is lost.
+#
+# Each entry is a little-endian uint16: the probability quantised to 14
+# bits, shifted left by 2, plus the best direction. The build keeps exact
+# float32 values in a scratch file next to the table while it runs.
+#
+# Each layer is assembled from the 3-cell rows grouped by their own tile
+# sum. Besides the scratch file, the build therefore keeps one byte per
+# board (the best moves) and a single layer's indices in memory, instead of
+# sorting all k**9 boards by sum (several GB at the default target).
+#
+# 4x4 boards are out of reach of a dense table: even tiles up to 64 give
+# 7**16 (3e13) entries. Constrained 4x4 endgames do not shrink that enough
+# to help: a slice must be closed under moves and spawns, so a restricted
+# tile set still needs every value below its target (tiles up to 8 already
+# give 4**16 entries, 8.6 GB), and cells fixed to given tiles do not stay
+# fixed, since every move slides them. Only the 3x3 game is tabulated.
+#
+#   python tablebase.py --target 256 --workers 8     (builds TABLEBASE_FILE)
+
+SIZE = 3
+CELLS = SIZE * SIZE
+TARGET = 256
+TABLEBASE_FILE = "tablebase_3x3.bin"
+MAGIC = b"2048TB01"
+# magic, board size, target exponent, entry count; entries start at HEADER_SIZE.
+_HEADER = struct.Struct("<8sBBQ")
+HEADER_SIZE = 32
+PROBABILITY_BITS = 14
+PROBABILITY_SCALE = (1 << PROBABILITY_BITS) - 1
+CHUNK_STATES = 1 << 18
+SPAWN_TWO = 0.9
+
+
+def _exponent(target):
+    if target < 8 or target & (target - 1):
+        raise ValueError("the target must be a power of two of at least 8")
+    return target.bit_length() - 1
+
+
+def _row_tables(k):
+    """
+    Left moves of every 3-cell row of exponents below k, rows indexed like
+    the board (cell i contributes e * k**i).
+    Returns: new row indices and per-row win flags (the move made 2**k).
+    """
+    new_rows = np.zeros(k ** SIZE, dtype=np.int64)
+    wins = np.zeros(k ** SIZE, dtype=bool)
+    for row in range(k ** SIZE):
+        exponents = [(row // k ** i) % k for i in range(SIZE)]
+        new_line, _, _, _ = trace_line([1 << e if e else 0 for e in exponents])
+        if max(new_line) >= 1 << k:
+            wins[row] = True
+            continue
+        new_rows[row] = sum((val.bit_length() - 1 if val else 0) * k ** i for i, val in enumerate(new_line))
+    return new_rows, wins
+
+
+class _Evaluator:
+    """Evaluates chunks of boards against the values already in the scratch table."""
+
+    def __init__(self, k, values):
+        self.k = k
+        self.values = values
+        self.powers = k ** np.arange(CELLS, dtype=np.int64)
+        self.new_rows, self.wins = _row_tables(k)
+        self.permutations = batch_sim.direction_permutations(SIZE)
+
+    def evaluate(self, states):
+        """Returns: (probability, best direction) arrays for an array of board indices."""
+        k, powers = self.k, self.powers
+        digits = (states[:, None] // powers) % k
+        best = np.full(len(states), -1.0)
+        best_move = np.zeros(len(states), dtype=np.uint8)
+        for direction in (UP, DOWN, LEFT, RIGHT):
+            perm = self.permutations[direction]
+            oriented = digits[:, perm].reshape(-1, SIZE, SIZE)
+            rows = oriented[:, :, 0] + oriented[:, :, 1] * k + oriented[:, :, 2] * k * k
+            win = self.wins[rows].any(axis=1)
+            new_rows = self.new_rows[rows]
+            new_oriented = np.stack([(new_rows // k ** i) % k for i in range(SIZE)], axis=2).reshape(-1, CELLS)
+            new_digits = np.empty_like(digits)
+            new_digits[:, perm] = new_oriented
+            new_states = new_digits @ powers
+            moved = ~win & (new_states != states)
+
+            value = np.where(win, 1.0, -1.0)
+            if moved.any():
+                after = new_states[moved]
+                empty = new_digits[moved] == 0
+                two = np.where(empty, after[:, None] + powers, 0)
+                four = np.where(empty, after[:, None] + 2 * powers, 0)
+                spawned = SPAWN_TWO * self.values[two] + (1 - SPAWN_TWO) * self.values[four]
+                value[moved] = np.where(empty, spawned, 0.0).sum(axis=1) / empty.sum(axis=1)
+            better = value > best
+            best[better] = value[better]
+            best_move[better] = direction
+        # Boards without a legal move are lost.
+        return np.maximum(best, 0.0).astype(np.float32), best_move
+
+
+_worker_evaluator = None
+
+
+def _init_worker(k, scratch_path, count):
+    global _worker_evaluator
+    _worker_evaluator = _Evaluator(k, np.memmap(scratch_path, dtype=np.float32, mode="r", shape=(count,)))
+
+
+def _evaluate_chunk(states):
+    return _worker_evaluator.evaluate(states)
+
+
+def _layers(k):
+    """
+    Yields: the board indices of each tile sum, largest sum first. Every
+    layer is assembled from the rows grouped by their own tile sum, so only
+    one layer's indices are in memory at a time.
+    """
+    row_count = k ** SIZE
+    row_sums = np.zeros(row_count, dtype=np.int64)
+    for row in range(row_count):
+        row_sums[row] = sum(1 << e for e in ((row // k ** i) % k for i in range(SIZE)) if e)
+    groups = {int(row_sum): np.flatnonzero(row_sums == row_sum) for row_sum in np.unique(row_sums)}
+    # The (r0, r1, r2) row-sum combinations of every board sum.
+    combinations = {}
+    for s0 in groups:
+        for s1 in groups:
+            for s2 in groups:
+                combinations.setdefault(s0 + s1 + s2, []).append((s0, s1, s2))
+    for total in sorted(combinations, reverse=True):
+        # Index = r0 + r1 * k**3 + r2 * k**6.
+        yield np.concatenate([(groups[s0][None, None, :] + groups[s1][None, :, None] * row_count
+                               + groups[s2][:, None, None] * row_count * row_count).ravel()
+                              for s0, s1, s2 in combinations[total]])
+
+
+def build(path=TABLEBASE_FILE, target=TARGET, workers=None, progress=True):
+    """Build the tablebase for target into path. Returns: the number of entries."""
+    k = _exponent(target)
+    count = k ** CELLS
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    start = time.perf_counter()
+    scratch_path = path + ".work"
+    values = np.memmap(scratch_path, dtype=np.float32, mode="w+", shape=(count,))
+    moves = np.zeros(count, dtype=np.uint8)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (k, scratch_path, count))
+    else:
+        evaluator = _Evaluator(k, values)
+    done = 0
+    try:
+        for n, layer in enumerate(_layers(k)):
+            chunks = [layer[i:i + CHUNK_STATES] for i in range(0, len(layer), CHUNK_STATES)]
+            if pool is not None:
+                values.flush()
+                results = pool.map(_evaluate_chunk, chunks)
+            else:
+                results = [evaluator.evaluate(chunk) for chunk in chunks]
+            for chunk, (chunk_values, chunk_moves) in zip(chunks, results):
+                values[chunk] = chunk_values
+                moves[chunk] = chunk_moves
+            done += len(layer)
+            if progress and n % 16 == 0:
+                print(f"\r{done / count:6.1%} of {count} boards, {time.perf_counter() - start:.0f}s", end="",
+                      flush=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, SIZE, k, count).ljust(HEADER_SIZE, b"\0"))
+        # Converted a chunk at a time, like the layers, to keep memory flat.
+        for i in range(0, count, CHUNK_STATES):
+            chunk = np.round(np.clip(values[i:i + CHUNK_STATES], 0.0, 1.0) * PROBABILITY_SCALE).astype("<u2")
+            f.write(((chunk << 2) | moves[i:i + CHUNK_STATES]).astype("<u2").tobytes())
+    os.replace(tmp_path, path)
+    del values
+    os.remove(scratch_path)
+    if progress:
+        print(f"\rwrote {count} boards to {path} in {time.perf_counter() - start:.0f}s")
+    return count
+
+
+class Tablebase:
+    """
+    Lookups into a built table. The file is only opened and mapped on the
+    first lookup; pages are read in by the OS as they are touched.
+    """
+
+    def __init__(self, path=TABLEBASE_FILE):
+        self.path = path
+        self.k = None
+        self._map = None
+        self._entries = None
+
+    def available(self):
+        return self._entries is not None or os.path.exists(self.path)
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, k, count = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or size != SIZE or len(self._map) != HEADER_SIZE + 2 * count:
+            raise ValueError(f"{self.path} is not a {SIZE}x{SIZE} tablebase")
+        self.k = k
+        self.target = 1 << k
+        self._entries = memoryview(self._map)[HEADER_SIZE:].cast("H")
+
+    def lookup(self, board):
+        """
+        Returns: (probability of reaching the target, best direction) for a
+        3x3 board, or None if it is not in the table (other sizes, or a tile
+        already at the target).
+        """
+        if self._entries is None:
+            self._open()
+        if len(board) != SIZE:
+            return None
+        k = self.k
+        index = 0
+        power = 1
+        for row in board:
+            for val in row:
+                if val:
+                    e = val.bit_length() - 1
+                    if e >= k:
+                        return None
+                    index += e * power
+                power *= k
+        entry = self._entries[index]
+        return (entry >> 2) / PROBABILITY_SCALE, entry & 3
+
+    def best_move(self, board):
+        """Returns: the perfect-play direction, or None without a legal move (any legal move off the table)."""
+        legal = legal_moves(board)
+        if not legal:
+            return None
+        entry = self.lookup(board)
+        if entry is None or entry[1] not in legal:
+            return legal[0]
+        return entry[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the 3x3 endgame tablebase.")
+    parser.add_argument("--target", type=int, default=TARGET, help="tile to reach (power of two)")
+    parser.add_argument("--output", default=TABLEBASE_FILE)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args()
+    build(args.output, args.target, args.workers)
+
+
+if __name__ == "__main__":
+    main()
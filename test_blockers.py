@@ -0,0 +1,40 @@
+import random
+
+from game_core import BLOCKER, remove_random_tile, shuffle_board, swap_tiles
+
+
+def _board():
+    return [[BLOCKER, 2, 4],
+            [8, 0, BLOCKER],
+            [16, 32, 0]]
+
+
+def _blockers(board):
+    return [(r, c) for r, row in enumerate(board) for c, val in enumerate(row) if val == BLOCKER]
+
+
+def test_shuffle_keeps_blockers_in_place():
+    board = _board()
+    for seed in range(50):
+        new_board = shuffle_board(board, random.Random(seed))
+        assert _blockers(new_board) == _blockers(board)
+        assert sorted(v for row in new_board for v in row) == sorted(v for row in board for v in row)
+
+
+def test_remove_never_takes_a_blocker():
+    for seed in range(50):
+        board = _board()
+        rng = random.Random(seed)
+        for _ in range(10):
+            remove_random_tile(board, rng)
+        assert _blockers(board) == _blockers(_board())
+        assert all(val in (0, BLOCKER) for row in board for val in row)
+
+
+def test_swap_refuses_blockers():
+    board = _board()
+    assert not swap_tiles(board, (0, 0), (0, 1))
+    assert not swap_tiles(board, (2, 2), (1, 2))
+    assert board == _board()
+    assert swap_tiles(board, (0, 1), (2, 1))
+    assert board[0][1] == 32 and board[2][1] == 2
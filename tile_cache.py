@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+import pygame
+
+# --- Pre-rendered tile sprites ---
+#
+# Every tile drawn on screen is a rounded rect in the tile colour with its
+# NUM_TO_TEXT glyph centred on top. Rendering that from scratch allocates a
+# surface and calls font.render, so tiles are rendered once per
+# (value, size, alpha bucket, rounded) and reused. The full-size tiles are
+# pre-rendered and never evicted; the in-between sizes produced by the
+# new-tile and merge pop animations live in a bounded LRU.
+
+ALPHA_BUCKETS = 16
+DEFAULT_MAX_ENTRIES = 256
+
+
+def alpha_bucket(alpha):
+    """Quantise 0-255 alpha to one of ALPHA_BUCKETS steps (the last one is fully opaque)."""
+    alpha = max(0, min(255, int(alpha)))
+    return round(alpha * (ALPHA_BUCKETS - 1) / 255)
+
+
+class TileCache:
+    def __init__(self, font, labels, colors, text_color, default_color, radius,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.font = font
+        self.labels = labels
+        self.colors = colors
+        self.text_color = text_color
+        self.default_color = default_color
+        self.radius = radius
+        self.max_entries = max_entries
+        self.pinned = {}
+        self.lru = OrderedDict()
+        self.glyphs = {}
+
+    def prerender(self, sizes, rounded=True):
+        """Render every labelled value at the given sizes into the pinned set."""
+        for size in sizes:
+            for value in self.labels:
+                key = (value, size, ALPHA_BUCKETS - 1, rounded)
+                self.pinned[key] = self._render(value, size, rounded)
+
+    def get(self, value, size, alpha=255, rounded=True):
+        bucket = alpha_bucket(alpha)
+        key = (value, size, bucket, rounded)
+        surface = self.pinned.get(key)
+        if surface is not None:
+            return surface
+        surface = self.lru.get(key)
+        if surface is not None:
+            self.lru.move_to_end(key)
+            return surface
+
+        if bucket == ALPHA_BUCKETS - 1:
+            surface = self._render(value, size, rounded)
+        else:
+            surface = self.get(value, size, 255, rounded).copy()
+            surface.set_alpha(bucket * 255 // (ALPHA_BUCKETS - 1))
+        self.lru[key] = surface
+        if len(self.lru) > self.max_entries:
+            self.lru.popitem(last=False)
+        return surface
+
+    def _glyph(self, value):
+        glyph = self.glyphs.get(value)
+        if glyph is None:
+            text_str = self.labels.get(value, f"{value}")
+            glyph = self.font.render(text_str, True, self.text_color)
+            self.glyphs[value] = glyph
+        return glyph
+
+    def _render(self, value, size, rounded):
+        surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        color = self.colors.get(self.labels.get(value, ""), self.default_color)
+        if rounded:
+            pygame.draw.rect(surface, color, (0, 0, size, size), border_radius=self.radius)
+        else:
+            surface.fill(color)
+        text = self._glyph(value)
+        surface.blit(text, text.get_rect(center=(size // 2, size // 2)))
+        return surface
@@ -0,0 +1,441 @@
+import bitboard
+from game_core import BLOCKER, TILE_LABELS, UP, DOWN, LEFT, apply_move, legal_moves
+
+# --- Rule variants ---
+#
+# A variant is a declarative spec (a dict, see DEFAULT_SPEC) compiled once
+# into the same kind of tables the base game runs on, so every variant moves
+# at the base game's speed:
+#
+#   merge            "pair"       two equal tiles merge into their double (2048)
+#                    "fibonacci"  1+1, and neighbours on the Fibonacci ladder
+#                                 (1+2, 2+3, 3+5, ...) merge into their sum
+#                    "triple"     three equal tiles merge into their triple
+#   spawns           {tile value: weight}: what add_new_tile places
+#   spawns_per_move  tiles spawned after every move
+#   start_tiles      tiles spawned at the start
+#   blockers         immovable blocker cells placed at the start; tiles
+#                    slide up to them and never merge across them
+#   win              tile value that wins the game
+#   labels           "classic" (the NUM_TO_TEXT glyphs) or "numbers"
+#   colors           {label: (r, g, b)} overriding the front end's palette
+#
+# Tiles are numbered by rank on the variant's value ladder (rank 1 is the
+# smallest tile), and boards hold 1 << rank for a tile of that rank. For the
+# classic game that is simply the tile value; for the others it keeps every
+# board a board of powers of two, so history, journal and save packing (log2
+# exponents) store any variant unchanged. value() gives the face value;
+# scores are face values. A blocker is BLOCKER (rank 31).
+#
+# Compiled tables: for 4x4 boards whose tiles all fit a nibble, 65536-row
+# move/score tables over packed ranks exactly like bitboard.py (nibble 15 is
+# the blocker in variants with blockers); for other boards, lazily filled
+# per-size line tables like engine.py. Spawns draw a cell with rng.choice
+# and the tile with one rng.random() against the cumulative weights, so the
+# classic variant spawns exactly as add_new_tile does.
+#
+# The AI, the tablebase, server.py and env.py play the classic rules only.
+
+DEFAULT_VARIANT = "classic"
+DEFAULT_SPEC = {
+    "merge": "pair",
+    "spawns": {2: 0.9, 4: 0.1},
+    "spawns_per_move": 1,
+    "start_tiles": 2,
+    "blockers": 0,
+    "win": 2048,
+    "labels": "classic",
+    "colors": {},
+}
+
+VARIANTS = {
+    "classic": {},
+    "fibonacci": {"merge": "fibonacci", "spawns": {1: 0.9, 2: 0.1}, "win": 610, "labels": "numbers"},
+    "triple": {"merge": "triple", "spawns": {1: 0.9, 3: 0.1}, "win": 729, "labels": "numbers"},
+    "blockers": {"blockers": 2},
+    "downpour": {"spawns": {2: 0.6, 4: 0.3, 8: 0.1}, "spawns_per_move": 2, "win": 1024},
+}
+
+MERGE_RULES = ("pair", "fibonacci", "triple")
+BLOCKER_RANK = BLOCKER.bit_length() - 1
+BLOCKER_LABEL = "石"
+BLOCKER_COLOR = (119, 110, 101)
+# Packed ranks are nibbles; with blockers, nibble 15 is the blocker.
+PACKED_BLOCKER = 15
+LINE_TABLE_LIMIT = 1 << 16
+
+
+def ladder(merge, count):
+    """Returns: the face values of ranks 0..count-1 (rank 0 is the empty cell)."""
+    values = [0]
+    for rank in range(1, count):
+        if merge == "fibonacci":
+            values.append(1 if rank == 1 else 2 if rank == 2 else values[-1] + values[-2])
+        elif merge == "triple":
+            values.append(3 ** (rank - 1))
+        else:
+            values.append(1 << rank)
+    return values
+
+
+class Rules:
+    def __init__(self, name, spec):
+        unknown = set(spec) - set(DEFAULT_SPEC)
+        if unknown:
+            raise ValueError(f"unknown rule keys: {', '.join(sorted(unknown))}")
+        spec = dict(DEFAULT_SPEC, **spec)
+        if spec["merge"] not in MERGE_RULES:
+            raise ValueError(f"merge must be one of {', '.join(MERGE_RULES)}")
+        self.name = name
+        self.spec = spec
+        self.merge = spec["merge"]
+        self.values = ladder(self.merge, BLOCKER_RANK)
+        rank_of = {value: rank for rank, value in enumerate(self.values) if rank}
+        if spec["win"] not in rank_of:
+            raise ValueError(f"win {spec['win']} is not a tile of the {self.merge} ladder")
+        total = sum(spec["spawns"].values())
+        self.spawn_ranks = []
+        self.spawn_cumulative = []
+        acc = 0.0
+        for value, weight in spec["spawns"].items():
+            if value not in rank_of:
+                raise ValueError(f"spawn {value} is not a tile of the {self.merge} ladder")
+            acc += weight / total
+            self.spawn_ranks.append(rank_of[value])
+            self.spawn_cumulative.append(acc)
+        self.spawn_cumulative[-1] = 1.0
+        self.spawns_per_move = spec["spawns_per_move"]
+        self.start_tiles = spec["start_tiles"]
+        self.blockers = spec["blockers"]
+        self.win_code = 1 << rank_of[spec["win"]]
+        # Largest packed rank a tile may reach; boards fit the tables while
+        # every tile is below it, so no merge can leave the nibble.
+        self.packed_limit = PACKED_BLOCKER - 1 if self.blockers else PACKED_BLOCKER
+        # Pair merges without blockers move exactly like the classic game
+        # (codes are the tile values), so those boards use its engines.
+        self.classic_moves = self.merge == "pair" and not self.blockers
+        self.labels, self.colors = self._labels(spec)
+        self._row_tables = None
+        self._line_tables = {}
+        self._can_move_tables = {}
+
+    def _labels(self, spec):
+        if spec["labels"] == "classic":
+            labels = dict(TILE_LABELS)
+        elif spec["labels"] == "numbers":
+            labels = {1 << rank: str(value) for rank, value in enumerate(self.values) if rank}
+        else:
+            raise ValueError("labels must be 'classic' or 'numbers'")
+        colors = dict(spec["colors"])
+        if self.blockers:
+            labels[BLOCKER] = BLOCKER_LABEL
+            colors.setdefault(BLOCKER_LABEL, BLOCKER_COLOR)
+        return labels, colors
+
+    def __repr__(self):
+        return f"Rules({self.name!r})"
+
+    def value(self, code):
+        """Returns: the face value of a board cell (0 for empty cells and blockers)."""
+        if not code or code == BLOCKER:
+            return 0
+        return self.values[code.bit_length() - 1]
+
+    def label(self, code):
+        return self.labels.get(code, str(self.value(code)))
+
+    # --- Lines ---
+
+    def _merge(self, ranks, i, limit):
+        """Returns: (merged rank, tiles consumed) for the tiles starting at ranks[i], or (0, 1)."""
+        a = ranks[i]
+        if self.merge == "triple":
+            if i + 2 < len(ranks) and a == ranks[i + 1] == ranks[i + 2] and a + 1 <= limit:
+                return a + 1, 3
+            return 0, 1
+        if i + 1 >= len(ranks):
+            return 0, 1
+        b = ranks[i + 1]
+        if self.merge == "pair":
+            merged = a + 1 if a == b else 0
+        else:
+            merged = max(a, b) + 1 if (a == b == 1 or abs(a - b) == 1) else 0
+        if merged and merged <= limit:
+            return merged, 2
+        return 0, 1
+
+    def trace_ranks(self, line, blocker=BLOCKER_RANK, limit=BLOCKER_RANK - 1):
+        """
+        bitboard.trace_line on ranks: slide and merge towards index 0, with
+        blocker cells splitting the line into independent segments.
+        Returns: new ranks, score, merges as (dest, rank) and slides as (from, dest, rank).
+        """
+        new_line = [0] * len(line)
+        score = 0
+        merges = []
+        slides = []
+        start = 0
+        while start <= len(line):
+            end = start
+            while end < len(line) and line[end] != blocker:
+                end += 1
+            tiles = [(rank, idx) for idx, rank in enumerate(line[start:end], start) if rank]
+            ranks = [rank for rank, _ in tiles]
+            dest = start
+            i = 0
+            while i < len(tiles):
+                merged, used = self._merge(ranks, i, limit)
+                if merged:
+                    new_line[dest] = merged
+                    score += self.values[merged]
+                    merges.append((dest, merged))
+                else:
+                    new_line[dest] = ranks[i]
+                for rank, idx in tiles[i:i + used]:
+                    if idx != dest:
+                        slides.append((idx, dest, rank))
+                i += used
+                dest += 1
+            if end < len(line):
+                new_line[end] = blocker
+            start = end + 1
+        return new_line, score, merges, slides
+
+    # --- Packed 4x4 tables ---
+
+    def _tables(self):
+        if self._row_tables is None and self.classic_moves:
+            # Same rules as bitboard.py's tables: share them instead of rebuilding.
+            self._row_tables = (bitboard.ROW_LEFT, bitboard.ROW_RIGHT, bitboard.ROW_SCORE,
+                                bitboard.ROW_SCORE_RIGHT, bitboard.ROW_CAN)
+        if self._row_tables is None:
+            blocker = PACKED_BLOCKER if self.blockers else None
+            row_left = [0] * 65536
+            row_score = [0] * 65536
+            for row in range(65536):
+                ranks = [(row >> (4 * i)) & 0xF for i in range(4)]
+                new_ranks, score, _, _ = self.trace_ranks(ranks, blocker, PACKED_BLOCKER - bool(self.blockers))
+                row_left[row] = new_ranks[0] | new_ranks[1] << 4 | new_ranks[2] << 8 | new_ranks[3] << 12
+                row_score[row] = score
+            reverse = bitboard._reverse_row
+            row_right = [reverse(row_left[reverse(row)]) for row in range(65536)]
+            row_score_right = [row_score[reverse(row)] for row in range(65536)]
+            row_can = bytes((row_left[row] != row) | ((row_right[row] != row) << 1) for row in range(65536))
+            self._row_tables = (row_left, row_right, row_score, row_score_right, row_can)
+        return self._row_tables
+
+    def fits(self, board):
+        """True if the board is 4x4 and can move through the packed tables without leaving a nibble."""
+        if len(board) != bitboard.GRID_SIZE:
+            return False
+        limit = 1 << self.packed_limit
+        for row in board:
+            for val in row:
+                if val >= limit and not (val == BLOCKER and self.blockers):
+                    return False
+        return True
+
+    def pack(self, board):
+        b = 0
+        shift = 0
+        for row in board:
+            for val in row:
+                if val:
+                    b |= (PACKED_BLOCKER if val == BLOCKER else val.bit_length() - 1) << shift
+                shift += 4
+        return b
+
+    def unpack(self, b):
+        blocker = PACKED_BLOCKER if self.blockers else None
+        board = []
+        for r in range(4):
+            row = []
+            for c in range(4):
+                e = (b >> (16 * r + 4 * c)) & 0xF
+                row.append(BLOCKER if e == blocker else 1 << e if e else 0)
+            board.append(row)
+        return board
+
+    def move(self, b, direction):
+        """bitboard.move with this variant's tables. Returns: new packed board and the score gained."""
+        row_left, row_right, row_score, row_score_right, _ = self._tables()
+        vertical = direction in (UP, DOWN)
+        if vertical:
+            b = bitboard.transpose(b)
+        table, scores = (row_left, row_score) if direction in (UP, LEFT) else (row_right, row_score_right)
+        r0, r1, r2, r3 = b & 0xFFFF, (b >> 16) & 0xFFFF, (b >> 32) & 0xFFFF, b >> 48
+        new_b = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+        score = scores[r0] + scores[r1] + scores[r2] + scores[r3]
+        return (bitboard.transpose(new_b) if vertical else new_b), score
+
+    def legal_mask(self, b):
+        can = self._tables()[4]
+        horizontal = can[b & 0xFFFF] | can[(b >> 16) & 0xFFFF] | can[(b >> 32) & 0xFFFF] | can[b >> 48]
+        t = bitboard.transpose(b)
+        vertical = can[t & 0xFFFF] | can[(t >> 16) & 0xFFFF] | can[(t >> 32) & 0xFFFF] | can[t >> 48]
+        return vertical | (horizontal << 2)
+
+    def legal_moves_packed(self, b):
+        return bitboard.MASK_MOVES[self.legal_mask(b)]
+
+    def spawn_packed(self, b, rng):
+        """spawn() on a packed board. Returns: the new packed board."""
+        for _ in range(self.spawns_per_move):
+            empty = [shift for shift in range(0, 64, 4) if not (b >> shift) & 0xF]
+            if not empty:
+                break
+            shift = rng.choice(empty)
+            b |= self._spawn_rank(rng) << shift
+        return b
+
+    # --- List boards ---
+
+    def _table_move(self, board, direction):
+        size = len(board)
+        table = self._line_tables.get(size)
+        if table is None:
+            table = self._line_tables[size] = {}
+        new_board = [[0] * size for _ in range(size)]
+        score = 0
+        for cells in bitboard.line_cells(size, direction):
+            line = tuple([board[r][c] for r, c in cells])
+            entry = table.get(line)
+            if entry is None:
+                if len(table) >= LINE_TABLE_LIMIT:
+                    table.clear()
+                ranks = [val.bit_length() - 1 if val else 0 for val in line]
+                new_ranks, line_score, _, _ = self.trace_ranks(ranks)
+                entry = table[line] = ([1 << rank if rank else 0 for rank in new_ranks], line_score)
+            new_line, line_score = entry
+            score += line_score
+            for (r, c), val in zip(cells, new_line):
+                new_board[r][c] = val
+        return new_board, score
+
+    def move_board(self, board, direction):
+        """engine.move_board for this variant. Returns: the new board and the score gained."""
+        if self.fits(board):
+            new_b, score = self.move(self.pack(board), direction)
+            return self.unpack(new_b), score
+        return self._table_move(board, direction)
+
+    def slide_board(self, board, direction):
+        """bitboard.slide_board for this variant: the move plus its merge and slide records."""
+        size = len(board)
+        new_board = [[0] * size for _ in range(size)]
+        score = 0
+        merges = []
+        slides = []
+        for cells in bitboard.line_cells(size, direction):
+            ranks = [board[r][c].bit_length() - 1 if board[r][c] else 0 for r, c in cells]
+            new_ranks, line_score, line_merges, line_slides = self.trace_ranks(ranks)
+            score += line_score
+            for (r, c), rank in zip(cells, new_ranks):
+                new_board[r][c] = 1 << rank if rank else 0
+            for dest, rank in line_merges:
+                merges.append((cells[dest], 1 << rank))
+            for src, dest, rank in line_slides:
+                slides.append((cells[src], cells[dest], 1 << rank))
+        return new_board, score, merges, slides
+
+    def apply_move(self, board, direction, animate=True):
+        """game_core.apply_move under this variant's rules (same arguments and results)."""
+        if self.classic_moves:
+            return apply_move(board, direction, animate)
+        if not animate:
+            new_board, score = self.move_board(board, direction)
+            if new_board == board:
+                return False, 0, [], []
+            board[:] = new_board
+            return True, score, [], []
+        new_board, score, merges, slides = self.slide_board(board, direction)
+        if new_board == board:
+            return False, 0, [], []
+        board[:] = new_board
+        return True, score, merges, slides
+
+    def _line_can_move(self, line):
+        """Returns: bit 0 if the line can move towards index 0, bit 1 if away from it."""
+        ranks = [val.bit_length() - 1 if val else 0 for val in line]
+        reverse = ranks[::-1]
+        return (self.trace_ranks(ranks)[0] != ranks) | (self.trace_ranks(reverse)[0] != reverse) << 1
+
+    def _axis_flags(self, lines, table):
+        flags = 0
+        for line in lines:
+            line = tuple(line)
+            entry = table.get(line)
+            if entry is None:
+                if len(table) >= LINE_TABLE_LIMIT:
+                    table.clear()
+                entry = table[line] = self._line_can_move(line)
+            flags |= entry
+            if flags == 3:
+                break
+        return flags
+
+    def legal_moves(self, board):
+        """
+        game_core.legal_moves for this variant: from the packed tables, or
+        from per-line can-move tables filled lazily like engine.legal_mask's.
+        """
+        if self.classic_moves:
+            return legal_moves(board)
+        if self.fits(board):
+            return self.legal_moves_packed(self.pack(board))
+        table = self._can_move_tables.get(len(board))
+        if table is None:
+            table = self._can_move_tables[len(board)] = {}
+        horizontal = self._axis_flags(board, table)
+        vertical = self._axis_flags(zip(*board), table)
+        return bitboard.MASK_MOVES[vertical | (horizontal << 2)]
+
+    def _spawn_rank(self, rng):
+        u = rng.random()
+        for rank, bound in zip(self.spawn_ranks, self.spawn_cumulative):
+            if u < bound:
+                return rank
+        return self.spawn_ranks[-1]
+
+    def spawn(self, board, rng, count=None):
+        """
+        add_new_tile for this variant: spawns_per_move (or count) tiles, each
+        on a uniformly chosen empty cell.
+        Returns: the new tiles as [(row, col, code)].
+        """
+        size = len(board)
+        new_tiles = []
+        for _ in range(self.spawns_per_move if count is None else count):
+            empty_cells = [(r, c) for r in range(size) for c in range(size) if board[r][c] == 0]
+            if not empty_cells:
+                break
+            r, c = rng.choice(empty_cells)
+            code = 1 << self._spawn_rank(rng)
+            board[r][c] = code
+            new_tiles.append((r, c, code))
+        return new_tiles
+
+    def new_board(self, size, rng):
+        """Returns: a fresh board with its blockers and starting tiles, and the tiles as (row, col, code)."""
+        board = [[0] * size for _ in range(size)]
+        for _ in range(self.blockers):
+            empty_cells = [(r, c) for r in range(size) for c in range(size) if board[r][c] == 0]
+            r, c = rng.choice(empty_cells)
+            board[r][c] = BLOCKER
+        return board, self.spawn(board, rng, self.start_tiles)
+
+    def has_won(self, tile_counts):
+        return any(self.win_code <= code < BLOCKER for code in tile_counts)
+
+
+_compiled = {}
+
+
+def get_rules(name=DEFAULT_VARIANT):
+    """Returns: the compiled Rules of a named variant, compiled on first use."""
+    rules = _compiled.get(name)
+    if rules is None:
+        if name not in VARIANTS:
+            raise ValueError(f"unknown variant {name!r}; choose from {', '.join(VARIANTS)}")
+        rules = _compiled[name] = Rules(name, VARIANTS[name])
+    return rules